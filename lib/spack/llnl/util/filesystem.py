@@ -23,7 +23,8 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 __all__ = ['install', 'expand_user', 'working_dir', 'touch', 'mkdirp',
-           'join_path', 'ancestor', 'can_access', 'filter_file', 'change_sed_delimiter']
+           'join_path', 'ancestor', 'can_access', 'filter_file', 'change_sed_delimiter',
+           'file_stat']
 
 import os
 import sys
@@ -187,3 +188,9 @@ def ancestor(dir, n=1):
 def can_access(file_name):
     """True if we have read/write access to the file."""
     return os.access(file_name, os.R_OK|os.W_OK)
+
+
+def file_stat(path):
+    """mtime and size of a file, which identify its version."""
+    st = os.stat(path)
+    return [st.st_mtime, st.st_size]
@@ -111,26 +111,20 @@ def caller_locals():
        scope.  Yes, this is some black magic, and yes it's useful
        for implementing things like depends_on and provides.
     """
-    stack = inspect.stack()
-    try:
-        return stack[2][0].f_locals
-    finally:
-        del stack
+    # inspect.stack() would be simpler, but it looks up the source
+    # file of every frame on the stack, which is slow.
+    return sys._getframe(2).f_locals
 
 
 def get_calling_package_name():
     """Make sure that the caller is a class definition, and return the
        module's name.
     """
-    stack = inspect.stack()
-    try:
-        # get calling function name (the relation)
-        relation = stack[1][3]
+    # get calling function name (the relation)
+    relation = sys._getframe(1).f_code.co_name
 
-        # Make sure locals contain __module__
-        caller_locals = stack[2][0].f_locals
-    finally:
-        del stack
+    # Make sure locals contain __module__
+    caller_locals = sys._getframe(2).f_locals
 
     if not '__module__' in caller_locals:
         raise ScopeError(relation)
@@ -164,15 +158,138 @@ def has_method(cls, name):
     return False
 
 
-def memoized(obj):
+class LRUCache(object):
+    """A dict-like cache that holds at most maxsize items.  When it is
+       full, adding an item evicts the least recently used one.  A
+       maxsize of None means there is no limit.
+
+       The cache counts hits and misses for get() and [], and counts
+       evictions.  ``in`` does not count or mark the item as used.
+    """
+    # Indices into the links of the list of items, most recent first.
+    _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=None):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("LRUCache maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+
+    def _touch(self, link):
+        """Move a link to the front of the list."""
+        prev, next = link[self._PREV], link[self._NEXT]
+        prev[self._NEXT] = next
+        next[self._PREV] = prev
+
+        root = self._root
+        first = root[self._NEXT]
+        link[self._PREV] = root
+        link[self._NEXT] = first
+        first[self._PREV] = link
+        root[self._NEXT] = link
+
+
+    def _unlink(self, link):
+        prev, next = link[self._PREV], link[self._NEXT]
+        prev[self._NEXT] = next
+        next[self._PREV] = prev
+        del self._links[link[self._KEY]]
+
+
+    def __getitem__(self, key):
+        link = self._links.get(key)
+        if link is None:
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        self._touch(link)
+        return link[self._VALUE]
+
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            link[self._VALUE] = value
+            self._touch(link)
+            return
+
+        root = self._root
+        first = root[self._NEXT]
+        link = [root, first, key, value]
+        first[self._PREV] = link
+        root[self._NEXT] = link
+        self._links[key] = link
+
+        if self.maxsize is not None and len(self._links) > self.maxsize:
+            self._unlink(root[self._PREV])
+            self.evictions += 1
+
+
+    def __delitem__(self, key):
+        self._unlink(self._links[key])
+
+
+    def __contains__(self, key):
+        return key in self._links
+
+
+    def __len__(self):
+        return len(self._links)
+
+
+    def __iter__(self):
+        """Iterate over keys, most recently used first."""
+        link = self._root[self._NEXT]
+        while link is not self._root:
+            next = link[self._NEXT]
+            yield link[self._KEY]
+            link = next
+
+
+    def clear(self):
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+
+# Separates positional from keyword arguments in memoized() keys.
+_kwargs_mark = object()
+
+
+def memoized(obj=None, maxsize=None):
     """Decorator that caches the results of a function, storing them
-       in an attribute of that function."""
-    cache = obj.cache = {}
+       in an attribute of that function.  The cache is an LRUCache
+       keyed on the function's arguments, including keyword arguments.
+       Use ``@memoized`` for an unbounded cache, or
+       ``@memoized(maxsize=n)`` to keep only the n most recent results.
+    """
+    if obj is None:
+        return lambda obj: memoized(obj, maxsize)
+
+    cache = obj.cache = LRUCache(maxsize)
     @functools.wraps(obj)
     def memoizer(*args, **kwargs):
-        if args not in cache:
-            cache[args] = obj(*args, **kwargs)
-        return cache[args]
+        key = args
+        if kwargs:
+            key = args + (_kwargs_mark,) + tuple(sorted(kwargs.items()))
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = obj(*args, **kwargs)
+            return value
     return memoizer
 
 
@@ -207,6 +324,9 @@ def key_ordering(cls):
        If a class already has __eq__, __ne__, __lt__, __le__, __gt__, or __ge__
        defined, this decorator will overwrite them.  If the class does not
        have a _cmp_key method, then this will raise a TypeError.
+
+       If the class defines its own __hash__ (e.g. to cache the hash of
+       an expensive key), that one is kept.
     """
     def setter(name, value):
         value.__name__ = name
@@ -223,7 +343,8 @@ def key_ordering(cls):
     setter('__gt__', lambda s,o: o is None or s._cmp_key() >  o._cmp_key())
     setter('__ge__', lambda s,o: o is None or s._cmp_key() >= o._cmp_key())
 
-    setter('__hash__', lambda self: hash(self._cmp_key()))
+    if not '__hash__' in cls.__dict__:
+        setter('__hash__', lambda self: hash(self._cmp_key()))
 
     return cls
 
@@ -0,0 +1,271 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Shared and exclusive locks on files, for processes that share a
+directory tree.
+
+A Lock covers a byte range of a lock file, so one file can hold many
+independent locks, e.g. one per install prefix.  Locks are taken with
+POSIX ``fcntl`` byte-range locks.  Some network filesystems don't
+support those, and there Lock falls back to creating a separate lock
+file with ``O_EXCL``.  In that mode all locks are exclusive.
+
+Read locks open the lock file read-only, and write locks create it.
+If a reader can't open the lock file, because it doesn't exist yet or
+the reader can't write to the directory for a fallback lock, it reads
+without a lock.  So users who can only read a shared tree can still
+query it.
+
+The operating system releases ``fcntl`` locks when a process exits, so
+a crashed process can't leave one behind.  Fallback lock files record
+the host and pid that made them.  A lock file left by a dead process on
+the same host is removed.
+
+Locks are reentrant within a process: nested read and write
+acquisitions are counted, and a read lock is upgraded to a write lock
+while a write is held.  They are not meant to be shared by threads.
+"""
+import os
+import time
+import errno
+import fcntl
+import socket
+
+# Seconds between attempts to take a held lock.
+poll_interval = 0.1
+
+# errnos that mean the filesystem doesn't support fcntl locks.
+_unsupported = (errno.ENOLCK, errno.EOPNOTSUPP, errno.EINVAL)
+
+# errnos that mean a reader can't open or create a lock file.
+_no_access = (errno.ENOENT, errno.EACCES, errno.EPERM, errno.EROFS)
+
+# Lock files opened by this process.  They are never closed, because
+# closing any descriptor for a file drops all of the process's fcntl
+# locks on it, including ones taken by other Lock objects.
+_lock_files = {}
+
+
+def _lock_file(path, write):
+    """An open file object for the lock file at path, shared by every
+       Lock on that file in this process.  For writing, the file and its
+       directory are created if needed.  For reading, the file is opened
+       read-only unless it is already open for writing."""
+    path = os.path.abspath(path)
+    if (path, True) in _lock_files:
+        return _lock_files[(path, True)]
+
+    if write:
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0666)
+        _lock_files[(path, True)] = os.fdopen(fd, 'r+')
+    elif not (path, False) in _lock_files:
+        fd = os.open(path, os.O_RDONLY)
+        _lock_files[(path, False)] = os.fdopen(fd, 'r')
+    return _lock_files[(path, write)]
+
+
+class Lock(object):
+    """A read/write lock on a byte range of a file.  The default range,
+       length 0 at offset 0, is the whole file.
+    """
+    def __init__(self, path, start=0, length=0):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.use_fcntl = True
+
+        self._reads = 0
+        self._writes = 0
+
+        # False while reading without a lock.
+        self._held = False
+
+
+    def _fallback_path(self):
+        return "%s.%d-%d.lck" % (self.path, self.start, self.length)
+
+
+    def _take(self, op, timeout):
+        """Take an fcntl lock with op, or a fallback lock file, waiting
+           up to timeout seconds.  None means wait forever.  Returns False
+           if a shared lock was asked for but the lock file can't be
+           opened, so the caller should read without one."""
+        write = (op == fcntl.LOCK_EX)
+        start_time = time.time()
+        while True:
+            try:
+                if self.use_fcntl:
+                    try:
+                        fcntl.lockf(_lock_file(self.path, write),
+                                    op | fcntl.LOCK_NB,
+                                    self.length, self.start, os.SEEK_SET)
+                        return True
+                    except IOError, e:
+                        if e.errno in _unsupported:
+                            self.use_fcntl = False
+                            continue
+                        elif e.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                else:
+                    if self._create_fallback():
+                        return True
+
+            except OSError, e:
+                if write or e.errno not in _no_access:
+                    raise
+                return False
+
+            if timeout is not None and time.time() - start_time > timeout:
+                raise LockTimeoutError(self.path, timeout)
+            time.sleep(poll_interval)
+
+
+    def _create_fallback(self):
+        """Try to create the fallback lock file.  Returns True if this
+           process now holds it."""
+        path = self._fallback_path()
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+            self._break_stale_fallback(path)
+            return False
+
+        os.write(fd, "%s %d\n" % (socket.gethostname(), os.getpid()))
+        os.close(fd)
+        return True
+
+
+    def _break_stale_fallback(self, path):
+        """Remove a fallback lock file made by a dead process on this host."""
+        try:
+            with open(path) as lock_file:
+                host, pid = lock_file.read().split()
+            if host != socket.gethostname():
+                return
+            os.kill(int(pid), 0)
+        except OSError, e:
+            if e.errno == errno.ESRCH:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        except (IOError, ValueError):
+            # Not written yet, or already gone.
+            pass
+
+
+    def _release(self):
+        if not self._held:
+            return
+        self._held = False
+        if self.use_fcntl:
+            fcntl.lockf(_lock_file(self.path, False), fcntl.LOCK_UN,
+                        self.length, self.start, os.SEEK_SET)
+        else:
+            os.remove(self._fallback_path())
+
+
+    def acquire_read(self, timeout=None):
+        """Take a shared lock, waiting up to timeout seconds for writers
+           to finish.  Does nothing new if this process already holds
+           the lock."""
+        if self._reads == 0 and self._writes == 0:
+            self._held = self._take(fcntl.LOCK_SH, timeout)
+        self._reads += 1
+
+
+    def acquire_write(self, timeout=None):
+        """Take an exclusive lock, waiting up to timeout seconds for
+           other readers and writers to finish.  A read lock held by
+           this process is upgraded."""
+        if self._writes == 0:
+            if self._held and self._reads > 0 and not self.use_fcntl:
+                # Fallback locks are already exclusive.
+                pass
+            else:
+                self._held = self._take(fcntl.LOCK_EX, timeout)
+        self._writes += 1
+
+
+    def release_read(self):
+        assert self._reads > 0
+        self._reads -= 1
+        if self._reads == 0 and self._writes == 0:
+            self._release()
+
+
+    def release_write(self):
+        assert self._writes > 0
+        self._writes -= 1
+        if self._writes == 0:
+            if self._reads > 0:
+                # Go back to the shared lock this process held before.
+                if self.use_fcntl:
+                    self._held = self._take(fcntl.LOCK_SH, None)
+            else:
+                self._release()
+
+
+    def read_transaction(self, timeout=None):
+        """Context manager that holds a read lock."""
+        return _Transaction(self.acquire_read, self.release_read, timeout)
+
+
+    def write_transaction(self, timeout=None):
+        """Context manager that holds a write lock."""
+        return _Transaction(self.acquire_write, self.release_write, timeout)
+
+
+class _Transaction(object):
+    def __init__(self, acquire, release, timeout):
+        self.acquire = acquire
+        self.release = release
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.acquire(self.timeout)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+
+class LockError(Exception):
+    """Raised when a lock can't be taken."""
+
+
+class LockTimeoutError(LockError):
+    """Raised when a lock is not released in time."""
+    def __init__(self, path, timeout):
+        super(LockTimeoutError, self).__init__(
+            "Timed out after %s seconds waiting for lock on %s."
+            % (timeout, path))
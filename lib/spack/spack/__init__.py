@@ -42,15 +42,19 @@ test_path      = join_path(module_path, "test")
 hooks_path     = join_path(module_path, "hooks")
 var_path       = join_path(prefix, "var", "spack")
 stage_path     = join_path(var_path, "stage")
+cache_path     = join_path(var_path, "cache")
 install_path   = join_path(prefix, "opt")
 share_path     = join_path(prefix, "share", "spack")
 
 #
-# Set up the packages database.
+# Set up the packages database.  It keeps at most package_cache_size
+# package instances in memory.  None means no limit.
 #
+package_cache_size = 1024
 from spack.packages import PackageDB
 packages_path = join_path(var_path, "packages")
-db = PackageDB(packages_path)
+packed_packages_path = join_path(var_path, "packages.pack")
+db = PackageDB(packages_path, packed=packed_packages_path)
 
 #
 # Paths to mock files for testing.
@@ -65,8 +69,8 @@ mock_user_config = join_path(mock_config_path, "user_spackconfig")
 # This controls how spack lays out install prefixes and
 # stage directories.
 #
-from spack.directory_layout import SpecHashDirectoryLayout
-install_layout = SpecHashDirectoryLayout(install_path)
+from spack.directory_layout import layout_for_root
+install_layout = layout_for_root(install_path)
 
 #
 # This controls how things are concretized in spack.
@@ -91,6 +95,18 @@ editor = Executable(os.environ.get("EDITOR", "vi"))
 # Curl tool for fetching files.
 curl = which("curl", required=True)
 
+# Whether to download http and https URLs in-process, with pooled
+# connections and retries, rather than with curl.  See util/http.py.
+use_native_fetch = True
+
+# Whether to check SSL certificates.  spack -k turns this off.
+verify_ssl = True
+
+# Whether to expand archives while they download, rather than reading
+# them again afterwards.  Expanded sources are only used if the
+# archive's checksum matches.  See fetch_strategy.py.
+expand_while_fetching = True
+
 # Whether to build in tmp space or directly in the stage_path.
 # If this is true, then spack will make stage directories in
 # a tmp filesystem, and it will symlink them into stage_path.
@@ -111,6 +127,24 @@ tmp_dirs.append('/nfs/tmp2/%u/spack-stage')
 # for.
 do_checksum = True
 
+# Whether to save concretized specs on disk and reuse them when the
+# same abstract spec is concretized again.  See concretize_cache.py.
+use_concretize_cache = True
+concretize_cache_path = join_path(cache_path, "concretize")
+
+# Where to keep the indexes of package metadata.  See package_index.py.
+package_index_path = join_path(cache_path, "packages")
+
+# Whether to keep downloaded archives in a cache shared by all stages,
+# and where, unless a config file says otherwise.  See source_cache.py.
+use_source_cache = True
+source_cache_path = join_path(cache_path, "sources")
+
+# Whether to probe mirrors and fetch from the fastest one first, and
+# where to keep their latency statistics.  See mirror_ranking.py.
+use_mirror_ranking = True
+mirror_stats_path = join_path(cache_path, "mirrors.json")
+
 #
 # SYS_TYPE to use for the spack installation.
 # Value of this determines what platform spack thinks it is by
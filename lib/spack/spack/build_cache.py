@@ -0,0 +1,264 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A local binary build cache.
+
+After a package is installed, its prefix can be packed into a tarball
+in a cache directory, keyed by architecture, compiler, and the spec's
+dependency hash.  Before building a package, Spack checks the cache
+for a tarball with the same key and, if it finds one, extracts it
+instead of building from source.
+
+The cache is configured in a spack config file like this::
+
+    [buildcache]
+        path = /shared/spack/buildcache
+
+Each tarball contains the install prefix under ``prefix/``, along with
+the spec it was built from and the install root and directory layout
+it was built in.  If the install prefixes of the package or its
+dependencies differ where the tarball is extracted, paths baked into
+text files, symlinks, and (if ``patchelf`` is available) ELF RPATHs are
+relocated to the new prefixes.
+"""
+import os
+import re
+import json
+import tarfile
+from StringIO import StringIO
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import join_path, mkdirp
+
+import spack
+import spack.config
+import spack.error
+from spack.util.executable import which
+
+"""Names of metadata members in build cache tarballs."""
+_spec_member = 'spec'
+_root_member = 'install_root'
+_layout_member = 'layout'
+_prefix_dir  = 'prefix'
+
+
+def cache_path():
+    """Path to the build cache directory, or None if not configured."""
+    config = spack.config.get_config()
+    if not config.has_value('buildcache', None, 'path'):
+        return None
+    return config.get_value('buildcache', None, 'path')
+
+
+def tarball_path(spec):
+    """Path to the build cache tarball for a concrete spec."""
+    root = cache_path()
+    if root is None:
+        return None
+    return join_path(root, spec.architecture, spec.compiler,
+                     spec.format('$_$@$+$#') + '.tar.gz')
+
+
+def _add_string(tar, name, string):
+    """Add a member containing a string to an open tarfile."""
+    info = tarfile.TarInfo(name)
+    info.size = len(string)
+    tar.addfile(info, StringIO(string))
+
+
+def create(pkg):
+    """Pack an installed package's prefix into the build cache.
+       Returns the path to the tarball, or None if there is no cache.
+    """
+    path = tarball_path(pkg.spec)
+    if path is None or os.path.exists(path):
+        return None
+
+    mkdirp(os.path.dirname(path))
+
+    # Write to a temporary file and rename it, so that readers on
+    # other machines never see a partially written tarball.
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with closing(tarfile.open(tmp_path, 'w:gz')) as tar:
+            _add_string(tar, _spec_member, pkg.spec.tree(ids=False, cover='nodes'))
+            _add_string(tar, _root_member, spack.install_layout.root)
+            _add_string(tar, _layout_member,
+                        json.dumps(spack.install_layout.layout_args))
+            tar.add(pkg.prefix, arcname=_prefix_dir)
+        os.rename(tmp_path, path)
+    except tarfile.TarError, e:
+        raise BuildCacheError("Could not create %s: %s" % (path, e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    tty.msg("Added %s to build cache: %s" % (pkg.name, path))
+    return path
+
+
+def extract(pkg):
+    """Install a package from the build cache, if it is there.
+       Returns True if the package was installed from the cache.
+    """
+    path = tarball_path(pkg.spec)
+    if path is None or not os.path.isfile(path):
+        return False
+
+    tty.msg("Installing %s from build cache: %s" % (pkg.name, path))
+    prefix = pkg.prefix
+    try:
+        with closing(tarfile.open(path, 'r:gz')) as tar:
+            old_root = tar.extractfile(_root_member).read().strip()
+            old_layout = _old_layout(tar, old_root)
+
+            members = []
+            for member in tar.getmembers():
+                name = os.path.normpath(member.name)
+                if name.startswith('/') or '..' in name.split(os.sep):
+                    raise BuildCacheError(
+                        "Refusing to extract %s from %s." % (member.name, path))
+                if name == _prefix_dir:
+                    continue
+                if name.startswith(_prefix_dir + os.sep):
+                    member.name = name[len(_prefix_dir) + 1:]
+                    members.append(member)
+
+            mkdirp(prefix)
+            tar.extractall(prefix, members)
+
+        # Map the prefixes in the DAG, and anything else in the old root.
+        paths = [(old_layout.path_for_spec(node),
+                  spack.install_layout.path_for_spec(node))
+                 for node in pkg.spec.traverse()]
+        paths.append((old_root, spack.install_layout.root))
+        relocate_paths(prefix, paths)
+        spack.install_layout.register_spec(pkg.spec)
+
+    except (tarfile.TarError, IOError, OSError, KeyError, ValueError,
+            BuildCacheError), e:
+        tty.warn("Could not install %s from build cache." % pkg.name,
+                 getattr(e, 'message', None) or str(e),
+                 "Building from source instead.")
+        pkg.remove_prefix()
+        return False
+
+    tty.msg("Successfully installed %s from build cache" % pkg.name)
+    return True
+
+
+def _old_layout(tar, old_root):
+    """The directory layout a tarball was built in.  Tarballs made
+       before layouts were recorded used the default layout."""
+    # Imported here to avoid a circular import.
+    from spack.directory_layout import make_layout, SpecHashDirectoryLayout
+    try:
+        args = json.loads(tar.extractfile(_layout_member).read())
+    except KeyError:
+        return SpecHashDirectoryLayout(old_root)
+    return make_layout(old_root, args)
+
+
+def relocate(prefix, old_root, new_root):
+    """Replace references to old_root with new_root in the files in
+       prefix.  Text files are rewritten, absolute symlinks are
+       re-pointed, and ELF RPATHs are rewritten with patchelf.
+    """
+    relocate_paths(prefix, [(old_root, new_root)])
+
+
+def relocate_paths(prefix, paths):
+    """Like relocate(), but for a list of (old, new) path pairs, e.g.
+       the old and new prefixes of a package and its dependencies.
+       Each reference is replaced once, by the longest matching old
+       path, so a new path can contain an old one.
+    """
+    mapping = dict((old, new) for old, new in paths if old != new)
+    if not mapping:
+        return
+
+    old_paths = sorted(mapping, key=len, reverse=True)
+    regex = re.compile('|'.join(re.escape(old) for old in old_paths))
+    replace = lambda string: regex.sub(lambda m: mapping[m.group(0)], string)
+
+    patchelf = which('patchelf')
+    for dirpath, dirnames, filenames in os.walk(prefix):
+        # os.walk() lists symlinks to directories with the directories.
+        for dirname in dirnames:
+            path = join_path(dirpath, dirname)
+            if os.path.islink(path):
+                _relocate_link(path, regex, mapping)
+
+        for filename in filenames:
+            path = join_path(dirpath, filename)
+
+            if os.path.islink(path):
+                _relocate_link(path, regex, mapping)
+                continue
+
+            with closing(open(path, 'rb')) as f:
+                contents = f.read()
+            if not regex.search(contents):
+                continue
+
+            mode = os.stat(path).st_mode
+            os.chmod(path, mode | 0200)
+            try:
+                if contents.startswith('\x7fELF'):
+                    _relocate_elf(patchelf, path, regex, replace)
+                elif '\0' not in contents:
+                    with closing(open(path, 'wb')) as f:
+                        f.write(replace(contents))
+                else:
+                    tty.warn("Cannot relocate binary file %s." % path)
+            finally:
+                os.chmod(path, mode)
+
+
+def _relocate_link(path, regex, mapping):
+    """Re-point a symlink whose target starts with an old path."""
+    target = os.readlink(path)
+    match = regex.match(target)
+    if match:
+        os.unlink(path)
+        os.symlink(mapping[match.group(0)] + target[match.end():], path)
+
+
+def _relocate_elf(patchelf, path, regex, replace):
+    """Rewrite the RPATH of an ELF binary."""
+    if patchelf is None:
+        tty.warn("Cannot relocate RPATH in %s without patchelf." % path)
+        return
+
+    rpath = patchelf('--print-rpath', path, return_output=True).strip()
+    if regex.search(rpath):
+        patchelf('--set-rpath', replace(rpath), path)
+
+
+class BuildCacheError(spack.error.SpackError):
+    """Raised when a build cache tarball is malformed."""
+    def __init__(self, message):
+        super(BuildCacheError, self).__init__(message)
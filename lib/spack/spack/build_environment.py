@@ -36,6 +36,7 @@ from llnl.util.filesystem import *
 import spack
 import spack.compilers as compilers
 from spack.util.executable import Executable, which
+from spack.jobserver import get_jobserver
 from spack.util.environment import *
 
 #
@@ -66,6 +67,10 @@ class MakeExecutable(Executable):
 
        Note that if the SPACK_NO_PARALLEL_MAKE env var is set it overrides
        everything.
+
+       If a jobserver is configured (see spack.jobserver), parallel
+       makes join it instead of using -j<cpu_count>, so that all
+       concurrent builds share a fixed number of job slots.
     """
     def __init__(self, name, parallel):
         super(MakeExecutable, self).__init__(name)
@@ -76,10 +81,30 @@ class MakeExecutable(Executable):
         disable_parallel = env_flag(SPACK_NO_PARALLEL_MAKE)
 
         if parallel and not disable_parallel:
+            jobserver = get_jobserver()
+            if jobserver:
+                return self._call_with_jobserver(jobserver, *args, **kwargs)
+
             jobs = "-j%d" % multiprocessing.cpu_count()
             args = (jobs,) + args
 
-        super(MakeExecutable, self).__call__(*args, **kwargs)
+        return super(MakeExecutable, self).__call__(*args, **kwargs)
+
+
+    def _call_with_jobserver(self, jobserver, *args, **kwargs):
+        """Run make as a member of the jobserver.  The token we hold
+           while make runs is make's implicit job slot."""
+        token = jobserver.acquire()
+        old_makeflags = os.environ.get('MAKEFLAGS')
+        os.environ['MAKEFLAGS'] = jobserver.makeflags
+        try:
+            return super(MakeExecutable, self).__call__(*args, **kwargs)
+        finally:
+            if old_makeflags is None:
+                del os.environ['MAKEFLAGS']
+            else:
+                os.environ['MAKEFLAGS'] = old_makeflags
+            jobserver.release(token)
 
 
 def set_compiler_environment_variables(pkg):
@@ -181,6 +206,13 @@ def set_module_variables_for_package(pkg):
     # TODO: this shouldn't be.
     m.cmake = which("cmake")
 
+    # Charge time spent in build tools to phases of the install timer.
+    for phase, exe in (('configure', m.configure), ('cmake', m.cmake),
+                       ('make', m.make), ('make', m.gmake)):
+        if exe is not None:
+            exe.timer = pkg.timer
+            exe.phase = phase
+
     # standard CMake arguments
     m.std_cmake_args = ['-DCMAKE_INSTALL_PREFIX=%s' % pkg.prefix,
                         '-DCMAKE_BUILD_TYPE=RelWithDebInfo']
@@ -0,0 +1,73 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+from external import argparse
+import llnl.util.tty as tty
+
+import spack
+import spack.cmd
+from spack.packages import PackageDB
+from spack.package import Package
+
+description = "Commands for debugging spack itself."
+
+def setup_parser(subparser):
+    sp = subparser.add_subparsers(
+        metavar='SUBCOMMAND', dest='debug_command')
+
+    stats_parser = sp.add_parser('cache-stats', help=debug_cache_stats.__doc__)
+    stats_parser.add_argument(
+        'spack_command', nargs=argparse.REMAINDER,
+        help="spack command to run before printing statistics.")
+
+
+def caches():
+    """The in-memory caches that cache-stats reports on, with names."""
+    return [('package instances', spack.db.instances),
+            ('package classes',   PackageDB.get_class_for_package_name.cache),
+            ('package names',     PackageDB.all_package_names.cache),
+            ('version urls',      Package.version_urls.cache)]
+
+
+def print_cache_stats():
+    fmt = "%-20s %8s %8s %8s %8s %10s"
+    print fmt % ('Cache', 'Size', 'Max', 'Hits', 'Misses', 'Evictions')
+    for name, cache in caches():
+        maxsize = cache.maxsize if cache.maxsize is not None else '-'
+        print fmt % (name, len(cache), maxsize,
+                     cache.hits, cache.misses, cache.evictions)
+
+
+def debug_cache_stats(parser, args):
+    """Run a spack command, then print statistics for spack's caches."""
+    if args.spack_command:
+        command_args = parser.parse_args(args.spack_command)
+        command = spack.cmd.get_command(command_args.command)
+        command(parser, command_args)
+    print_cache_stats()
+
+
+def debug(parser, args):
+    action = { 'cache-stats' : debug_cache_stats }
+    action[args.debug_command](parser, args)
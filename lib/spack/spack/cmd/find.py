@@ -65,8 +65,13 @@ def find(parser, args):
         if not query_specs:
             return
 
-    specs = [s for s in spack.db.installed_package_specs()
-             if not query_specs or any(s.satisfies(q) for q in query_specs)]
+    if query_specs:
+        specs = set()
+        for q in query_specs:
+            specs.update(spack.db.get_installed(q))
+        specs = list(specs)
+    else:
+        specs = spack.db.installed_package_specs()
 
     # Make a dict with specs keyed by architecture and compiler.
     index = index_by(specs, 'architecture', 'compiler')
@@ -68,7 +68,8 @@ def rst_table(elts):
 
 def info_rst():
     """Print out information on all packages in restructured text."""
-    pkgs = sorted(spack.db.all_packages(), key=lambda s:s.name.lower())
+    pkgs = [spack.db.metadata(name) for name in spack.db.all_package_names()]
+    pkgs.sort(key=lambda s:s.name.lower())
 
     print "Package List"
     print "=================="
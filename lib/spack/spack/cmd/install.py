@@ -22,11 +22,18 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
+import os
 import sys
+import time
 from external import argparse
 
+import llnl.util.tty as tty
+from llnl.util.filesystem import join_path
+
 import spack
 import spack.cmd
+import spack.package
+from spack.util.timer import PhaseTimer
 
 description = "Build and install packages"
 
@@ -43,6 +50,22 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-n', '--no-checksum', action='store_true', dest='no_checksum',
         help="Do not check packages against checksum")
+    subparser.add_argument(
+        '-j', '--jobs', action='store', type=int, dest='jobs', default=1,
+        help="Number of packages to build concurrently.")
+    subparser.add_argument(
+        '--keep-going', action='store_true', dest='keep_going',
+        help="With -j, keep building independent packages after a failure.")
+    subparser.add_argument(
+        '-p', '--prefetch-jobs', action='store', type=int, dest='prefetch_jobs',
+        default=0, help="Fetch sources for the whole DAG in the background "
+        "with this many workers while building.")
+    subparser.add_argument(
+        '--no-cache', action='store_false', dest='use_cache',
+        help="Do not install from or add to the binary build cache.")
+    subparser.add_argument(
+        '--timings', action='store_true', dest='timings',
+        help="Print a table of time spent in each phase of each install.")
     subparser.add_argument(
         'packages', nargs=argparse.REMAINDER, help="specs of packages to install")
 
@@ -54,9 +77,55 @@ def install(parser, args):
     if args.no_checksum:
         spack.do_checksum = False
 
+    start = time.time()
     specs = spack.cmd.parse_specs(args.packages, concretize=True)
     for spec in specs:
         package = spack.db.get(spec)
         package.do_install(keep_prefix=args.keep_prefix,
                            keep_stage=args.keep_stage,
-                           ignore_deps=args.ignore_deps)
+                           ignore_deps=args.ignore_deps,
+                           jobs=args.jobs,
+                           keep_going=args.keep_going,
+                           prefetch_jobs=args.prefetch_jobs,
+                           use_cache=args.use_cache)
+
+    if args.timings:
+        print_timings(specs, start)
+
+
+def print_timings(specs, since):
+    """Print phase times for packages in the DAGs of specs that were
+       installed after the time ``since``."""
+    phases = ['fetch', 'checksum', 'expand', 'patch',
+              'configure', 'cmake', 'make', 'install']
+
+    rows = []
+    seen = set()
+    for root in specs:
+        for spec in root.traverse(order='post'):
+            path = join_path(spec.prefix, spack.package.timings_file_name)
+            if path in seen or not os.path.isfile(path):
+                continue
+            seen.add(path)
+            if os.path.getmtime(path) >= since:
+                rows.append((spec.name, PhaseTimer.read(path)))
+
+    if not rows:
+        tty.msg("No packages were built.")
+        return
+
+    # Only show phases that took time in some package.
+    phases = [p for p in phases if any(p in t.phases for n, t in rows)]
+    phases += sorted(set(p for n, t in rows for p in t.phases) - set(phases))
+
+    width = max(len(n) for n, t in rows + [('package', None)])
+    columns = ['%-*s' % (width, 'package')] + ['%9s' % p for p in phases]
+    columns += ['%9s' % 'total', '%9s' % 'cpu']
+
+    tty.msg("Install timings (wall seconds):")
+    print ' '.join(columns)
+    for name, timer in rows:
+        line = ['%-*s' % (width, name)]
+        line += ['%9.2f' % timer.wall(p) for p in phases]
+        line += ['%9.2f' % timer.total_wall, '%9.2f' % timer.total_cpu]
+        print ' '.join(line)
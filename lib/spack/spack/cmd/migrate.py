@@ -0,0 +1,59 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+import llnl.util.tty as tty
+
+import spack
+import spack.migration
+from spack.directory_layout import layout_types
+
+description = "Move installed packages to a different directory layout."
+
+def setup_parser(subparser):
+    subparser.add_argument(
+        '-l', '--layout', default='sharded', choices=sorted(layout_types),
+        help="Directory layout to move to.  Default is sharded.")
+    subparser.add_argument(
+        '--hash-length', type=int, dest='hash_len',
+        help="Length of the dependency hash in prefix names.  "
+             "Default is the current length.")
+    subparser.add_argument(
+        '--shard-length', type=int, dest='shard_len', default=2,
+        help="Hex digits in shard directory names, for the sharded layout.")
+    subparser.add_argument(
+        '-j', '--jobs', action='store', type=int, default=1,
+        help="Number of packages to move concurrently.")
+
+
+def migrate(parser, args):
+    old_layout = spack.install_layout
+    hash_len = args.hash_len or old_layout.hash_len
+
+    new_layout = layout_types[args.layout](
+        old_layout.root, hash_len=hash_len, shard_len=args.shard_len)
+
+    spack.migration.migrate(old_layout, new_layout, jobs=args.jobs)
+    spack.install_layout = new_layout
+    tty.msg("Install tree %s now uses the %s layout."
+            % (new_layout.root, args.layout))
@@ -65,7 +65,7 @@ def module_find(mtype, spec_array):
         tty.die("You can only pass one spec.")
     spec = specs[0]
 
-    specs = [s for s in spack.db.installed_package_specs() if s.satisfies(spec)]
+    specs = spack.db.get_installed(spec)
     if len(specs) == 0:
         tty.die("No installed packages match spec %s" % spec)
 
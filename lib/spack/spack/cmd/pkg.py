@@ -29,9 +29,11 @@ import llnl.util.tty as tty
 from llnl.util.tty.colify import colify
 
 import spack
+import spack.packages
+import spack.packed_repo
 from spack.util.executable import *
 
-description = "Query packages associated with particular git revisions in spack."
+description = "Query packages associated with particular git revisions in spack, or pack them."
 
 def setup_parser(subparser):
     sp = subparser.add_subparsers(
@@ -47,6 +49,10 @@ def setup_parser(subparser):
     diff_parser.add_argument('rev2', nargs='?', default='HEAD',
                              help="Revision to compare to rev1 (default is HEAD).")
 
+    pack_parser = sp.add_parser('pack', help=pkg_pack.__doc__)
+    pack_parser.add_argument('-r', '--remove', action='store_true',
+                             help="Remove the pack and load packages from source.")
+
     add_parser = sp.add_parser('added', help=pkg_added.__doc__)
     add_parser.add_argument('rev1', nargs='?', default='HEAD^',
                              help="Revision to compare against.")
@@ -116,9 +122,26 @@ def pkg_added(args):
     if u2: colify(sorted(u2))
 
 
+def pkg_pack(args):
+    """Pack compiled packages into one file, for faster loading."""
+    path = spack.packed_packages_path
+    if args.remove:
+        if os.path.exists(path):
+            os.remove(path)
+            tty.msg("Removed %s." % path)
+        return
+
+    # Pack from the sources, not from an existing pack.
+    db = spack.packages.PackageDB(spack.packages_path)
+    names = spack.packed_repo.pack(db, path)
+    tty.msg("Packed %d packages into %s." % (len(names), path),
+            "Packages changed after this are loaded from source.")
+
+
 def pkg(parser, args):
     action = { 'diff'    : pkg_diff,
                'list'    : pkg_list,
                'removed' : pkg_removed,
-               'added'   : pkg_added }
+               'added'   : pkg_added,
+               'pack'    : pkg_pack }
     action[args.pkg_command](args)
@@ -23,8 +23,21 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 import spack.stage as stage
+import spack.concretize_cache
+import spack.package_index
+import spack.source_cache
+
+description = "Remove all temporary build files, downloaded archives, cached specs, and package indexes"
+
+def setup_parser(subparser):
+    subparser.add_argument(
+        '-s', '--source-cache', action='store_true', dest='source_cache',
+        help="Also remove archives from the shared source cache.")
 
-description = "Remove all temporary build files and downloaded archives"
 
 def purge(parser, args):
     stage.purge()
+    spack.concretize_cache.clear()
+    spack.package_index.clear()
+    if args.source_cache:
+        spack.source_cache.clear()
@@ -22,6 +22,7 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
+from contextlib import closing
 from external import argparse
 import spack.cmd
 
@@ -29,13 +30,45 @@ import llnl.util.tty as tty
 
 import spack.url as url
 import spack
+import spack.concretize
 
 description = "print out abstract and concrete versions of a spec."
 
 def setup_parser(subparser):
+    subparser.add_argument(
+        '-f', '--file', action='append', dest='files', default=[],
+        help="Read specs from a file, one per line, and concretize them together.")
+    subparser.add_argument(
+        '-j', '--jobs', action='store', type=int, dest='jobs', default=1,
+        help="Number of processes to concretize a batch of specs in.")
     subparser.add_argument('specs', nargs=argparse.REMAINDER, help="specs of packages")
 
+
+def read_spec_file(path):
+    """Read specs from a file, skipping blank lines and # comments."""
+    specs = []
+    try:
+        with closing(open(path)) as spec_file:
+            for line in spec_file:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    specs.extend(spack.cmd.parse_specs(line))
+    except IOError, e:
+        tty.die("Could not read spec file %s: %s" % (path, e.strerror))
+    return specs
+
+
 def spec(parser, args):
+    if args.files or args.jobs > 1:
+        # Concretize everything together and print only the results.
+        specs = spack.cmd.parse_specs(args.specs)
+        for path in args.files:
+            specs.extend(read_spec_file(path))
+
+        for spec in spack.concretize.concretize_specs(specs, jobs=args.jobs):
+            print spec.tree(color=True, indent=2)
+        return
+
     for spec in spack.cmd.parse_specs(args.specs):
         print "Input spec"
         print "------------------------------"
@@ -80,7 +80,9 @@ def uninstall(parser, args):
 
 
     # Sort packages to be uninstalled by the number of installed dependents
-    # This ensures we do things in the right order
+    # This ensures we do things in the right order: everything that
+    # depends on a package also depends on that package's dependencies,
+    # so a package always has more dependents than anything depending on it.
     def num_installed_deps(pkg):
         return len(pkg.installed_dependents)
     pkgs.sort(key=num_installed_deps)
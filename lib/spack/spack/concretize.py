@@ -33,12 +33,30 @@ or user preferences.
 TODO: make this customizable and allow users to configure
       concretization  policies.
 """
+import multiprocessing
+
 import spack.spec
 import spack.compilers
 import spack.architecture
+import spack.concretize_cache
 import spack.error
 from spack.version import *
 
+# While concretize_specs() is running, this dict holds the results of
+# lookups that every spec in the batch would otherwise repeat.
+_batch_memo = None
+
+
+def _shared(key, function, *args):
+    """Return function(*args).  In a batch, the result is computed only
+       once per key and shared by all specs in the batch."""
+    if _batch_memo is None:
+        return function(*args)
+
+    if key not in _batch_memo:
+        _batch_memo[key] = function(*args)
+    return _batch_memo[key]
+
 
 
 class DefaultConcretizer(object):
@@ -67,9 +85,12 @@ class DefaultConcretizer(object):
 
         # If there are known avaialble versions, return the most recent
         # version that satisfies the spec
-        pkg = spec.package
-        valid_versions = [v for v in pkg.available_versions
-                          if any(v.satisfies(sv) for sv in spec.versions)]
+        def find_valid_versions():
+            return [v for v in spec.package.available_versions
+                    if any(v.satisfies(sv) for sv in spec.versions)]
+
+        valid_versions = _shared(('versions', spec.name, str(spec.versions)),
+                                 find_valid_versions)
 
         if valid_versions:
             spec.versions = ver([valid_versions[-1]])
@@ -112,7 +133,7 @@ class DefaultConcretizer(object):
            build with the compiler that will be used by libraries that
            link to this one, to maximize compatibility.
         """
-        all_compilers = spack.compilers.all_compilers()
+        all_compilers = _shared('compilers', spack.compilers.all_compilers)
 
         if (spec.compiler and
             spec.compiler.concrete and
@@ -125,7 +146,8 @@ class DefaultConcretizer(object):
 
             if not nearest in all_compilers:
                 # Take the newest compiler that saisfies the spec
-                matches = sorted(spack.compilers.find(nearest))
+                matches = sorted(_shared(('find', str(nearest)),
+                                         spack.compilers.find, nearest))
                 if not matches:
                     raise UnavailableCompilerVersionError(nearest)
 
@@ -147,10 +169,89 @@ class DefaultConcretizer(object):
         assert(spec.virtual)
         assert(providers)
 
-        index = spack.spec.index_specs(providers)
-        first_key = sorted(index.keys())[0]
-        latest_version = sorted(index[first_key])[-1]
-        return latest_version
+        def choose():
+            index = spack.spec.index_specs(providers)
+            first_key = sorted(index.keys())[0]
+            return sorted(index[first_key])[-1]
+
+        return _shared(('provider', str(spec)), choose)
+
+
+def _concretize_string(abstract):
+    """Concretize a spec string in a worker process.  Returns the DAG
+       in a picklable form, or the error if concretization failed."""
+    try:
+        spec = spack.spec.Spec(abstract)
+        spec.concretize()
+        return spack.concretize_cache.dump_dag(spec), None
+
+    except spack.error.SpackError, e:
+        return None, (e.message, e.long_message)
+
+
+def concretize_specs(specs, **kwargs):
+    """Concretize a list of specs together.  Returns a list of concrete
+       copies of the specs, in the same order.
+
+       Lookups that don't depend on the whole spec are done once for the
+       batch: the available compilers, the version chosen for each
+       package and version constraint, and the provider chosen for each
+       virtual spec.  Duplicate specs are only concretized once.
+
+       Options:
+       jobs[=1]
+           Number of processes to concretize the specs in.
+    """
+    global _batch_memo
+    jobs = kwargs.get('jobs', 1)
+
+    specs = [s if isinstance(s, spack.spec.Spec) else spack.spec.Spec(s)
+             for s in specs]
+
+    unique = []
+    by_string = {}
+    for spec in specs:
+        key = str(spec)
+        if key not in by_string:
+            by_string[key] = spec
+            unique.append(key)
+
+    concrete = {}
+    _batch_memo = {}
+    try:
+        if jobs > 1 and len(unique) > 1:
+            # Look compilers up before forking so workers share them.
+            _shared('compilers', spack.compilers.all_compilers)
+
+            pool = multiprocessing.Pool(min(jobs, len(unique)))
+            try:
+                results = pool.map(_concretize_string, unique)
+            finally:
+                pool.close()
+                pool.join()
+
+            for key, (nodes, error) in zip(unique, results):
+                if error is not None:
+                    raise spack.error.SpackError(*error)
+                concrete[key] = spack.concretize_cache.load_dag(nodes)
+
+        else:
+            for key in unique:
+                concrete[key] = by_string[key].concretized()
+
+    finally:
+        _batch_memo = None
+
+    # Duplicates get their own copies, so callers can modify them.
+    result = []
+    for spec in specs:
+        key = str(spec)
+        if key in by_string:
+            result.append(concrete[key])
+            del by_string[key]
+        else:
+            result.append(concrete[key].copy())
+    return result
 
 
 class UnavailableCompilerVersionError(spack.error.SpackError):
@@ -0,0 +1,189 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A persistent cache of concretized specs.
+
+Concretizing a spec normalizes it, expands its virtual dependencies, and
+imports the package for every node in its DAG.  Spack commands run in new
+processes, so that work is repeated each time the same spec is given on
+the command line.  This module saves concrete DAGs on disk so that later
+requests for the same abstract spec can skip it.
+
+Entries are keyed by the abstract spec string and by the other inputs to
+concretization:
+
+  * the package repository,
+  * the host's sys_type,
+  * the compilers in the spack configuration,
+  * the concretizer class and the spack version.
+
+Each entry also records the mtime and size of the ``package.py`` files
+it was computed from, and it is ignored if any of them have changed.  If
+the spec had virtual dependencies, every package in the repository is
+recorded, because any package could become a new provider.
+
+Set ``spack.use_concretize_cache`` to False to disable the cache.
+``spack purge`` removes it.
+"""
+import os
+import json
+import shutil
+import hashlib
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import join_path, mkdirp, file_stat
+
+import spack
+import spack.spec
+import spack.config
+import spack.architecture
+
+
+def _compiler_config():
+    """The compiler sections of the spack configuration, as a string."""
+    config = spack.config.get_config()
+    lines = []
+    for section in sorted(config.sections()):
+        if section.startswith('compiler'):
+            lines.append(section)
+            lines.extend("%s=%s" % item for item in config.items(section))
+    return "\n".join(lines)
+
+
+def _entry_path(abstract):
+    """Path to the cache entry for an abstract spec string."""
+    concretizer = type(spack.concretizer)
+    sha = hashlib.sha1()
+    for part in (abstract,
+                 spack.db.root,
+                 spack.architecture.sys_type(),
+                 _compiler_config(),
+                 "%s.%s" % (concretizer.__module__, concretizer.__name__),
+                 spack.spack_version):
+        sha.update(str(part))
+        sha.update('\0')
+    return join_path(spack.concretize_cache_path, sha.hexdigest())
+
+
+def dump_dag(spec):
+    """Convert a concrete spec DAG to a list of [node, dependency names]
+       pairs, with the root first.  Unlike Spec.tree(), this keeps the
+       structure of the DAG, so it can be read back without normalizing.
+    """
+    return [[node.format('$_$@$%@$+$='), sorted(node.dependencies)]
+            for node in spec.traverse()]
+
+
+def load_dag(nodes):
+    """Rebuild a concrete spec DAG from the output of dump_dag()."""
+    specs = []
+    for node_string, deps in nodes:
+        spec = spack.spec.Spec(node_string)
+        spec._normal = True
+        spec._concrete = True
+        specs.append(spec)
+
+    by_name = dict((spec.name, spec) for spec in specs)
+    for spec, (node_string, deps) in zip(specs, nodes):
+        for name in deps:
+            spec._add_dependency(by_name[name])
+
+    return specs[0]
+
+
+def get(abstract):
+    """Return a concrete copy of the abstract spec from the cache, or
+       None if there is no valid entry for it.
+    """
+    if not spack.use_concretize_cache:
+        return None
+
+    abstract = str(abstract)
+    try:
+        with closing(open(_entry_path(abstract))) as entry_file:
+            entry = json.load(entry_file)
+
+        # Guard against hash collisions.
+        if entry['spec'] != abstract:
+            return None
+
+        for path, stat in entry['files'].items():
+            if file_stat(path) != stat:
+                return None
+
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    return load_dag(entry['nodes'])
+
+
+def put(abstract, concrete, **kwargs):
+    """Save the concretization of an abstract spec in the cache.
+
+       Options:
+       virtual[=False]
+           Whether the abstract spec had virtual dependencies.  If so, the
+           entry is invalidated by a change to any package.
+    """
+    if not spack.use_concretize_cache:
+        return
+
+    if kwargs.get('virtual', False):
+        names = spack.db.all_package_names()
+    else:
+        names = [spec.name for spec in concrete.traverse()]
+
+    # The repository directory catches added and removed packages.
+    paths = [spack.db.filename_for_package_name(n) for n in names]
+    paths.append(spack.db.root)
+
+    entry = {
+        'spec'  : str(abstract),
+        'files' : dict((path, file_stat(path)) for path in paths),
+        'nodes' : dump_dag(concrete)
+    }
+
+    # The cache is only an optimization, so failing to write it is
+    # not an error.
+    path = _entry_path(abstract)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        mkdirp(spack.concretize_cache_path)
+        with closing(open(tmp_path, 'w')) as entry_file:
+            json.dump(entry, entry_file)
+        os.rename(tmp_path, path)
+    except (IOError, OSError), e:
+        tty.debug("Could not write concretization cache entry %s: %s"
+                  % (path, e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def clear():
+    """Remove all entries from the cache."""
+    if os.path.isdir(spack.concretize_cache_path):
+        shutil.rmtree(spack.concretize_cache_path)
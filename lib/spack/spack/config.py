@@ -83,10 +83,12 @@ like the one shown above.
 import os
 import re
 import inspect
+from contextlib import closing
 import ConfigParser as cp
 
 from external.ordereddict import OrderedDict
 from llnl.util.lang import memoized
+from llnl.util.lock import Lock
 import spack.error
 
 __all__ = [
@@ -326,16 +328,30 @@ class SpackConfigParser(cp.RawConfigParser):
 
            If called with a path or file object, this will write the
            configuration out to the supplied path or file object.
+
+           Files are written while holding a lock on <path>.lock, and
+           are replaced atomically, so concurrent spack processes never
+           read a partly written configuration.
         """
         if path_or_fp is None:
             if not self.filename:
                 raise ReadOnlySpackConfigError()
             path_or_fp = self.filename
 
-        if isinstance(path_or_fp, basestring):
-            path_or_fp = open(path_or_fp, 'w')
-
-        self._write(path_or_fp)
+        if not isinstance(path_or_fp, basestring):
+            self._write(path_or_fp)
+            return
+
+        path = path_or_fp
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with Lock(path + '.lock').write_transaction():
+            try:
+                with closing(open(tmp_path, 'w')) as config_file:
+                    self._write(config_file)
+                os.rename(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
 
 
     def _read(self, fp, fpname):
@@ -25,16 +25,26 @@
 import re
 import os
 import exceptions
+import json
 import hashlib
 import shutil
 from contextlib import closing
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import join_path, mkdirp
+from llnl.util.lock import Lock
 
 import spack
 from spack.spec import Spec
 from spack.error import SpackError
+from spack.install_index import InstallIndex
+
+
+# File in the install root with one lockable byte per install prefix.
+prefix_lock_name = '.spack-prefix.lock'
+
+# File in the install root naming the layout it uses.  See layout_for_root().
+layout_file_name = '.spack-layout'
 
 
 def _check_concrete(spec):
@@ -52,6 +62,10 @@ class DirectoryLayout(object):
     def __init__(self, root):
         self.root = root
 
+        # Prefix locks, by install path.  A process must use the same
+        # Lock object each time so that nested acquisitions are counted.
+        self._prefix_locks = {}
+
 
     def all_specs(self):
         """To be implemented by subclasses to traverse all specs for which there is
@@ -66,11 +80,44 @@ class DirectoryLayout(object):
         raise NotImplementedError()
 
 
+    def installed_dependents(self, spec):
+        """Installed specs that depend on the supplied concrete spec.
+           Subclasses with an index can do this without a scan."""
+        _check_concrete(spec)
+        return [s for s in self.all_specs()
+                if s.name != spec.name and spec in s]
+
+
+    def query(self, spec):
+        """Installed specs that satisfy the supplied spec.  Subclasses
+           with an index can do this without a scan."""
+        return [s for s in self.all_specs() if s.satisfies(spec)]
+
+
     def make_path_for_spec(self, spec):
         """Creates the installation directory for a spec."""
         raise NotImplementedError()
 
 
+    def register_spec(self, spec):
+        """Called when a prefix for spec was filled in without calling
+           make_path_for_spec(), e.g. from the build cache.  Subclasses
+           with an index add the spec to it."""
+        pass
+
+
+    def prefix_lock(self, spec):
+        """A Lock on one byte of the prefix lock file in the root,
+           chosen by hashing the spec's install path.  Hold a write lock
+           while creating, removing, or moving the prefix."""
+        path = self.path_for_spec(spec)
+        if not path in self._prefix_locks:
+            offset = int(hashlib.sha1(path).hexdigest()[:15], 16)
+            self._prefix_locks[path] = Lock(
+                join_path(self.root, prefix_lock_name), offset, 1)
+        return self._prefix_locks[path]
+
+
     def path_for_spec(self, spec):
         """Return an absolute path from the root to a directory for the spec."""
         _check_concrete(spec)
@@ -87,7 +134,11 @@ class DirectoryLayout(object):
 
         if os.path.exists(path):
             shutil.rmtree(path, True)
+        self.remove_empty_parents(path)
 
+
+    def remove_empty_parents(self, path):
+        """Removes the empty directories between path and the root."""
         path = os.path.dirname(path)
         while path != self.root:
             if os.path.isdir(path):
@@ -126,22 +177,44 @@ class SpecHashDirectoryLayout(DirectoryLayout):
        If there is ever a hash collision, you won't be able to install a new
        package unless you use a larger prefix.  However, the full spec is stored
        in a file called .spec in each directory, so you can migrate an entire
-       install directory to a new hash size pretty easily.
-
-       TODO: make a tool to migrate install directories to different hash sizes.
+       install directory to a new hash size with ``spack migrate``.
     """
+    # Name of this layout in the layout file, and the depth of prefixes
+    # below the root.
+    layout_name = 'spec-hash'
+    depth = 3
+
     def __init__(self, root, **kwargs):
-        """Prefix size is number of characters in the SHA-1 prefix to use
+        """hash_len is number of characters in the SHA-1 prefix to use
            to make each hash unique.
         """
         spec_file_name   = kwargs.get('spec_file_name', '.spec')
         super(SpecHashDirectoryLayout, self).__init__(root)
         self.spec_file_name = spec_file_name
+        self.hash_len = kwargs.get('hash_len', 8)
+        self.index = InstallIndex(self)
+
+
+    @property
+    def layout_args(self):
+        """Arguments that recreate this layout, as stored in the layout
+           file."""
+        return { 'layout'   : self.layout_name,
+                 'hash_len' : self.hash_len }
+
+
+    def write_layout_file(self):
+        """Record this layout in the root for layout_for_root()."""
+        mkdirp(self.root)
+        with closing(open(join_path(self.root, layout_file_name), 'w')) as f:
+            json.dump(self.layout_args, f)
 
 
     def relative_path_for_spec(self, spec):
         _check_concrete(spec)
-        dir_name = spec.format('$_$@$+$#')
+        dir_name = spec.format('$_$@$+')
+        if spec.dependencies:
+            dir_name += '-' + spec.dep_hash(self.hash_len)
         return join_path(spec.architecture, spec.compiler, dir_name)
 
 
@@ -162,8 +235,9 @@ class SpecHashDirectoryLayout(DirectoryLayout):
         # prevents us from trying to fetch a non-existing package, and
         # allows best effort for commands like spack find.
         if not spack.db.exists(spec.name):
-            spec._normal = True
-            spec._concrete = True
+            for node in spec.traverse():
+                node._normal = True
+                node._concrete = True
         else:
             spec.normalize()
             if not spec.concrete:
@@ -191,13 +265,13 @@ class SpecHashDirectoryLayout(DirectoryLayout):
                     'No spec file found at path %s' % spec_file_path)
 
             installed_spec = self.read_spec(spec_file_path)
-            if installed_spec == self.spec:
+            if installed_spec == spec:
                 raise InstallDirectoryAlreadyExistsError(path)
 
-            spec_hash = self.hash_spec(spec)
-            installed_hash = self.hash_spec(installed_spec)
-            if installed_spec == spec_hash:
-                raise SpecHashCollisionError(installed_hash, spec_hash)
+            spec_hash = spec.dep_hash(self.hash_len)
+            installed_hash = installed_spec.dep_hash(self.hash_len)
+            if installed_hash == spec_hash:
+                raise SpecHashCollisionError(installed_spec, spec)
             else:
                 raise InconsistentInstallDirectoryError(
                     'Spec file in %s does not match SHA-1 hash!'
@@ -205,21 +279,112 @@ class SpecHashDirectoryLayout(DirectoryLayout):
 
         mkdirp(path)
         self.write_spec(spec, spec_file_path)
+        self.index.add(spec)
+
+
+    def remove_path_for_spec(self, spec):
+        super(SpecHashDirectoryLayout, self).remove_path_for_spec(spec)
+        self.index.remove(spec)
+
+
+    def register_spec(self, spec):
+        _check_concrete(spec)
+        self.index.add(spec)
 
 
     def all_specs(self):
+        """All installed specs, read from the install index."""
+        return self.index.all_specs()
+
+
+    def installed_dependents(self, spec):
+        _check_concrete(spec)
+        return self.index.dependents(spec)
+
+
+    def query(self, spec):
+        return self.index.query(spec)
+
+
+    def walk_specs(self):
+        """Find installed specs by reading the spec files in the install
+           tree.  This is how the install index is rebuilt."""
         if not os.path.isdir(self.root):
             return
 
-        for path in traverse_dirs_at_depth(self.root, 3):
-            arch, compiler, last_dir = path
+        for path in traverse_dirs_at_depth(self.root, self.depth):
             spec_file_path = join_path(
-                self.root, arch, compiler, last_dir, self.spec_file_name)
+                self.root, *(path + (self.spec_file_name,)))
             if os.path.exists(spec_file_path):
                 spec = self.read_spec(spec_file_path)
                 yield spec
 
 
+class HashShardedDirectoryLayout(SpecHashDirectoryLayout):
+    """Like SpecHashDirectoryLayout, but spreads the prefixes for each
+       architecture and compiler over subdirectories, so that no one
+       directory gets too large to list quickly::
+           <install_root>/
+               <architecture>/
+                   <compiler>/
+                       <shard>/
+                           name@version+variant-<dependency_hash>
+
+       Where shard is the first shard_len hex digits of the SHA-1 of the
+       prefix's directory name.
+    """
+    layout_name = 'sharded'
+    depth = 4
+
+    def __init__(self, root, **kwargs):
+        super(HashShardedDirectoryLayout, self).__init__(root, **kwargs)
+        self.shard_len = kwargs.get('shard_len', 2)
+
+
+    @property
+    def layout_args(self):
+        args = super(HashShardedDirectoryLayout, self).layout_args
+        args['shard_len'] = self.shard_len
+        return args
+
+
+    def relative_path_for_spec(self, spec):
+        path = super(HashShardedDirectoryLayout,
+                     self).relative_path_for_spec(spec)
+        parent, dir_name = os.path.split(path)
+        shard = hashlib.sha1(dir_name).hexdigest()[:self.shard_len]
+        return join_path(parent, shard, dir_name)
+
+
+# Layouts that can be named in a layout file.
+layout_types = dict((cls.layout_name, cls) for cls in
+                    (SpecHashDirectoryLayout, HashShardedDirectoryLayout))
+
+
+def layout_for_root(root):
+    """The layout of the install tree at root, as recorded in its layout
+       file by ``spack migrate``.  Trees without one use the default
+       SpecHashDirectoryLayout."""
+    path = join_path(root, layout_file_name)
+    if not os.path.isfile(path):
+        return SpecHashDirectoryLayout(root)
+
+    try:
+        with closing(open(path)) as layout_file:
+            return make_layout(root, json.load(layout_file))
+    except (IOError, ValueError, KeyError), e:
+        raise DirectoryLayoutError(
+            "Invalid directory layout file %s: %s" % (path, e))
+
+
+def make_layout(root, args):
+    """Make a layout at root from the layout_args of another layout."""
+    # Keyword argument names can't be unicode in Python 2.6.
+    kwargs = dict((str(k), v) for k, v in args.items())
+    layout_type = layout_types[kwargs.pop('layout')]
+    return layout_type(root, **kwargs)
+
+
 class DirectoryLayoutError(SpackError):
     """Superclass for directory layout errors."""
     def __init__(self, message):
@@ -229,9 +394,9 @@ class DirectoryLayoutError(SpackError):
 class SpecHashCollisionError(DirectoryLayoutError):
     """Raised when there is a hash collision in an SpecHashDirectoryLayout."""
     def __init__(self, installed_spec, new_spec):
-        super(SpecHashDirectoryLayout, self).__init__(
+        super(SpecHashCollisionError, self).__init__(
             'Specs %s and %s have the same SHA-1 prefix!'
-            % installed_spec, new_spec)
+            % (installed_spec, new_spec))
 
 
 class InconsistentInstallDirectoryError(DirectoryLayoutError):
@@ -244,4 +409,4 @@ class InstallDirectoryAlreadyExistsError(DirectoryLayoutError):
     """Raised when make_path_for_sec is called unnecessarily."""
     def __init__(self, path):
         super(InstallDirectoryAlreadyExistsError, self).__init__(
-            "Install path %s already exists!")
+            "Install path %s already exists!" % path)
@@ -42,16 +42,22 @@ in order to build it.  They need to define the following methods:
 """
 import os
 import re
+import json
 import shutil
 from functools import wraps
+from contextlib import closing
 import llnl.util.tty as tty
+from llnl.util.filesystem import join_path
 
 import spack
 import spack.error
+import spack.source_cache
 import spack.util.crypto as crypto
+import spack.util.http as http
 from spack.util.executable import *
 from spack.util.string import *
 from spack.version import Version, ver
+import spack.util.compression as compression
 from spack.util.compression import decompressor_for, extension
 
 """List of all fetch strategies, created by FetchStrategy metaclass."""
@@ -110,6 +116,22 @@ class FetchStrategy(object):
         return any(k in args for k in cls.required_attributes)
 
 
+# Where archives are expanded while they download, within the stage,
+# until their checksum is verified.  See URLFetchStrategy.
+expanding_dir_name = '.spack-expanding'
+
+# File in the stage recording the checksum computed during a download.
+stream_record_name = '.spack-stream.json'
+
+# Advice for when a download fails because of a bad certificate.
+_certificate_help = (
+    "Spack was unable to fetch due to invalid certificate. "
+    "This is either an attack, or your cluster's SSL configuration "
+    "is bad.  If you believe your SSL configuration is bad, you "
+    "can try running spack -k, which will not check SSL certificates. "
+    "Use this at your own risk.")
+
+
 class URLFetchStrategy(FetchStrategy):
     """FetchStrategy that pulls source code from a URL for an archive,
        checks the archive against a checksum,and decompresses the archive.
@@ -141,6 +163,146 @@ class URLFetchStrategy(FetchStrategy):
 
         tty.msg("Trying to fetch from %s" % self.url)
 
+        if (spack.use_native_fetch and
+            http.supports(self.url, verify_ssl=spack.verify_ssl)):
+            content_type = self._fetch_native()
+        else:
+            content_type = self._fetch_curl()
+
+        # Check if we somehow got an HTML file rather than the archive we
+        # asked for.
+        if content_type and 'text/html' in content_type:
+            tty.warn("The contents of " + self.archive_file + " look like HTML.",
+                     "The checksum will likely be bad.  If it is, you can use",
+                     "'spack clean --dist' to remove the bad archive, then fix",
+                     "your internet gateway issue and install again.")
+
+        if not self.archive_file:
+            raise FailedDownloadError(self.url)
+
+
+    @_needs_stage
+    def fetch_from_cache(self):
+        """Get the archive from the source cache instead of downloading
+           it.  Returns True if it was there.  See spack.source_cache."""
+        if not self.digest:
+            return False
+
+        archive = os.path.basename(self.url)
+        self.stage.chdir()
+        self._discard_stream()
+        if not spack.source_cache.fetch(self.digest, archive):
+            return False
+
+        # The cache checked the archive, so check() needn't.
+        tty.msg("Using %s from the source cache." % archive)
+        self._write_stream_record(archive, {
+            'hash_name' : crypto.Checker(self.digest).hash_name,
+            'sum'       : self.digest,
+            'expanded'  : False })
+        return True
+
+
+    def _fetch_native(self):
+        """Download the archive with spack.util.http, reusing connections
+           across fetches.  Returns the content type.
+
+           If there is a digest, the archive is hashed as it downloads,
+           so check() needn't read it again.  If spack.expand_while_fetching
+           is set, it is also expanded as it downloads, into a directory
+           that expand() moves into place once the checksum matches.
+        """
+        archive = os.path.basename(self.url)
+        self._discard_stream()
+
+        stream = None
+        if self.digest:
+            expand_dir = None
+            if spack.expand_while_fetching and compression.can_stream(archive):
+                expand_dir = self._expanding_path
+            stream = _ArchiveStream(archive, self.digest, expand_dir)
+
+        # Stop tar and remove what it expanded on any failure, including
+        # ones like a full disk that aren't HTTP errors.
+        try:
+            try:
+                response = http.download(self.url, archive, stream=stream,
+                                         verify_ssl=spack.verify_ssl)
+            except:
+                if stream:
+                    stream.abort()
+                raise
+        except http.HTTPError, e:
+            if e.ssl_error:
+                raise FailedDownloadError(self.url, _certificate_help)
+            raise FailedDownloadError(self.url, e.message)
+
+        if stream:
+            self._write_stream_record(archive, stream.finish())
+        return response.getheader('content-type')
+
+
+    @property
+    def _expanding_path(self):
+        return join_path(self.stage.path, expanding_dir_name)
+
+
+    @property
+    def _stream_record_path(self):
+        return join_path(self.stage.path, stream_record_name)
+
+
+    def _write_stream_record(self, archive, record):
+        st = os.stat(archive)
+        record.update({ 'archive' : archive,
+                        'size'    : st.st_size,
+                        'mtime'   : st.st_mtime })
+        with closing(open(self._stream_record_path, 'w')) as f:
+            json.dump(record, f)
+
+
+    def _stream_record(self):
+        """What was computed while the archive downloaded, or None if
+           the archive isn't the one that was downloaded."""
+        archive = self.archive_file
+        try:
+            with closing(open(self._stream_record_path)) as f:
+                record = json.load(f)
+            st = os.stat(archive)
+            if (record['archive'] == os.path.basename(archive) and
+                record['size'] == st.st_size and
+                record['mtime'] == st.st_mtime):
+                return record
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+
+    def _discard_stream(self):
+        """Remove the record and expanded tree of a streamed download."""
+        if os.path.exists(self._stream_record_path):
+            os.remove(self._stream_record_path)
+        shutil.rmtree(self._expanding_path, ignore_errors=True)
+
+
+    def _commit_expanded(self):
+        """Move an archive expanded during download into the stage if
+           its checksum matched.  Returns True if it was."""
+        record = self._stream_record()
+        verified = (record is not None and record['expanded'] and
+                    self.digest and
+                    crypto.Checker(self.digest).check_sum(record['sum']))
+        if verified:
+            expanding = self._expanding_path
+            for name in os.listdir(expanding):
+                os.rename(join_path(expanding, name),
+                          join_path(self.stage.path, name))
+        self._discard_stream()
+        return bool(verified)
+
+
+    def _fetch_curl(self):
+        """Download the archive with curl.  Returns the content type."""
         # Run curl but grab the mime type from the http headers
         headers = spack.curl('-#',        # status bar
                              '-O',        # save file to disk
@@ -156,30 +318,18 @@ class URLFetchStrategy(FetchStrategy):
 
             if spack.curl.returncode == 22:
                 # This is a 404.  Curl will print the error.
-                raise FailedDownloadError(url)
+                raise FailedDownloadError(self.url)
 
             if spack.curl.returncode == 60:
                 # This is a certificate error.  Suggest spack -k
-                raise FailedDownloadError(
-                    self.url,
-                    "Curl was unable to fetch due to invalid certificate. "
-                    "This is either an attack, or your cluster's SSL configuration "
-                    "is bad.  If you believe your SSL configuration is bad, you "
-                    "can try running spack -k, which will not check SSL certificates."
-                    "Use this at your own risk.")
-
-        # Check if we somehow got an HTML file rather than the archive we
-        # asked for.  We only look at the last content type, to handle
-        # redirects properly.
-        content_types = re.findall(r'Content-Type:[^\r\n]+', headers)
-        if content_types and 'text/html' in content_types[-1]:
-            tty.warn("The contents of " + self.archive_file + " look like HTML.",
-                     "The checksum will likely be bad.  If it is, you can use",
-                     "'spack clean --dist' to remove the bad archive, then fix",
-                     "your internet gateway issue and install again.")
+                raise FailedDownloadError(self.url, _certificate_help)
 
-        if not self.archive_file:
-            raise FailedDownloadError(self.url)
+        # We only look at the last content type, to handle redirects
+        # properly.
+        content_types = re.findall(r'Content-Type:([^\r\n]+)', headers)
+        if content_types:
+            return content_types[-1]
+        return None
 
 
     @property
@@ -196,6 +346,10 @@ class URLFetchStrategy(FetchStrategy):
             raise NoArchiveFileError("URLFetchStrategy couldn't find archive file",
                                       "Failed on expand() for URL %s" % self.url)
 
+        if self._commit_expanded():
+            tty.msg("Archive was expanded while downloading.")
+            return
+
         decompress = decompressor_for(self.archive_file)
         decompress(self.archive_file)
 
@@ -219,7 +373,14 @@ class URLFetchStrategy(FetchStrategy):
             raise NoDigestError("Attempt to check URLFetchStrategy with no digest.")
 
         checker = crypto.Checker(self.digest)
-        if not checker.check(self.archive_file):
+        record = self._stream_record()
+        if record is not None and record['hash_name'] == checker.hash_name:
+            matches = checker.check_sum(record['sum'])
+        else:
+            matches = checker.check(self.archive_file)
+
+        if not matches:
+            self._discard_stream()
             raise ChecksumError(
                 "%s checksum failed for %s." % (checker.hash_name, self.archive_file),
                 "Expected %s but got %s." % (self.digest, checker.sum))
@@ -248,6 +409,48 @@ class URLFetchStrategy(FetchStrategy):
             return "[no url]"
 
 
+class _ArchiveStream(object):
+    """Hashes an archive, and optionally expands it into expand_dir, as
+       it downloads.  This is the stream function for http.download(),
+       so it is called to start each attempt."""
+    def __init__(self, archive, digest, expand_dir=None):
+        self.archive = archive
+        self.hash_fun = crypto.Checker(digest).hash_fun
+        self.expand_dir = expand_dir
+        self.hasher = None
+        self.expander = None
+
+
+    def __call__(self):
+        self.abort()
+        self.hasher = self.hash_fun()
+        if self.expand_dir:
+            self.expander = compression.StreamExpander(
+                self.archive, self.expand_dir)
+        return self.update
+
+
+    def update(self, chunk):
+        self.hasher.update(chunk)
+        if self.expander:
+            self.expander.write(chunk)
+
+
+    def abort(self):
+        if self.expander:
+            self.expander.abort()
+            self.expander = None
+
+
+    def finish(self):
+        """Wait for expansion to finish, and return a record of what
+           was computed."""
+        expanded = self.expander is not None and self.expander.finish()
+        return { 'hash_name' : self.hasher.name,
+                 'sum'       : self.hasher.hexdigest(),
+                 'expanded'  : expanded }
+
+
 class VCSFetchStrategy(FetchStrategy):
     def __init__(self, name, *rev_types, **kwargs):
         super(VCSFetchStrategy, self).__init__()
@@ -0,0 +1,346 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+An index of the specs installed in a directory layout.
+
+Without it, finding installed packages means walking the install tree,
+reading every ``.spec`` file, and normalizing each spec, which imports
+its packages.  The index is a single JSON file in the install root that
+holds every installed spec as a concrete DAG.  DirectoryLayout keeps it
+up to date when install directories are made and removed, so queries
+only need to read that one file.
+
+Each entry also records the install paths of every node the installed
+spec depends on.  From these the index builds a map from an install path
+to the installed specs that depend on it, so finding the dependents of
+an installed package doesn't require reading every spec.
+
+The root's name, version, compiler and architecture are also stored,
+so that query() can narrow a search to the candidates that can match
+using in-memory indexes.  It only parses and checks those candidates.
+
+Reads of the index hold a shared lock on ``.spack-index.lock`` in the
+install root, and changes hold an exclusive one, so that processes
+sharing an install tree don't lose each other's updates.  Users who
+can't write to the install root read it without a lock, and if the
+index needs rebuilding they rebuild it in memory only.
+
+If the file is missing or unreadable, it is rebuilt by walking the
+install tree.  ``spack reindex`` rebuilds it on request, e.g. after
+installs were made or removed by hand.
+"""
+import os
+import json
+from bisect import bisect_left, bisect_right
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.lock import Lock
+
+import spack.spec
+from spack.version import Version
+from spack.concretize_cache import dump_dag, load_dag
+
+# Name of the index file in the install root.
+index_file_name = '.spack-index.json'
+
+# Name of the file locked while reading or changing the index.
+lock_file_name = '.spack-index.lock'
+
+# Bump this when the format of the entries changes.
+_index_format = 3
+
+
+def _file_id(path):
+    """Inode, mtime and size of a file, which identify its version."""
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+
+class InstallIndex(object):
+    """The specs installed in a DirectoryLayout, keyed by their paths
+       relative to its root."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.path = os.path.join(layout.root, index_file_name)
+        self.lock = Lock(os.path.join(layout.root, lock_file_name))
+
+        # Entries, as read from the file, and specs parsed from them.
+        # They are kept as long as the file's inode, mtime and size
+        # match.  Every write renames a new file into place, so the
+        # inode changes even if the mtime and size don't.
+        self._clear()
+
+
+    def _read(self, force=False):
+        """Load the entries from the index file if it has changed, or
+           always if force is True.  Returns False if it is missing or
+           invalid."""
+        try:
+            stat = _file_id(self.path)
+            if stat == self._stat and not force:
+                return True
+
+            with closing(open(self.path)) as index_file:
+                index = json.load(index_file)
+            if index['format'] != _index_format:
+                return False
+
+            # Keep the specs parsed from entries that didn't change.
+            old_entries, old_specs = self._entries, self._specs
+            self._clear()
+            self._entries = index['installs']
+            for path, spec in old_specs.items():
+                if old_entries.get(path) == self._entries.get(path):
+                    self._specs[path] = spec
+            self._stat = stat
+            return True
+
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return False
+
+
+    def _write(self):
+        index = { 'format'   : _index_format,
+                  'installs' : self._entries }
+
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            with closing(open(tmp_path, 'w')) as index_file:
+                json.dump(index, index_file)
+            os.rename(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._stat = _file_id(self.path)
+
+
+    def _relative_path(self, spec):
+        return self.layout.relative_path_for_spec(spec)
+
+
+    def _clear(self):
+        """Forget everything read from the index."""
+        self._stat = None
+        self._entries = {}
+        self._specs = {}
+        self._dependents = None
+        self._query_index = None
+
+
+    def _changed(self, path):
+        """Forget what was derived from an entry that changed."""
+        self._specs.pop(path, None)
+        self._dependents = None
+        self._query_index = None
+
+
+    def _load(self):
+        """Make sure the entries are current, rebuilding the index if
+           there isn't a valid one."""
+        if not os.path.isdir(self.layout.root):
+            self._clear()
+            return
+
+        with self.lock.read_transaction():
+            if self._read():
+                return
+
+        # Take the write lock without holding the read lock, so that two
+        # processes can't wait on each other to upgrade.  Someone else
+        # may have rebuilt the index in between.
+        try:
+            self.lock.acquire_write()
+        except (IOError, OSError), e:
+            tty.debug("Can't lock install index %s: %s" % (self.path, e))
+            self._clear()
+            self._walk()
+            return
+
+        try:
+            if not self._read():
+                self.rebuild()
+        finally:
+            self.lock.release_write()
+
+
+    def rebuild(self):
+        """Rebuild the index from the spec files in the install tree."""
+        tty.debug("Rebuilding install index %s" % self.path)
+        self._clear()
+        if not os.path.isdir(self.layout.root):
+            return
+
+        with self.lock.write_transaction():
+            self._walk()
+            self._write()
+
+
+    def _walk(self):
+        """Make entries for the spec files in the install tree."""
+        for spec in self.layout.walk_specs():
+            self._entries[self._relative_path(spec)] = self._entry(spec)
+
+
+    def _entry(self, spec):
+        return { 'name'     : spec.name,
+                 'version'  : str(spec.version),
+                 'compiler' : spec.compiler.name,
+                 'arch'     : spec.architecture,
+                 'nodes'    : dump_dag(spec),
+                 'deps'     : sorted(set(self._relative_path(node) for node
+                                         in spec.traverse(root=False))) }
+
+
+    def _spec(self, path):
+        """The spec for an entry, parsed the first time it's needed."""
+        if not path in self._specs:
+            self._specs[path] = load_dag(self._entries[path]['nodes'])
+        return self._specs[path]
+
+
+    def _load_for_update(self):
+        """Read the index from the file unconditionally, or rebuild it.
+           Call this holding the write lock, before changing entries, so
+           that no other process's update is written over."""
+        if not self._read(force=True):
+            self.rebuild()
+
+
+    def add(self, spec):
+        """Record a newly installed spec."""
+        with self.lock.write_transaction():
+            self._load_for_update()
+            path = self._relative_path(spec)
+            self._entries[path] = self._entry(spec)
+            self._changed(path)
+            self._write()
+
+
+    def remove(self, spec):
+        """Forget an uninstalled spec."""
+        with self.lock.write_transaction():
+            self._load_for_update()
+            path = self._relative_path(spec)
+            if path in self._entries:
+                del self._entries[path]
+                self._changed(path)
+                self._write()
+
+
+    def all_specs(self):
+        """All installed specs.  These are concrete, and are shared by
+           callers until the index changes, so they should not be
+           modified."""
+        self._load()
+        return [self._spec(path) for path in sorted(self._entries)]
+
+
+    def dependents(self, spec):
+        """Installed specs that depend on the supplied concrete spec,
+           i.e. that have a node with the same install path."""
+        self._load()
+        if self._dependents is None:
+            self._dependents = {}
+            for path in sorted(self._entries):
+                for dep_path in self._entries[path]['deps']:
+                    self._dependents.setdefault(dep_path, []).append(path)
+
+        dependents = self._dependents.get(self._relative_path(spec), [])
+        return [self._spec(path) for path in dependents]
+
+
+    def _build_query_index(self):
+        """Index entries by name, with versions sorted, and by compiler
+           and architecture."""
+        by_name = {}
+        by_compiler = {}
+        by_arch = {}
+        for path, entry in self._entries.items():
+            by_name.setdefault(entry['name'], []).append(
+                (Version(entry['version']), path))
+            by_compiler.setdefault(entry['compiler'], set()).add(path)
+            by_arch.setdefault(entry['arch'], set()).add(path)
+
+        for name, pairs in by_name.items():
+            pairs.sort()
+            by_name[name] = ([v for v, p in pairs], [p for v, p in pairs])
+
+        self._query_index = (by_name, by_compiler, by_arch)
+
+
+    def _version_candidates(self, name, versions):
+        """Paths of installs of a package whose versions might satisfy
+           versions.  A satisfying version can be a prefix of the lowest
+           requested version (3 satisfies 3.0:) or have the highest as a
+           prefix (3.0.2 satisfies :3.0), so the window is widened for
+           both."""
+        by_name = self._query_index[0]
+        if not name in by_name:
+            return []
+        keys, paths = by_name[name]
+
+        start = 0
+        lowest = versions.lowest()
+        if lowest is not None:
+            start = bisect_left(keys, Version(str(lowest.version[0])))
+
+        end = len(keys)
+        highest = versions.highest()
+        if highest is not None:
+            end = bisect_right(keys, highest)
+            while end < len(keys) and keys[end] in highest:
+                end += 1
+
+        return paths[start:end]
+
+
+    def query(self, spec):
+        """Installed specs that satisfy the supplied spec.  The indexes
+           narrow the search to candidates with the right name, versions,
+           compiler and architecture, and only those are checked with
+           satisfies()."""
+        self._load()
+        if self._query_index is None:
+            self._build_query_index()
+        by_name, by_compiler, by_arch = self._query_index
+
+        if spec.name:
+            candidates = self._version_candidates(spec.name, spec.versions)
+        else:
+            candidates = sorted(self._entries)
+
+        if spec.compiler:
+            in_compiler = by_compiler.get(spec.compiler.name, set())
+            candidates = [p for p in candidates if p in in_compiler]
+
+        if spec.architecture:
+            in_arch = by_arch.get(spec.architecture, set())
+            candidates = [p for p in candidates if p in in_arch]
+
+        return [s for s in (self._spec(path) for path in candidates)
+                if s.satisfies(spec)]
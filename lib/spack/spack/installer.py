@@ -0,0 +1,218 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+This module implements a scheduler that installs the DAGs of concrete
+specs in parallel.  Rather than walking dependencies one at a time,
+the ParallelInstaller keeps track of which nodes in the DAG have all
+of their dependencies installed, and forks a build for each ready node
+as long as fewer than ``jobs`` builds are running.  Each dependent is
+started as soon as its last dependency finishes.
+
+Failure policy:
+
+    If a build fails, no new builds are started, but builds that are
+    already running are allowed to finish.  With ``keep_going``,
+    independent branches of the DAG continue to build, and only the
+    dependents of the failed package are skipped.  Either way, an
+    InstallError naming the failed packages is raised at the end.
+
+Cancellation:
+
+    If the installer is interrupted (e.g. by Ctrl-C), it terminates all
+    running builds, waits for them, and removes their partial prefixes
+    unless ``keep_prefix`` is set.
+"""
+import os
+import time
+import signal
+
+import llnl.util.tty as tty
+
+import spack
+import spack.hooks
+from spack.package import InstallError
+
+# Seconds between checks for finished builds.
+poll_interval = 0.1
+
+
+class ParallelInstaller(object):
+    """Installs the DAGs of a set of concrete specs, building up to
+       ``jobs`` packages at once.  Nodes are identified by their install
+       prefix, so identical dependencies shared by several root specs
+       are only built once.
+    """
+    def __init__(self, specs, **kwargs):
+        self.jobs        = max(1, kwargs.get('jobs', 1))
+        self.keep_prefix = kwargs.get('keep_prefix', False)
+        self.keep_stage  = kwargs.get('keep_stage', False)
+        self.keep_going  = kwargs.get('keep_going', False)
+        self.prefetcher  = kwargs.get('prefetcher', None)
+        self.use_cache   = kwargs.get('use_cache', True)
+
+        # prefix -> spec for every node we still need to install
+        self.specs = {}
+
+        # prefix -> set of prefixes of uninstalled dependencies
+        self.waiting_on = {}
+
+        # prefix -> set of prefixes of nodes that depend on it
+        self.dependents = {}
+
+        for root in specs:
+            if not root.concrete:
+                raise ValueError("Can only install concrete packages.")
+
+            for spec in root.traverse(order='post'):
+                key = str(spec.prefix)
+                if key in self.specs or spack.db.get(spec).installed:
+                    continue
+
+                self.specs[key] = spec
+                self.waiting_on[key] = set()
+                self.dependents.setdefault(key, set())
+
+                for dep in spec.dependencies.values():
+                    dep_key = str(dep.prefix)
+                    if dep_key in self.specs:
+                        self.waiting_on[key].add(dep_key)
+                        self.dependents[dep_key].add(key)
+
+        self.installed = []
+        self.failed    = []
+        self.skipped   = []
+
+
+    def _ready(self):
+        """Sorted list of nodes whose dependencies are all installed."""
+        return sorted((k for k, deps in self.waiting_on.items() if not deps),
+                      key=lambda k: self.specs[k].name)
+
+
+    def _skip_dependents(self, key):
+        """Mark everything that depends on a failed node as skipped."""
+        for dependent in self.dependents[key]:
+            if dependent in self.waiting_on:
+                del self.waiting_on[dependent]
+                self.skipped.append(self.specs[dependent])
+                self._skip_dependents(dependent)
+
+
+    def _start(self, key):
+        """Fork a build for the node with the supplied key."""
+        del self.waiting_on[key]
+        pkg = spack.db.get(self.specs[key])
+        pkg.timer.clear()
+
+        # Create the stage in the parent, so that concurrent builds
+        # don't race to set up the top-level stage directory.
+        pkg.stage
+        return pkg.fork_install(fetch=True,
+                                keep_prefix=self.keep_prefix,
+                                keep_stage=self.keep_stage,
+                                prefetcher=self.prefetcher,
+                                use_cache=self.use_cache)
+
+
+    def _finish(self, key, returncode):
+        """Record the result of a build and release its dependents."""
+        spec = self.specs[key]
+        if returncode != 0:
+            self.failed.append(spec)
+            self._skip_dependents(key)
+            return
+
+        self.installed.append(spec)
+        spack.hooks.post_install(spack.db.get(spec))
+        for dependent in self.dependents[key]:
+            if dependent in self.waiting_on:
+                self.waiting_on[dependent].discard(key)
+
+
+    def _wait(self, running):
+        """Wait for one of the running builds to finish, and return its
+           pid and exit status.  Only our own builds are waited for, so
+           that other children of this process, like prefetch workers,
+           are left to whoever started them."""
+        while True:
+            for pid in running:
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done == pid:
+                    return pid, status
+            time.sleep(poll_interval)
+
+
+    def _cancel(self, running):
+        """Terminate running builds and clean up after them."""
+        for pid in running:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        for pid, key in running.items():
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+            pkg = spack.db.get(self.specs[key])
+            if not self.keep_prefix and os.path.exists(pkg.prefix):
+                pkg.remove_prefix()
+        running.clear()
+
+
+    def install(self):
+        """Build everything, running at most ``jobs`` builds at once.
+           Raises InstallError if any package failed to install."""
+        running = {}    # pid -> key of node being built
+        try:
+            while self.waiting_on or running:
+                stop = self.failed and not self.keep_going
+                if not stop:
+                    for key in self._ready()[:self.jobs - len(running)]:
+                        running[self._start(key)] = key
+
+                if not running:
+                    break
+
+                pid, returncode = self._wait(running)
+                self._finish(running.pop(pid), returncode)
+
+        except KeyboardInterrupt:
+            tty.warn("Interrupted.  Stopping %d running builds." % len(running))
+            self._cancel(running)
+            raise
+
+        if self.failed:
+            not_built = [s for s in self.specs.values()
+                         if s not in self.installed and s not in self.failed]
+            msg = "Failed to install %s." % ', '.join(
+                s.name for s in self.failed)
+            long_msg = None
+            if not_built:
+                long_msg = "These packages were not installed: %s" % ', '.join(
+                    sorted(s.name for s in not_built))
+            raise InstallError(msg, long_msg)
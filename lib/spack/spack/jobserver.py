@@ -0,0 +1,185 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A GNU make compatible jobserver shared by all of Spack's builds.
+
+GNU make coordinates parallel sub-makes with a "jobserver": a pipe
+holding one byte (a token) per available job slot.  A make process
+that wants to run an extra job reads a token from the pipe and writes
+it back when the job finishes.  Every make also gets one implicit job
+for free, so Spack reads a token itself before running make, and the
+make it runs inherits that token as its implicit job.  The total
+number of jobs running under Spack's control is therefore capped at
+the number of slots, no matter how many packages build at once.
+
+The jobserver is enabled by setting the number of slots in a spack
+config file::
+
+    [jobserver]
+        slots = 64
+
+The pipe is a named FIFO in ``var/spack``, so separate spack processes
+running on the same node share the same slots.  Whichever process
+opens the FIFO first fills it with tokens.  Processes forked by Spack
+(builds, nested spack invocations) find the open descriptors through
+the ``SPACK_JOBSERVER`` environment variable.
+"""
+import os
+import errno
+import fcntl
+
+import spack
+import spack.config
+from llnl.util.filesystem import join_path, mkdirp
+
+"""Environment variable holding the jobserver's read and write fds."""
+SPACK_JOBSERVER = 'SPACK_JOBSERVER'
+
+"""Named FIFO shared by all spack processes on a node."""
+jobserver_path = join_path(spack.var_path, 'jobserver')
+
+# The jobserver for this process, set up by get_jobserver().
+_jobserver = None
+
+
+class Jobserver(object):
+    """Holds the file descriptors for a jobserver pipe."""
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+
+
+    @property
+    def makeflags(self):
+        """MAKEFLAGS telling GNU make to join this jobserver.  Newer makes
+           call the option --jobserver-auth but still accept this one."""
+        return "-j --jobserver-fds=%d,%d" % (self.read_fd, self.write_fd)
+
+
+    def acquire(self):
+        """Block until a token is available and return it."""
+        while True:
+            try:
+                token = os.read(self.read_fd, 1)
+                if token:
+                    return token
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise
+
+
+    def release(self, token):
+        """Return a token to the jobserver."""
+        os.write(self.write_fd, token)
+
+
+def _configured_slots():
+    config = spack.config.get_config()
+    if not config.has_value('jobserver', None, 'slots'):
+        return None
+    return int(config.get_value('jobserver', None, 'slots'))
+
+
+def _open_fifo(slots):
+    """Open the shared FIFO, filling it with tokens if we are its
+       first user.  Users hold a shared lock on <fifo>.users for as
+       long as they have the FIFO open; initialization is serialized
+       by an exclusive lock on <fifo>.init.
+    """
+    mkdirp(os.path.dirname(jobserver_path))
+    try:
+        os.mkfifo(jobserver_path)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    init_fd  = os.open(jobserver_path + '.init',  os.O_RDWR | os.O_CREAT)
+    users_fd = os.open(jobserver_path + '.users', os.O_RDWR | os.O_CREAT)
+
+    # O_RDWR keeps the open from blocking until there's a writer.
+    fifo_fd = os.open(jobserver_path, os.O_RDWR)
+
+    fcntl.flock(init_fd, fcntl.LOCK_EX)
+    try:
+        try:
+            fcntl.flock(users_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            first_user = True
+        except IOError:
+            first_user = False
+
+        if first_user:
+            # Nobody else is using the FIFO, so any tokens left in it are
+            # stale.  Drain it and refill it with one token per slot.
+            flags = fcntl.fcntl(fifo_fd, fcntl.F_GETFL)
+            fcntl.fcntl(fifo_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            try:
+                while os.read(fifo_fd, 4096):
+                    pass
+            except OSError, e:
+                if e.errno != errno.EAGAIN:
+                    raise
+            fcntl.fcntl(fifo_fd, fcntl.F_SETFL, flags)
+            os.write(fifo_fd, '+' * slots)
+
+        fcntl.flock(users_fd, fcntl.LOCK_SH)
+    finally:
+        fcntl.flock(init_fd, fcntl.LOCK_UN)
+        os.close(init_fd)
+
+    # users_fd stays open (and locked) for the life of the process.
+    return Jobserver(fifo_fd, fifo_fd)
+
+
+def _inherited():
+    """Return the jobserver inherited from a parent spack, if any."""
+    fds = os.environ.get(SPACK_JOBSERVER)
+    if not fds:
+        return None
+
+    try:
+        read_fd, write_fd = [int(fd) for fd in fds.split(',')]
+        os.fstat(read_fd)
+        os.fstat(write_fd)
+    except (ValueError, OSError):
+        return None
+    return Jobserver(read_fd, write_fd)
+
+
+def get_jobserver():
+    """Return this process's Jobserver, or None if none is configured."""
+    global _jobserver
+    if _jobserver is None:
+        _jobserver = _inherited()
+
+        if _jobserver is None:
+            slots = _configured_slots()
+            if slots:
+                _jobserver = _open_fifo(slots)
+
+        if _jobserver is not None:
+            os.environ[SPACK_JOBSERVER] = "%d,%d" % (
+                _jobserver.read_fd, _jobserver.write_fd)
+
+    return _jobserver
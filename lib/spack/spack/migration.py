@@ -0,0 +1,191 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Moves an install tree from one directory layout to another, e.g. to
+change the length of the hashes in prefix names, or to switch to a
+HashShardedDirectoryLayout.
+
+Each prefix is moved to its path in the new layout, and references to
+the old prefixes of the package and its dependencies are relocated as
+they are when extracting from the build cache; see
+spack.build_cache.relocate_paths().  Prefixes are moved concurrently in
+``jobs`` processes.
+
+A migration that fails part way can be run again: prefixes that were
+already moved are skipped.  Module files for the moved packages are
+written again so they point to the new prefixes.
+"""
+import os
+import shutil
+import multiprocessing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
+from llnl.util.lock import LockError
+
+import spack
+import spack.error
+import spack.hooks
+import spack.build_cache
+
+# Seconds to wait for an install or uninstall of a prefix to finish.
+# Those can wait in turn for the index lock held by the migration, so
+# don't wait forever.
+prefix_lock_timeout = 10
+
+
+def _move_prefix(args):
+    """Move the prefix paths[0][0] to paths[0][1] and relocate it, holding
+       write locks on both.  args is (paths, old_lock, new_lock); paths
+       are the old and new prefixes of each node in its DAG.  Returns an
+       error message, or None on success.  Runs in a worker process.
+    """
+    paths, old_lock, new_lock = args
+    old, new = paths[0]
+    try:
+        old_lock.acquire_write(prefix_lock_timeout)
+        try:
+            new_lock.acquire_write(prefix_lock_timeout)
+            try:
+                if not os.path.isdir(old):
+                    if os.path.isdir(new):
+                        return None
+                    return "%s does not exist." % old
+
+                mkdirp(os.path.dirname(new))
+                shutil.move(old, new)
+                spack.build_cache.relocate_paths(new, paths)
+                return None
+
+            finally:
+                new_lock.release_write()
+        finally:
+            old_lock.release_write()
+
+    except (IOError, OSError), e:
+        return "Could not move %s to %s: %s" % (old, new, e)
+
+    except LockError, e:
+        return "Could not lock %s or %s: %s" % (old, new, e)
+
+
+def _run_hook(hook, specs):
+    for spec in specs:
+        try:
+            hook(spec.package)
+        except spack.error.SpackError, e:
+            tty.warn("Could not update module files for %s" % spec, e.message)
+
+
+def _regenerate_modules(specs, old_layout, new_layout):
+    """Run the uninstall hooks for specs in old_layout and the install
+       hooks in new_layout, so module files point to the new prefixes."""
+    install_layout = spack.install_layout
+    try:
+        spack.install_layout = old_layout
+        _run_hook(spack.hooks.post_uninstall, specs)
+
+        spack.install_layout = new_layout
+        _run_hook(spack.hooks.post_install, specs)
+    finally:
+        spack.install_layout = install_layout
+
+
+def migrate(old_layout, new_layout, **kwargs):
+    """Move every spec installed in old_layout to new_layout, which
+       must have the same root.  Returns the specs that were moved.
+
+       Options:
+       jobs[=1]
+           Number of processes to move prefixes in.
+    """
+    jobs = kwargs.get('jobs', 1)
+
+    if new_layout.root != old_layout.root:
+        raise MigrationError("Can only migrate an install tree in place.")
+
+    # Both layouts read and write the same index file, so they must use
+    # the same lock.  See llnl.util.lock.
+    new_layout.index.lock = old_layout.index.lock
+
+    with old_layout.index.lock.write_transaction():
+        specs = old_layout.all_specs()
+
+        moves = []
+        moved_specs = []
+        by_new_path = {}
+        for spec in specs:
+            paths = [(old_layout.path_for_spec(node),
+                      new_layout.path_for_spec(node))
+                     for node in spec.traverse()]
+            new_path = paths[0][1]
+            if new_path in by_new_path:
+                raise MigrationError(
+                    "%s and %s would have the same prefix, %s."
+                    % (by_new_path[new_path], spec, new_path),
+                    "Use a longer hash.")
+            by_new_path[new_path] = spec
+            if paths[0][0] != new_path:
+                moves.append((paths, old_layout.prefix_lock(spec),
+                              new_layout.prefix_lock(spec)))
+                moved_specs.append(spec)
+
+        tty.msg("Moving %d of %d installed packages."
+                % (len(moves), len(specs)))
+        if jobs > 1 and len(moves) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(moves)))
+            try:
+                errors = pool.map(_move_prefix, moves)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            errors = [_move_prefix(args) for args in moves]
+
+        for paths, old_lock, new_lock in moves:
+            old_layout.remove_empty_parents(paths[0][0])
+
+        _regenerate_modules(
+            [s for s, e in zip(moved_specs, errors) if e is None],
+            old_layout, new_layout)
+
+        # The old index still lists the moved packages, so running the
+        # migration again will finish the job.
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise MigrationError(
+                "Could not move %d packages." % len(errors),
+                '\n'.join(errors))
+
+        new_layout.write_layout_file()
+        new_layout.index.rebuild()
+
+    return specs
+
+
+class MigrationError(spack.error.SpackError):
+    """Raised when an install tree can't be migrated."""
+    def __init__(self, message, long_message=None):
+        super(MigrationError, self).__init__(message, long_message)
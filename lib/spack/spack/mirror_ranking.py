@@ -0,0 +1,240 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Decides which mirrors to fetch an archive from, and in what order.
+
+Rather than trying each configured mirror in turn, paying a full
+timeout for each one that is down, rank() sends a HEAD request for the
+archive to every HTTP mirror at once.  Mirrors that have it are tried
+fastest first, and mirrors that don't are skipped.  file:// mirrors are
+checked on the filesystem.  Mirrors that can't be probed, e.g. ftp
+ones, are tried after the others, in their configured order.
+
+The latency and failures of each mirror are saved in
+``var/spack/cache/mirrors.json``, so they carry across spack runs.
+Latency is averaged over recent probes, so one slow answer doesn't send
+a mirror to the back.  A mirror that fails to answer is demoted: until
+a retry delay has passed, it isn't probed, and it is tried after all
+the other mirrors, in case it is back and nothing else has the
+archive.  The delay doubles with each consecutive failure, up to a day.
+
+Set ``spack.use_mirror_ranking`` to False to try mirrors in order
+without probing them.
+"""
+import os
+import json
+import time
+import threading
+import urlparse
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
+from llnl.util.lock import Lock
+
+import spack
+import spack.util.http as http
+
+# Seconds to wait for mirrors to answer a probe.  Slower mirrors are
+# treated as failed.
+probe_timeout = 5
+
+# Seconds before a mirror that failed once is probed again, and the
+# longest delay after repeated failures.
+retry_delay = 60
+max_retry_delay = 24 * 60 * 60
+
+# Weight of a new latency in a mirror's average latency.
+latency_weight = 0.3
+
+# Statuses from servers that don't answer HEAD requests.
+_head_unsupported = (405, 501)
+
+
+def mirror_url(mirror, path):
+    """URL of path within a mirror."""
+    return "%s/%s" % (mirror, path)
+
+
+def load_stats():
+    """Statistics for each mirror, as a dict from mirror URL to a dict
+       with its average ``latency``, number of consecutive ``failures``,
+       and the time of its ``last_failure``."""
+    try:
+        with closing(open(spack.mirror_stats_path)) as stats_file:
+            stats = json.load(stats_file)
+        if isinstance(stats, dict):
+            return stats
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def record(results):
+    """Update the saved statistics with a dict from mirror URL to the
+       latency of its latest answer, or None if it failed.  Returns the
+       updated statistics."""
+    path = spack.mirror_stats_path
+    now = time.time()
+    try:
+        mkdirp(os.path.dirname(path))
+        with Lock(path + '.lock').write_transaction():
+            stats = load_stats()
+            for mirror, latency in results.items():
+                entry = stats.setdefault(
+                    mirror, { 'latency' : None, 'failures' : 0,
+                              'last_failure' : None })
+                if latency is None:
+                    entry['failures'] += 1
+                    entry['last_failure'] = now
+                else:
+                    entry['failures'] = 0
+                    entry['last_failure'] = None
+                    if entry['latency'] is None:
+                        entry['latency'] = latency
+                    else:
+                        entry['latency'] += (
+                            latency_weight * (latency - entry['latency']))
+
+            tmp_path = "%s.%d.tmp" % (path, os.getpid())
+            with closing(open(tmp_path, 'w')) as stats_file:
+                json.dump(stats, stats_file)
+            os.rename(tmp_path, path)
+            return stats
+
+    except (IOError, OSError), e:
+        # The statistics are only an optimization.
+        tty.debug("Could not save mirror statistics to %s: %s" % (path, e))
+        return load_stats()
+
+
+def demoted(entry, now=None):
+    """True if a mirror with these statistics failed too recently to be
+       probed again."""
+    if not entry or not entry.get('failures'):
+        return False
+    if now is None:
+        now = time.time()
+    delay = min(retry_delay * 2 ** (entry['failures'] - 1), max_retry_delay)
+    return now - entry['last_failure'] < delay
+
+
+def _can_probe(url):
+    scheme = urlparse.urlparse(url)[0]
+    if scheme == 'file':
+        return True
+    return spack.use_native_fetch and http.supports(
+        url, verify_ssl=spack.verify_ssl)
+
+
+class _Probe(threading.Thread):
+    """Checks in the background whether a mirror has a file.  Afterwards
+       status is 'found', 'missing', 'failed', or 'unknown' if the
+       mirror can't say, and latency is how long it took to answer."""
+    def __init__(self, mirror, url):
+        super(_Probe, self).__init__()
+        self.daemon = True
+        self.mirror = mirror
+        self.url = url
+        self.status = 'failed'
+        self.latency = None
+
+
+    def run(self):
+        start = time.time()
+        scheme, netloc, path = urlparse.urlparse(self.url)[:3]
+        if scheme == 'file':
+            if os.path.isfile(path):
+                self.status = 'found'
+            elif os.path.isdir(os.path.dirname(path)):
+                self.status = 'missing'
+            else:
+                self.status = 'failed'
+        else:
+            try:
+                http.head(self.url, verify_ssl=spack.verify_ssl)
+                self.status = 'found'
+            except http.HTTPError, e:
+                if e.status in _head_unsupported:
+                    self.status = 'unknown'
+                elif e.status is not None and e.status < 500:
+                    self.status = 'missing'
+                else:
+                    self.status = 'failed'
+        self.latency = time.time() - start
+
+
+def rank(mirrors, path):
+    """URLs of path in the mirrors that may have it, in the order they
+       should be tried."""
+    if not spack.use_mirror_ranking or not mirrors:
+        return [mirror_url(m, path) for m in mirrors]
+
+    stats = load_stats()
+    now = time.time()
+
+    probes = []
+    unprobed = []
+    demoted_urls = []
+    for mirror in mirrors:
+        url = mirror_url(mirror, path)
+        if demoted(stats.get(mirror), now):
+            tty.debug("Trying mirror %s last; it failed recently." % mirror)
+            demoted_urls.append(url)
+        elif _can_probe(url):
+            probes.append(_Probe(mirror, url))
+        else:
+            unprobed.append(url)
+
+    for probe in probes:
+        probe.start()
+
+    # Probes still running at the deadline are left to finish on their
+    # own, and count as failures.
+    deadline = now + probe_timeout
+    for probe in probes:
+        probe.join(max(0, deadline - time.time()))
+
+    results = {}
+    found = []
+    unknown = []
+    for probe in probes:
+        if probe.isAlive() or probe.status == 'failed':
+            tty.debug("Mirror %s did not answer." % probe.mirror)
+            results[probe.mirror] = None
+            demoted_urls.append(probe.url)
+        else:
+            results[probe.mirror] = probe.latency
+            if probe.status == 'found':
+                found.append(probe)
+            elif probe.status == 'unknown':
+                unknown.append(probe.url)
+
+    if results:
+        stats = record(results)
+
+    found.sort(key=lambda p: (stats.get(p.mirror, {}).get('latency')
+                              or p.latency))
+    return [probe.url for probe in found] + unknown + unprobed + demoted_urls
@@ -53,14 +53,20 @@ import spack.hooks
 import spack.build_environment as build_env
 import spack.url as url
 import spack.fetch_strategy as fs
+import spack.build_cache as build_cache
+import spack.jobserver
 from spack.version import *
 from spack.stage import Stage
 from spack.util.web import get_pages
+from spack.util.timer import PhaseTimer
 from spack.util.compression import allowed_archive, extension
 
 """Allowed URL schemes for spack packages."""
 _ALLOWED_URL_SCHEMES = ["http", "https", "ftp", "file", "git"]
 
+"""Name of the file in each install prefix that records phase times."""
+timings_file_name = '.timings'
+
 
 class Package(object):
     """This is the superclass for all spack packages.
@@ -375,6 +381,9 @@ class Package(object):
         # Init fetch strategy to None
         self._fetcher = None
 
+        # Wall and CPU time spent in each phase of the install.
+        self.timer = PhaseTimer()
+
         # Set a default list URL (place to find available versions)
         if not hasattr(self, 'list_url'):
             self.list_url = None
@@ -390,7 +399,7 @@ class Package(object):
         return self.spec.versions[0]
 
 
-    @memoized
+    @memoized(maxsize=256)
     def version_urls(self):
         """Return a list of URLs for different versions of this
            package, sorted by version.  A version's URL only appears
@@ -561,18 +570,24 @@ class Package(object):
 
     @property
     def installed(self):
+        """True if the prefix exists.  This doesn't wait for another
+           process that is installing or uninstalling the package;
+           fork_install() checks again with the prefix lock held."""
         return os.path.isdir(self.prefix)
 
 
+    @property
+    def prefix_lock(self):
+        """Lock held while this package's prefix is created or removed.
+           See DirectoryLayout.prefix_lock()."""
+        return spack.install_layout.prefix_lock(self.spec)
+
+
     @property
     def installed_dependents(self):
         """Return a list of the specs of all installed packages that depend
            on this one."""
-        dependents = []
-        for spec in spack.db.installed_package_specs():
-            if self.name != spec.name and self.spec in spec:
-                dependents.append(spec)
-        return dependents
+        return spack.install_layout.installed_dependents(self.spec)
 
 
     @property
@@ -618,10 +633,12 @@ class Package(object):
                 "Add a checksum to the package file, or use --no-checksum to "
                 "skip this check.")
 
-        self.stage.fetch()
+        with self.timer.phase('fetch'):
+            self.stage.fetch()
 
         if spack.do_checksum and self.version in self.versions:
-            self.stage.check()
+            with self.timer.phase('checksum'):
+                self.stage.check()
 
 
     def do_stage(self):
@@ -634,7 +651,8 @@ class Package(object):
 
         archive_dir = self.stage.source_path
         if not archive_dir:
-            self.stage.expand_archive()
+            with self.timer.phase('expand'):
+                self.stage.expand_archive()
             tty.msg("Created stage in %s." % self.stage.path)
         else:
             tty.msg("Already staged %s in %s." % (self.name, self.stage.path))
@@ -680,7 +698,8 @@ class Package(object):
                 for patch in patch_list:
                     tty.msg('Applying patch %s' % patch.path_or_url)
                     try:
-                        patch.apply(self.stage)
+                        with self.timer.phase('patch'):
+                            patch.apply(self.stage)
                     except:
                         # Touch bad file if anything goes wrong.
                         touch(bad_file)
@@ -696,98 +715,213 @@ class Package(object):
     def do_install(self, **kwargs):
         """This class should call this version of the install method.
            Package implementations should override install().
+
+           If ``jobs`` is greater than one, dependencies are built
+           concurrently by a ParallelInstaller; see spack.installer.
+           If ``prefetch_jobs`` is greater than zero, sources for the
+           whole DAG are fetched in the background; see spack.prefetch.
+           Unless ``use_cache`` is False, packages are installed from
+           and added to the binary build cache; see spack.build_cache.
         """
         # whether to keep the prefix on failure.  Default is to destroy it.
         keep_prefix = kwargs.get('keep_prefix', False)
         keep_stage  = kwargs.get('keep_stage', False)
         ignore_deps = kwargs.get('ignore_deps', False)
+        jobs        = kwargs.get('jobs', 1)
+        keep_going  = kwargs.get('keep_going', False)
+        prefetch_jobs = kwargs.get('prefetch_jobs', 0)
+        prefetcher  = kwargs.get('prefetcher', None)
+        use_cache   = kwargs.get('use_cache', True)
 
         if not self.spec.concrete:
             raise ValueError("Can only install concrete packages.")
 
-        if os.path.exists(self.prefix):
+        if self.installed:
             tty.msg("%s is already installed in %s." % (self.name, self.prefix))
             return
 
-        if not ignore_deps:
-            self.do_install_dependencies()
+        self.timer.clear()
+
+        if prefetch_jobs > 0 and prefetcher is None:
+            # Imported here to avoid a circular import.
+            from spack.prefetch import Prefetcher
+            specs = [self.spec] if not ignore_deps else []
+            prefetcher = Prefetcher(specs, jobs=prefetch_jobs)
+            prefetcher.start()
+            try:
+                self.do_install(**dict(kwargs, prefetcher=prefetcher))
+            except:
+                prefetcher.terminate()
+                raise
+            prefetcher.join()
+            return
+
+        if jobs > 1 and not ignore_deps:
+            # Imported here to avoid a circular import.
+            from spack.installer import ParallelInstaller
+            ParallelInstaller([self.spec], jobs=jobs,
+                              keep_prefix=keep_prefix,
+                              keep_stage=keep_stage,
+                              keep_going=keep_going,
+                              prefetcher=prefetcher,
+                              use_cache=use_cache).install()
+            return
 
+        if not ignore_deps:
+            self.do_install_dependencies(prefetcher=prefetcher,
+                                         use_cache=use_cache)
+
+        if use_cache:
+            with self.prefix_lock.write_transaction():
+                extracted = (not os.path.isdir(self.prefix) and
+                             build_cache.extract(self))
+            if extracted:
+                spack.hooks.post_install(self)
+                return
+
+        if prefetcher:
+            prefetcher.wait(self)
         self.do_patch()
 
-        # Fork a child process to do the build.  This allows each
-        # package authors to have full control over their environment,
-        # etc. without offecting other builds that might be executed
-        # in the same spack call.
-        try:
-            pid = os.fork()
-        except OSError, e:
-            raise InstallError("Unable to fork build process: %s" % e)
+        # Parent process just waits for the child to complete.  If the
+        # child exited badly, assume it already printed an appropriate
+        # message.  Just make the parent exit with an error code.
+        pid = self.fork_install(keep_prefix=keep_prefix, keep_stage=keep_stage,
+                                use_cache=use_cache)
+        pid, returncode = os.waitpid(pid, 0)
+        if returncode != 0:
+            sys.exit(1)
 
-        if pid == 0:
-            try:
-                tty.msg("Building %s." % self.name)
 
-                # create the install directory.  The install layout
-                # handles this in case so that it can use whatever
-                # package naming scheme it likes.
-                spack.install_layout.make_path_for_spec(self.spec)
+        # Once everything else is done, run post install hooks
+        spack.hooks.post_install(self)
 
-                # Set up process's build environment before running install.
-                build_env.set_compiler_environment_variables(self)
-                build_env.set_build_environment_variables(self)
-                build_env.set_module_variables_for_package(self)
 
-                # Subclasses implement install() to do the real work.
-                self.install(self.spec, self.prefix)
+    def fork_install(self, **kwargs):
+        """Fork a child process to do the build and return its pid.  The
+           caller is responsible for calling os.waitpid() on the child.
 
-                # Ensure that something was actually installed.
-                if not os.listdir(self.prefix):
-                    raise InstallError(
-                        "Install failed for %s.  Nothing was installed!"
-                        % self.name)
+           This allows each package authors to have full control over
+           their environment, etc. without offecting other builds that
+           might be executed in the same spack call.
 
-                # On successful install, remove the stage.
-                if not keep_stage:
-                    self.stage.destroy()
+           If ``fetch`` is True, the child first tries to install the
+           package from the build cache.  Failing that, it fetches,
+           stages, and patches the package before building it, after
+           waiting for ``prefetcher`` to download it if one is supplied.
+           Otherwise the caller must already have called do_patch().
 
-                tty.msg("Successfully installed %s" % self.name)
-                print_pkg(self.prefix)
+           If ``use_cache`` is True, the child adds the newly built
+           package to the build cache, if one is configured.
 
-                # Use os._exit here to avoid raising a SystemExit exception,
-                # which interferes with unit tests.
-                os._exit(0)
+           The child holds the package's prefix lock while it installs,
+           and does nothing if another process installed the package
+           first.
+        """
+        keep_prefix = kwargs.get('keep_prefix', False)
+        keep_stage  = kwargs.get('keep_stage', False)
+        fetch       = kwargs.get('fetch', False)
+        prefetcher  = kwargs.get('prefetcher', None)
+        use_cache   = kwargs.get('use_cache', True)
 
-            except:
-                if not keep_prefix:
-                    # If anything goes wrong, remove the install prefix
-                    self.remove_prefix()
-                else:
-                    tty.warn("Keeping install prefix in place despite error.",
-                             "Spack will think this package is installed." +
-                             "Manually remove this directory to fix:",
-                             self.prefix)
+        # Join the jobserver before forking so all builds share it.
+        spack.jobserver.get_jobserver()
 
-                # Child doesn't raise or return to main spack code.
-                # Just runs default exception handler and exits.
-                sys.excepthook(*sys.exc_info())
-                os._exit(1)
+        try:
+            pid = os.fork()
+        except OSError, e:
+            raise InstallError("Unable to fork build process: %s" % e)
 
-        # Parent process just waits for the child to complete.  If the
-        # child exited badly, assume it already printed an appropriate
-        # message.  Just make the parent exit with an error code.
-        pid, returncode = os.waitpid(pid, 0)
-        if returncode != 0:
-            sys.exit(1)
+        if pid != 0:
+            return pid
+
+        try:
+            with self.prefix_lock.write_transaction():
+                if os.path.isdir(self.prefix):
+                    tty.msg("%s was installed by another process."
+                            % self.name)
+                else:
+                    self._install_in_child(keep_prefix, keep_stage, fetch,
+                                           prefetcher, use_cache)
 
+            # Use os._exit here to avoid raising a SystemExit exception,
+            # which interferes with unit tests.
+            os._exit(0)
 
-        # Once everything else is done, run post install hooks
-        spack.hooks.post_install(self)
+        except:
+            # Child doesn't raise or return to main spack code.
+            # Just runs default exception handler and exits.
+            sys.excepthook(*sys.exc_info())
+            os._exit(1)
 
 
-    def do_install_dependencies(self):
+    def _install_in_child(self, keep_prefix, keep_stage, fetch, prefetcher,
+                          use_cache):
+        """The part of fork_install() that runs in the child, with the
+           prefix lock held."""
+        try:
+            if fetch:
+                if use_cache and build_cache.extract(self):
+                    return
+                if prefetcher:
+                    prefetcher.wait(self)
+                self.do_patch()
+
+            tty.msg("Building %s." % self.name)
+
+            # create the install directory.  The install layout
+            # handles this in case so that it can use whatever
+            # package naming scheme it likes.
+            spack.install_layout.make_path_for_spec(self.spec)
+
+            # Set up process's build environment before running install.
+            build_env.set_compiler_environment_variables(self)
+            build_env.set_build_environment_variables(self)
+            build_env.set_module_variables_for_package(self)
+
+            # Subclasses implement install() to do the real work.
+            with self.timer.phase('install'):
+                self.install(self.spec, self.prefix)
+
+            # Ensure that something was actually installed.
+            if not os.listdir(self.prefix):
+                raise InstallError(
+                    "Install failed for %s.  Nothing was installed!"
+                    % self.name)
+
+            # Record where the time went, next to the .spec file.
+            self.timer.write(join_path(self.prefix, timings_file_name))
+
+            if use_cache:
+                try:
+                    build_cache.create(self)
+                except (IOError, OSError, build_cache.BuildCacheError), e:
+                    tty.warn("Could not add %s to build cache." % self.name,
+                             getattr(e, 'message', None) or str(e))
+
+            # On successful install, remove the stage.
+            if not keep_stage:
+                self.stage.destroy()
+
+            tty.msg("Successfully installed %s" % self.name)
+            print_pkg(self.prefix)
+
+        except:
+            if not keep_prefix:
+                # If anything goes wrong, remove the install prefix
+                self.remove_prefix()
+            else:
+                tty.warn("Keeping install prefix in place despite error.",
+                         "Spack will think this package is installed." +
+                         "Manually remove this directory to fix:",
+                         self.prefix)
+            raise
+
+
+    def do_install_dependencies(self, **kwargs):
         # Pass along paths of dependencies here
         for dep in self.spec.dependencies.values():
-            dep.package.do_install()
+            dep.package.do_install(**kwargs)
 
 
     @property
@@ -807,18 +941,19 @@ class Package(object):
     def do_uninstall(self, **kwargs):
         force = kwargs.get('force', False)
 
-        if not self.installed:
-            raise InstallError(str(self.spec) + " is not installed.")
+        with self.prefix_lock.write_transaction():
+            if not self.installed:
+                raise InstallError(str(self.spec) + " is not installed.")
 
-        if not force:
-            deps = self.installed_dependents
-            formatted_deps = [s.format('$_$@$%@$+$=$#') for s in deps]
-            if deps: raise InstallError(
-                "Cannot uninstall %s." % self.spec,
-                "The following installed packages depend on it: %s" %
-                ' '.join(formatted_deps))
+            if not force:
+                deps = self.installed_dependents
+                formatted_deps = [s.format('$_$@$%@$+$=$#') for s in deps]
+                if deps: raise InstallError(
+                    "Cannot uninstall %s." % self.spec,
+                    "The following installed packages depend on it: %s" %
+                    ' '.join(formatted_deps))
 
-        self.remove_prefix()
+            self.remove_prefix()
         tty.msg("Successfully uninstalled %s." % self.spec.short_spec)
 
         # Once everything else is done, run post install hooks
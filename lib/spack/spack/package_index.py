@@ -0,0 +1,261 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+An on-disk index of the metadata declared by each package.
+
+The directives in ``spack.relations`` (``version``, ``depends_on``,
+``provides`` and ``patch``) only run when a package's ``package.py``
+is imported.  Queries over the whole repository, like finding the
+providers of a virtual package or graphing all dependencies, used to
+import every package to read them.  This module imports each package
+once, saves what its directives declared in a JSON file, and answers
+those queries from the file afterwards.
+
+Each entry records the mtime, size and sha1 of the ``package.py`` it
+came from.  When the index is loaded, files whose mtime or size changed
+are hashed again, and only packages whose contents actually changed are
+re-imported.  Packages added to or removed from the repository are
+added to or removed from the index.
+
+The file also holds a ProviderIndex of every package, which
+PackageDB.providers_for() uses.
+
+The index for a repository lives in ``spack.package_index_path``.
+``spack purge`` removes it.
+"""
+import os
+import json
+import shutil
+import hashlib
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import join_path, mkdirp, file_stat
+
+import spack
+import spack.spec
+from spack.version import Version
+from spack.virtual import ProviderIndex
+
+# Bump this when the format of the entries changes.
+_index_format = 3
+
+
+def _sha1(path):
+    """sha1 of the contents of a file."""
+    sha = hashlib.sha1()
+    with closing(open(path, 'rb')) as f:
+        sha.update(f.read())
+    return sha.hexdigest()
+
+
+def package_metadata(pkg_class):
+    """Convert the metadata declared by a package class to a dict that
+       can be written as JSON.
+    """
+    versions = {}
+    for version, kwargs in pkg_class.versions.items():
+        versions[str(version)] = dict((k, str(v)) for k, v in kwargs.items())
+
+    patches = {}
+    for when, patch_list in pkg_class.patches.items():
+        patches[str(when)] = [[p.path_or_url, p.level] for p in patch_list]
+
+    return {
+        'versions'     : versions,
+        'dependencies' : dict((name, str(spec)) for name, spec
+                              in pkg_class.dependencies.items()),
+        'provided'     : [[str(provided), str(provider)] for provided, provider
+                          in pkg_class.provided.items()],
+        'patches'      : patches,
+        'url'          : getattr(pkg_class, 'url', None),
+        'homepage'     : getattr(pkg_class, 'homepage', None),
+        'doc'          : pkg_class.__doc__
+    }
+
+
+class PackageMetadata(object):
+    """Metadata for one package, read from the index.  This has the same
+       attributes as a package class for the things the index records,
+       so it can stand in for one in queries.  Specs and versions are
+       only parsed when they are asked for.
+    """
+    def __init__(self, name, data):
+        self.name = name
+        self.url = data['url']
+        self.homepage = data['homepage']
+        self.__doc__ = data['doc']
+        self._data = data
+
+
+    @property
+    def versions(self):
+        return dict((Version(v), kwargs)
+                    for v, kwargs in self._data['versions'].items())
+
+
+    @property
+    def dependency_names(self):
+        return sorted(self._data['dependencies'])
+
+
+    @property
+    def dependencies(self):
+        return dict((name, spack.spec.Spec(spec)) for name, spec
+                    in self._data['dependencies'].items())
+
+
+    @property
+    def provided_names(self):
+        return sorted(set(spack.spec.Spec(provided).name for provided, provider
+                          in self._data['provided']))
+
+
+    @property
+    def provided(self):
+        return dict((spack.spec.Spec(provided), spack.spec.Spec(provider))
+                    for provided, provider in self._data['provided'])
+
+
+    @property
+    def patches(self):
+        """Patches as {when spec : [(path or url, level)]}.  These are not
+           Patch objects, which check that their files exist."""
+        return dict((spack.spec.Spec(when), [tuple(p) for p in patch_list])
+                    for when, patch_list in self._data['patches'].items())
+
+
+class PackageIndex(object):
+    """Metadata for all the packages in a PackageDB, read from an index
+       file and brought up to date with the repository when loaded.
+
+       The index also holds a ProviderIndex of all the packages, which
+       is updated only for the packages that changed.
+    """
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.entries = {}
+        self.providers = None
+        self.rebuilt = []
+        self._load()
+
+
+    def _read(self):
+        """Contents of the index file, or None if it is missing or
+           invalid."""
+        try:
+            with closing(open(self.path)) as index_file:
+                index = json.load(index_file)
+            if index['format'] != _index_format or index['root'] != self.db.root:
+                return None
+            return index
+
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+    def _load(self):
+        index = self._read()
+        if index is None:
+            old_entries = {}
+            self.providers = ProviderIndex([])
+        else:
+            old_entries = index['packages']
+            self.providers = ProviderIndex.from_dict(index['providers'])
+
+        removed = set(old_entries) - set(self.db.all_package_names())
+        changed = set(removed)
+
+        for name in self.db.all_package_names():
+            path = self.db.filename_for_package_name(name)
+            stat = file_stat(path)
+
+            entry = old_entries.get(name)
+            if entry is None or entry['stat'] != stat:
+                sha1 = _sha1(path)
+                if entry is None or entry['sha1'] != sha1:
+                    pkg_class = self.db.get_class_for_package_name(name)
+                    entry = { 'sha1'     : sha1,
+                              'metadata' : package_metadata(pkg_class) }
+                    self.rebuilt.append(name)
+                entry['stat'] = stat
+                changed.add(name)
+
+            self.entries[name] = entry
+
+        for name in removed:
+            self.providers.remove_provider(name)
+
+        for name in self.rebuilt:
+            if name in old_entries:
+                self.providers.remove_provider(name)
+            self.providers.add_provided(spack.spec.Spec(name),
+                                        self.get(name).provided)
+
+        if changed:
+            self._write()
+
+
+    def _write(self):
+        index = { 'format'    : _index_format,
+                  'root'      : self.db.root,
+                  'packages'  : self.entries,
+                  'providers' : self.providers.to_dict() }
+
+        # The index is only an optimization, so failing to write it is
+        # not an error.
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            mkdirp(os.path.dirname(self.path))
+            with closing(open(tmp_path, 'w')) as index_file:
+                json.dump(index, index_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError), e:
+            tty.debug("Could not write package index %s: %s" % (self.path, e))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+    def __contains__(self, pkg_name):
+        return pkg_name in self.entries
+
+
+    def get(self, pkg_name):
+        """PackageMetadata for the package with the supplied name."""
+        return PackageMetadata(pkg_name, self.entries[pkg_name]['metadata'])
+
+
+def index_path(root):
+    """Path to the index file for the package repository at root."""
+    return join_path(spack.package_index_path,
+                     hashlib.sha1(root).hexdigest() + '.json')
+
+
+def clear():
+    """Remove the indexes of all package repositories."""
+    if os.path.isdir(spack.package_index_path):
+        shutil.rmtree(spack.package_index_path)
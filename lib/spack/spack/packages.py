@@ -30,11 +30,12 @@ import imp
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import join_path
-from llnl.util.lang import memoized
+from llnl.util.lang import memoized, LRUCache
 
 import spack.error
 import spack.spec
-from spack.virtual import ProviderIndex
+import spack.package_index
+import spack.packed_repo
 from spack.util.naming import mod_to_class, validate_module_name
 
 # Name of module under which packages are imported
@@ -55,11 +56,26 @@ def _autospec(function):
 
 
 class PackageDB(object):
-    def __init__(self, root):
-        """Construct a new package database from a root directory."""
+    def __init__(self, root, **kwargs):
+        """Construct a new package database from a root directory.
+
+           Options:
+           packed[=None]
+               Path to a packed form of the repository (see packed_repo.py).
+               If the file exists, packages are loaded from it.
+
+           cache_size[=spack.package_cache_size]
+               Most package instances to keep.  The least recently used
+               ones are evicted and made again if they're needed.
+        """
         self.root = root
-        self.instances = {}
+        self.instances = LRUCache(
+            kwargs.get('cache_size', spack.package_cache_size))
         self.provider_index = None
+        self._index = None
+
+        self.packed_path = kwargs.get('packed', None)
+        self._packed = None
 
 
     @_autospec
@@ -71,14 +87,16 @@ class PackageDB(object):
             if spec in self.instances:
                 del self.instances[spec]
 
-        if not spec in self.instances:
+        package = self.instances.get(spec)
+        if package is None:
             package_class = self.get_class_for_package_name(spec.name)
             try:
-                self.instances[spec.copy()] = package_class(spec)
+                package = package_class(spec)
             except Exception, e:
                 raise FailedConstructorError(spec.name, e)
+            self.instances[spec.copy()] = package
 
-        return self.instances[spec]
+        return package
 
 
     @_autospec
@@ -95,13 +113,13 @@ class PackageDB(object):
     @_autospec
     def get_installed(self, spec):
         """Get all the installed specs that satisfy the provided spec constraint."""
-        return [s for s in self.installed_package_specs() if s.satisfies(spec)]
+        return spack.install_layout.query(spec)
 
 
     @_autospec
     def providers_for(self, vpkg_spec):
         if self.provider_index is None:
-            self.provider_index = ProviderIndex(self.all_package_names())
+            self.provider_index = self.index.providers
 
         providers = self.provider_index.providers_for(vpkg_spec)
         if not providers:
@@ -109,6 +127,40 @@ class PackageDB(object):
         return providers
 
 
+    @property
+    def packed(self):
+        """The packed repository for this DB, or None if there isn't one."""
+        if self._packed is None:
+            self._packed = False
+            if self.packed_path and os.path.exists(self.packed_path):
+                try:
+                    self._packed = spack.packed_repo.PackedRepository(
+                        self.packed_path)
+                except spack.packed_repo.PackError, e:
+                    tty.warn(e.message, "Loading packages from source.")
+        return self._packed or None
+
+
+    @property
+    def index(self):
+        """Index of the metadata declared by all packages in this DB.
+           It is loaded, and updated for changed packages, on first use."""
+        if self._index is None:
+            self._index = spack.package_index.PackageIndex(
+                self, spack.package_index.index_path(self.root))
+        return self._index
+
+
+    def metadata(self, pkg_name):
+        """Get the versions, dependencies, provided virtual packages,
+           patches and url of a package without importing it.  The
+           result has the same attributes as the package class for
+           these."""
+        if not pkg_name in self.index:
+            raise UnknownPackageError(pkg_name)
+        return self.index.get(pkg_name)
+
+
     def dirname_for_package_name(self, pkg_name):
         """Get the directory name for a particular package.  This is the
            directory that contains its package.py file."""
@@ -130,16 +182,10 @@ class PackageDB(object):
 
 
     def installed_package_specs(self):
-        """Read installed package names straight from the install directory
-           layout.
+        """Read installed package specs from the install directory
+           layout's index.  They are concrete, and so already normal.
         """
-        # Get specs from the directory layout but ensure that they're
-        # all normalized properly.
-        installed = []
-        for spec in spack.install_layout.all_specs():
-            spec.normalize()
-            installed.append(spec)
-        return installed
+        return spack.install_layout.all_specs()
 
 
     def installed_known_package_specs(self):
@@ -152,7 +198,7 @@ class PackageDB(object):
                 yield spec
 
 
-    @memoized
+    @memoized(maxsize=16)
     def all_package_names(self):
         """Generator function for all packages.  This looks for
            ``<pkg_name>/package.py`` files within the root direcotry"""
@@ -162,7 +208,7 @@ class PackageDB(object):
             pkg_file = join_path(pkg_dir, _package_file_name)
             if os.path.isfile(pkg_file):
                 all_package_names.append(pkg_name)
-            all_package_names.sort()
+        all_package_names.sort()
         return all_package_names
 
 
@@ -176,6 +222,8 @@ class PackageDB(object):
         return os.path.exists(self.filename_for_package_name(pkg_name))
 
 
+    # This cache is not bounded: evicting a class and loading the
+    # package again would make a second, different class for it.
     @memoized
     def get_class_for_package_name(self, pkg_name):
         """Get an instance of the class for a particular package.
@@ -186,8 +234,16 @@ class PackageDB(object):
            because we do this dynamically, the method needs to be
            memoized to ensure there is only ONE package class
            instance, per package, per database.
+
+           If the DB is packed and the pack is current for the package
+           file, the class is loaded from the pack without compiling the
+           file.
         """
+        module_name = _imported_packages_module + '.' + pkg_name
         file_path = self.filename_for_package_name(pkg_name)
+        if self.packed and self.packed.is_current(pkg_name, file_path):
+            module = self.packed.load_module(pkg_name, module_name)
+            return self._package_class(module, pkg_name)
 
         if os.path.exists(file_path):
             if not os.path.isfile(file_path):
@@ -197,15 +253,19 @@ class PackageDB(object):
         else:
             raise UnknownPackageError(pkg_name)
 
-        class_name = mod_to_class(pkg_name)
         try:
-            module_name = _imported_packages_module + '.' + pkg_name
             module = imp.load_source(module_name, file_path)
 
         except ImportError, e:
             tty.die("Error while importing %s from %s:\n%s" % (
                 pkg_name, file_path, e.message))
 
+        return self._package_class(module, pkg_name)
+
+
+    def _package_class(self, module, pkg_name):
+        """Get the class for a package from its module."""
+        class_name = mod_to_class(pkg_name)
         cls = getattr(module, class_name)
         if not inspect.isclass(cls):
             tty.die("%s.%s is not a class" % (pkg_name, class_name))
@@ -227,15 +287,16 @@ class PackageDB(object):
             return '"%s"' % string
 
         deps = []
-        for pkg in self.all_packages():
+        for name in self.all_package_names():
+            pkg = self.metadata(name)
             out.write('  %-30s [label="%s"]\n' % (quote(pkg.name), pkg.name))
 
             # Add edges for each depends_on in the package.
-            for dep_name, dep in pkg.dependencies.iteritems():
+            for dep_name in pkg.dependency_names:
                 deps.append((pkg.name, dep_name))
 
             # If the package provides something, add an edge for that.
-            for provider in set(p.name for p in pkg.provided):
+            for provider in pkg.provided_names:
                 deps.append((provider, pkg.name))
 
         out.write('\n')
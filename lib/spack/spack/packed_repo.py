@@ -0,0 +1,163 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A packed form of a package repository.
+
+Loading a package from ``var/spack/packages`` checks that its
+``package.py`` exists and is readable, then reads and compiles it.  On a
+network filesystem each of those is a round trip to the server.  A
+packed repository is a single file holding the compiled code of every
+package, so all packages can be loaded with one open and no compiling.
+
+Pack the repository with ``spack pkg pack``.  While the pack exists,
+Spack loads packages from it rather than compiling their ``package.py``
+files.  The pack records the mtime, size and sha1 of each file it was
+made from.  A package whose file has changed since it was packed, or
+that is not in the pack, is loaded from source, so the pack only needs
+to be made again to speed up changed packages.  The package files
+themselves still define which packages exist.
+
+The file starts with a magic string and the bytecode magic number of
+the Python that made it, and is ignored by other Pythons.
+"""
+import os
+import imp
+import sys
+import hashlib
+import marshal
+from contextlib import closing
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp, file_stat
+
+import spack.error
+
+# Identifies a packed repository and the version of its format.
+_magic = 'SPACKPK2'
+
+
+def _header():
+    return _magic + imp.get_magic()
+
+
+def _sha1(source):
+    return hashlib.sha1(source).hexdigest()
+
+
+def pack(db, path):
+    """Compile all packages in a PackageDB and write them to a packed
+       repository at path.  Returns the names of the packed packages.
+    """
+    packages = {}
+    for name in db.all_package_names():
+        file_path = db.filename_for_package_name(name)
+        stat = file_stat(file_path)
+        with closing(open(file_path)) as pkg_file:
+            source = pkg_file.read()
+        try:
+            code = compile(source, file_path, 'exec', 0, True)
+        except SyntaxError, e:
+            raise PackError("Could not compile %s: %s" % (file_path, e))
+        packages[name] = { 'code' : code,
+                           'stat' : stat,
+                           'sha1' : _sha1(source) }
+
+    mkdirp(os.path.dirname(path))
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with closing(open(tmp_path, 'wb')) as pack_file:
+            pack_file.write(_header())
+            marshal.dump(packages, pack_file)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return sorted(packages)
+
+
+class PackedRepository(object):
+    """Compiled package modules read from a packed repository."""
+
+    def __init__(self, path):
+        """Read the packed repository at path.  Raises PackError if it
+           can't be read or was made by another version of Python."""
+        self.path = path
+        try:
+            with closing(open(path, 'rb')) as pack_file:
+                header = pack_file.read(len(_header()))
+                if header != _header():
+                    raise PackError("%s was not packed by this version of "
+                                    "Python." % path)
+                self.packages = marshal.load(pack_file)
+
+        except (IOError, OSError, EOFError, ValueError, TypeError), e:
+            raise PackError("Could not read %s: %s" % (path, e))
+
+
+    def __contains__(self, pkg_name):
+        return pkg_name in self.packages
+
+
+    def package_names(self):
+        return sorted(self.packages)
+
+
+    def is_current(self, pkg_name, path):
+        """True if the pack has the package as it is now in the file
+           at path.  Files whose mtime or size changed are hashed to see
+           whether their contents did."""
+        entry = self.packages.get(pkg_name)
+        if entry is None:
+            return False
+        try:
+            if file_stat(path) == entry['stat']:
+                return True
+            with closing(open(path)) as pkg_file:
+                return _sha1(pkg_file.read()) == entry['sha1']
+        except (IOError, OSError):
+            return False
+
+
+    def load_module(self, pkg_name, module_name):
+        """Run the packed code for a package in a new module and return
+           the module.  Like imp.load_source, this puts the module in
+           sys.modules."""
+        code = self.packages[pkg_name]['code']
+        module = imp.new_module(module_name)
+        module.__file__ = code.co_filename
+        sys.modules[module_name] = module
+        try:
+            exec code in module.__dict__
+        except:
+            del sys.modules[module_name]
+            raise
+        return module
+
+
+class PackError(spack.error.SpackError):
+    """Raised when a packed repository can't be made or read."""
+    def __init__(self, message):
+        super(PackError, self).__init__(message)
@@ -0,0 +1,165 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Background source prefetching for installs.
+
+Normally each package is fetched, checksummed, and expanded right
+before it is built, so the network sits idle while things compile and
+the CPU sits idle while things download.  A Prefetcher fetches and
+checks every archive in a set of concrete DAGs up front, in a pool of
+worker processes, so that by the time a dependent is ready to build,
+its sources are already downloaded and verified.
+
+Workers are forked processes rather than threads, because fetching
+changes the working directory.  Their output is discarded; failures
+are recorded and reported in the summary, and the build itself will
+fetch again (and report the error) if a prefetch did not succeed.
+"""
+import os
+import time
+import multiprocessing
+
+import llnl.util.tty as tty
+
+import spack
+
+
+class Prefetcher(object):
+    """Fetches the sources for all uninstalled packages in the DAGs of
+       some concrete specs using up to ``jobs`` worker processes.
+       Packages are fetched in dependency order, so that the first
+       packages to be built are the first to be fetched.
+    """
+    def __init__(self, specs, **kwargs):
+        self.jobs = max(1, kwargs.get('jobs', 1))
+
+        self.pkgs = []
+        seen = set()
+        for root in specs:
+            for spec in root.traverse(order='post'):
+                key = str(spec.prefix)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                pkg = spack.db.get(spec)
+                if not pkg.installed:
+                    self.pkgs.append(pkg)
+
+        # One event per package, set once its fetch has been attempted.
+        self.events = dict((str(p.prefix), multiprocessing.Event())
+                           for p in self.pkgs)
+        self.tasks   = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.workers = []
+
+
+    def start(self):
+        """Start fetching in the background."""
+        for i, pkg in enumerate(self.pkgs):
+            # Set up stages here, so that workers don't race to create
+            # the top-level stage directory.
+            pkg.stage
+            self.tasks.put(i)
+
+        nworkers = min(self.jobs, len(self.pkgs))
+        for i in range(nworkers):
+            self.tasks.put(None)
+
+        for i in range(nworkers):
+            worker = multiprocessing.Process(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+
+    def _work(self):
+        """Worker loop: fetch and check packages until told to stop."""
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+
+        while True:
+            i = self.tasks.get()
+            if i is None:
+                break
+
+            pkg = self.pkgs[i]
+            error = None
+            size = None
+            start = time.time()
+            try:
+                # Don't report throughput for archives we already had.
+                cached = pkg.stage.archive_file
+                pkg.do_fetch()
+                archive = pkg.stage.archive_file
+                if archive and not cached:
+                    size = os.path.getsize(archive)
+            except (Exception, SystemExit), e:
+                # Any error goes back to the parent, which waits for a
+                # result for every package.
+                error = getattr(e, 'message', None) or str(e) or repr(e)
+            finally:
+                self.events[str(pkg.prefix)].set()
+                self.results.put((i, size, time.time() - start, error))
+
+
+    def wait(self, pkg):
+        """Block until the prefetch of a package, if any, is finished."""
+        event = self.events.get(str(pkg.prefix))
+        if event is not None and not event.is_set():
+            tty.msg("Waiting for %s to finish downloading." % pkg.name)
+            event.wait()
+
+
+    def join(self):
+        """Wait for all fetches to finish and report their throughput."""
+        results = [self.results.get() for pkg in self.pkgs if self.workers]
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+        reported = [r for r in results if r[1] is not None or r[3]]
+        if not reported:
+            return
+
+        tty.msg("Prefetched %d archives:" % len(reported))
+        for i, size, seconds, error in sorted(reported):
+            name = self.pkgs[i].name
+            if error:
+                print "%s%-24s failed: %s" % (tty.indent, name, error)
+            elif size is not None:
+                print "%s%-24s %10.1f KB in %6.2fs  %8.1f KB/s" % (
+                    tty.indent, name, size / 1024.0, seconds,
+                    size / 1024.0 / max(seconds, 1e-6))
+
+
+    def terminate(self):
+        """Stop all workers immediately."""
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        self.workers = []
@@ -0,0 +1,280 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A cache of downloaded source archives, shared by stages, keyed by the
+archives' checksums.
+
+Stage.fetch() looks for an archive here before downloading it, and
+archives are added once they pass their checksum.  Entries are laid out
+by hash algorithm and digest::
+
+    <cache>/md5/ab/abcdef0123...
+
+so anything with the same checksum is the same file, whatever it was
+called or wherever it came from.  The cache survives ``spack clean
+--dist`` and ``spack purge``, and can be shared by several spack
+clones and users by configuring it in a spack config file::
+
+    [sourcecache]
+        path = /shared/spack/sources
+        size = 50G
+        mode = 2775
+
+When the cache grows beyond its size, the least recently used archives
+are removed.  Using an archive updates its mtime.  Directories in the
+cache are made with ``mode``, whatever the umask, so that everyone
+sharing it can add and remove archives.  By default they are writable
+by anyone.
+
+Entries are copied to a temporary file and renamed into place, so
+readers never see partial archives.  Archives are hard linked from the
+cache into stages when possible, and copied otherwise.  Cached files are
+read-only so that a linked stage copy can't be modified by accident.
+They are still checksummed before use.
+"""
+import os
+import re
+import errno
+import shutil
+import socket
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import join_path, mkdirp
+from llnl.util.lock import Lock
+
+import spack
+import spack.config
+import spack.error
+import spack.util.crypto as crypto
+
+# Size used when the config file doesn't give one.
+default_size = 10 * 2**30
+
+# Mode of directories in the cache when the config file doesn't give one.
+default_mode = 0777
+
+_size_suffixes = { '' : 1, 'k' : 2**10, 'm' : 2**20, 'g' : 2**30, 't' : 2**40 }
+
+
+def parse_size(string):
+    """Parse a size like 500M or 20G into bytes."""
+    match = re.match(r'^\s*(\d+)\s*([kmgt]?)b?\s*$', string, re.I)
+    if not match:
+        raise SourceCacheError("Invalid source cache size: %s" % string)
+    return int(match.group(1)) * _size_suffixes[match.group(2).lower()]
+
+
+def cache_path():
+    """Root of the source cache, or None if it is disabled."""
+    if not spack.use_source_cache:
+        return None
+    config = spack.config.get_config()
+    if config.has_value('sourcecache', None, 'path'):
+        return config.get_value('sourcecache', None, 'path')
+    return spack.source_cache_path
+
+
+def cache_size():
+    """Number of bytes the cache may hold."""
+    config = spack.config.get_config()
+    if config.has_value('sourcecache', None, 'size'):
+        return parse_size(config.get_value('sourcecache', None, 'size'))
+    return default_size
+
+
+def cache_mode():
+    """Mode of directories in the cache."""
+    config = spack.config.get_config()
+    if config.has_value('sourcecache', None, 'mode'):
+        mode = config.get_value('sourcecache', None, 'mode')
+        try:
+            return int(mode, 8)
+        except ValueError:
+            raise SourceCacheError("Invalid source cache mode: %s" % mode)
+    return default_mode
+
+
+def entry_path(digest):
+    """Path to the cache entry for an archive with digest, or None if
+       the cache is disabled."""
+    root = cache_path()
+    if root is None:
+        return None
+    hash_name = crypto.Checker(digest).hash_name.lower()
+    return join_path(root, hash_name, digest[:2], digest)
+
+
+def fetch(digest, dest):
+    """Put the cached archive with digest at dest.  Returns True if it
+       was in the cache and matched its checksum.  Bad entries are
+       removed."""
+    path = entry_path(digest)
+    if path is None or not os.path.isfile(path):
+        return False
+
+    checker = crypto.Checker(digest)
+    try:
+        if not checker.check(path):
+            tty.warn("Removing corrupt archive from source cache: %s" % path)
+            _remove(path)
+            return False
+
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+        os.utime(path, None)
+
+    except (IOError, OSError):
+        # Probably evicted by another process.
+        if os.path.exists(dest):
+            os.remove(dest)
+        return False
+
+    return True
+
+
+def add(digest, archive):
+    """Add a checksummed archive to the cache, then evict old entries if
+       the cache is too big."""
+    path = entry_path(digest)
+    if path is None or os.path.isfile(path):
+        return
+
+    tmp_path = "%s.%s.%d.tmp" % (path, socket.gethostname(), os.getpid())
+    try:
+        _make_dirs(cache_path(), os.path.dirname(path))
+
+        # Copy rather than link, so the stage's archive stays writable.
+        shutil.copyfile(archive, tmp_path)
+        os.chmod(tmp_path, 0444)
+        os.rename(tmp_path, path)
+    except (IOError, OSError), e:
+        tty.warn("Could not add %s to source cache." % archive, str(e))
+        return
+    finally:
+        _remove(tmp_path)
+
+    evict(cache_size())
+
+
+def entries():
+    """(mtime, size, path) for each archive in the cache."""
+    root = cache_path()
+    result = []
+    if root is None or not os.path.isdir(root):
+        return result
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith('.tmp') or name.startswith('.'):
+                continue
+            path = join_path(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+    return result
+
+
+def evict(size):
+    """Remove the least recently used archives until the cache holds at
+       most size bytes."""
+    root = cache_path()
+    if root is None or not os.path.isdir(root):
+        return
+
+    # Only one process evicts at a time, so they don't remove more
+    # than they need to between them.
+    lock_path = join_path(root, '.lock')
+    _make_lock_file(lock_path)
+    with Lock(lock_path).write_transaction():
+        cached = sorted(entries())
+        total = sum(entry[1] for entry in cached)
+        for mtime, entry_size, path in cached:
+            if total <= size:
+                break
+            tty.debug("Evicting %s from source cache." % path)
+            _remove(path)
+            total -= entry_size
+
+
+def clear():
+    """Remove everything in the source cache."""
+    root = cache_path()
+    if root is not None and os.path.isdir(root):
+        evict(0)
+
+
+def _make_dirs(root, path):
+    """Create path, a directory in the cache at root, and its missing
+       parents in the cache with cache_mode()."""
+    mode = cache_mode()
+    mkdirp(os.path.dirname(root))
+
+    dirs = [root]
+    for name in os.path.relpath(path, root).split(os.sep):
+        dirs.append(join_path(dirs[-1], name))
+
+    for d in dirs:
+        if os.path.isdir(d):
+            continue
+        try:
+            os.mkdir(d)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+            continue
+        os.chmod(d, mode)
+
+
+def _make_lock_file(path):
+    """Create the eviction lock file so that everyone who can write to
+       the cache can lock it."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+        return
+    os.close(fd)
+    os.chmod(path, cache_mode() & 0666)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+class SourceCacheError(spack.error.SpackError):
+    """Raised when the source cache is misconfigured."""
+    def __init__(self, message):
+        super(SourceCacheError, self).__init__(message)
@@ -104,6 +104,7 @@ import spack
 import spack.parse
 import spack.error
 import spack.compilers as compilers
+import spack.concretize_cache
 
 from spack.version import *
 from spack.util.string import *
@@ -168,11 +169,21 @@ def colorize_spec(spec):
     return colorize(re.sub(_separators, insert_color(), str(spec)) + '@.')
 
 
+def _intern(string):
+    """Intern names, compilers and architectures so that the many specs
+       that mention them share a single string object."""
+    if type(string) is str:
+        return intern(string)
+    return string
+
+
 @key_ordering
 class CompilerSpec(object):
     """The CompilerSpec field represents the compiler or range of compiler
        versions that a package should be built with.  CompilerSpecs have a
        name and a version list. """
+    __slots__ = ('name', 'versions')
+
     def __init__(self, *args):
         nargs = len(args)
         if nargs == 1:
@@ -195,7 +206,7 @@ class CompilerSpec(object):
 
         elif nargs == 2:
             name, version = args
-            self.name = name
+            self.name = _intern(name)
             self.versions = VersionList()
             self.versions.add(ver(version))
 
@@ -272,8 +283,10 @@ class Variant(object):
        on the particular package being built, and each named variant can
        be enabled or disabled.
     """
+    __slots__ = ('name', 'enabled')
+
     def __init__(self, name, enabled):
-        self.name = name
+        self.name = _intern(name)
         self.enabled = enabled
 
 
@@ -316,6 +329,12 @@ class DependencyMap(HashableMap):
 
 @key_ordering
 class Spec(object):
+    # Specs are numerous (every installed package and each of its
+    # dependencies is one), so don't give each one a __dict__.
+    __slots__ = ('name', 'versions', 'variants', 'architecture', 'compiler',
+                 'dependents', 'dependencies', '_normal', '_concrete',
+                 '_hash', '_cmp_key_cache', '_cmp_hash')
+
     def __init__(self, spec_like, *dep_like, **kwargs):
         # Copy if spec_like is a Spec.
         if isinstance(spec_like, Spec):
@@ -352,6 +371,11 @@ class Spec(object):
         self._normal = kwargs.get('normal', False)
         self._concrete = kwargs.get('concrete', False)
 
+        # Cached dep_hash(), _cmp_key() and __hash__() for concrete specs.
+        self._hash = None
+        self._cmp_key_cache = None
+        self._cmp_hash = None
+
         # This allows users to construct a spec DAG with literals.
         # Note that given two specs a and b, Spec(a) copies a, but
         # Spec(a, b) will copy a but just add b as a dep.
@@ -366,6 +390,7 @@ class Spec(object):
     def _add_version(self, version):
         """Called by the parser to add an allowable version."""
         self.versions.add(version)
+        self._invalidate_hash()
 
 
     def _add_variant(self, name, enabled):
@@ -373,6 +398,7 @@ class Spec(object):
         if name in self.variants: raise DuplicateVariantError(
                 "Cannot specify variant '%s' twice" % name)
         self.variants[name] = Variant(name, enabled)
+        self._invalidate_hash()
 
 
     def _set_compiler(self, compiler):
@@ -380,6 +406,7 @@ class Spec(object):
         if self.compiler: raise DuplicateCompilerSpecError(
                 "Spec for '%s' cannot have two compilers." % self.name)
         self.compiler = compiler
+        self._invalidate_hash()
 
 
     def _set_architecture(self, architecture):
@@ -387,6 +414,7 @@ class Spec(object):
         if self.architecture: raise DuplicateArchitectureError(
                 "Spec for '%s' cannot have two architectures." % self.name)
         self.architecture = architecture
+        self._invalidate_hash()
 
 
     def _add_dependency(self, spec):
@@ -395,6 +423,23 @@ class Spec(object):
             raise DuplicateDependencyError("Cannot depend on '%s' twice" % spec)
         self.dependencies[spec.name] = spec
         spec.dependents[self.name] = self
+        self._invalidate_hash()
+
+
+    def _invalidate_hash(self):
+        """Called whenever this spec changes.  Clears the cached hashes
+           and comparison keys of this spec and of every spec that depends
+           on it."""
+        # Only concrete specs cache anything, and a spec's dependents
+        # can only be concrete if it is.  So while specs are being built
+        # up there is nothing to clear, and no need to walk the DAG.
+        if not self._concrete:
+            return
+
+        for spec in self.traverse(direction='parents'):
+            spec._hash = None
+            spec._cmp_key_cache = None
+            spec._cmp_hash = None
 
 
     @property
@@ -410,10 +455,10 @@ class Spec(object):
         # If the spec has multiple dependents, ensure that they all
         # lead to the same place.  Spack shouldn't deal with any DAGs
         # with multiple roots, so something's wrong if we find one.
-        depiter = iter(self.dependents.values())
-        first_root = next(depiter).root
-        assert(all(first_root is d.root for d in depiter))
-        return first_root
+        roots = [s for s in self.traverse(direction='parents')
+                 if not s.dependents]
+        assert(len(roots) == 1)
+        return roots[0]
 
 
     @property
@@ -442,10 +487,11 @@ class Spec(object):
         if self._concrete:
             return True
 
-        self._concrete = bool(not self.virtual
-                              and self.versions.concrete
+        # Checking for a package file is the slowest test, so it's last.
+        self._concrete = bool(self.versions.concrete
                               and self.architecture
                               and self.compiler and self.compiler.concrete
+                              and not self.virtual
                               and self.dependencies.concrete)
         return self._concrete
 
@@ -513,36 +559,52 @@ class Spec(object):
 
         if visited is None:
             visited = set()
-        key = key_fun(self)
-
-        # Node traversal does not yield visited nodes.
-        if key in visited and cover == 'nodes':
-            return
-
-        # Determine whether and what to yield for this node.
-        yield_me = yield_root or d > 0
-        result = (d, self) if depth else self
 
-        # Preorder traversal yields before successors
-        if yield_me and order == 'pre':
-            yield result
-
-        # Edge traversal yields but skips children of visited nodes
-        if not (key in visited and cover == 'edges'):
-            # This code determines direction and yields the children/parents
-            successors = self.dependencies
-            if direction == 'parents':
-                successors = self.dependents
-
-            visited.add(key)
-            for name in sorted(successors):
-                child = successors[name]
-                for elt in child.traverse(visited, d+1, **kwargs):
-                    yield elt
-
-        # Postorder traversal yields after successors
-        if yield_me and order == 'post':
-            yield result
+        # The DAG is walked with an explicit stack rather than recursive
+        # generators, so each node costs the same regardless of depth.
+        # Each frame holds a node, its depth, its successor map, and an
+        # iterator over the names of successors left to visit.
+        parents = (direction == 'parents')
+        stack = []
+        node = self
+        while True:
+            if node is not None:
+                key = key_fun(node)
+
+                # Node traversal does not yield visited nodes.
+                if not (key in visited and cover == 'nodes'):
+                    # Preorder traversal yields before successors
+                    if (yield_root or d > 0) and order == 'pre':
+                        yield (d, node) if depth else node
+
+                    # Edge traversal yields but skips children of visited
+                    # nodes.  Postorder still yields them when popped.
+                    if key in visited and cover == 'edges':
+                        successors = {}
+                    elif parents:
+                        successors = node.dependents
+                    else:
+                        successors = node.dependencies
+                    visited.add(key)
+                    stack.append((node, d, successors, iter(sorted(successors))))
+
+            # Find the next successor to visit, popping finished frames.
+            node = None
+            while stack:
+                top, top_d, successors, names = stack[-1]
+                name = next(names, None)
+                if name is not None:
+                    node, d = successors[name], top_d + 1
+                    break
+
+                stack.pop()
+
+                # Postorder traversal yields after successors
+                if (yield_root or top_d > 0) and order == 'post':
+                    yield (top_d, top) if depth else top
+
+            if node is None:
+                return
 
 
     @property
@@ -563,11 +625,20 @@ class Spec(object):
 
            If you want this hash to be consistent, you should
            concretize the spec first so that it is not ambiguous.
+
+           The hash of a concrete spec is computed once and cached.
+           Methods that modify specs call _invalidate_hash() to clear
+           it on the modified node and its dependents.
         """
+        if self._hash is not None:
+            return self._hash[:length]
+
         sha = hashlib.sha1()
         sha.update(self.dep_string())
         full_hash = sha.hexdigest()
 
+        if self.concrete:
+            self._hash = full_hash
         return full_hash[:length]
 
 
@@ -608,14 +679,18 @@ class Spec(object):
         for name, dependent in self.dependents.items():
             del dependent.dependencies[self.name]
             dependent._add_dependency(concrete)
+        self._invalidate_hash()
 
 
-    def _expand_virtual_packages(self):
-        """Find virtual packages in this spec, replace them with providers,
-           and normalize again to include the provider's (potentially virtual)
-           dependencies.  Repeat until there are no virtual deps.
+    def _expand_virtual_packages(self, visited, spec_deps, provider_index,
+                                 virtuals):
+        """Replace the virtual packages left in a normalized spec with
+           providers, and normalize the providers' dependencies.
 
-           Precondition: spec is normalized.
+           This continues the pass over the DAG started in normalize(),
+           with the same state, so only the new parts of the DAG are
+           visited.  Providers may bring in more virtual dependencies;
+           they are expanded too, until none are left.
 
            .. todo::
 
@@ -627,20 +702,31 @@ class Spec(object):
               this are infrequent, but should implement this before it is
               a problem.
         """
-        while True:
-            virtuals =[v for v in self.traverse() if v.virtual]
-            if not virtuals:
-                return
+        while virtuals:
+            vspec = spec_deps[min(virtuals)]
+
+            # A virtual spec that nothing depends on isn't in the DAG.
+            # This happens when a provider was found for it after all.
+            if not vspec.dependents:
+                virtuals.remove(vspec.name)
+                continue
+
+            providers = spack.db.providers_for(vspec)
+            provider = spack.concretizer.choose_provider(vspec, providers)
+            provider = provider.copy()
+
+            provided = provider_index.update(provider)
+            if provider.name in spec_deps:
+                spec_deps[provider.name].constrain(provider)
+                provider = spec_deps[provider.name]
+            else:
+                spec_deps[provider.name] = provider
 
-            for spec in virtuals:
-                providers = spack.db.providers_for(spec)
-                concrete = spack.concretizer.choose_provider(spec, providers)
-                concrete = concrete.copy()
-                spec._replace_with(concrete)
+            provider._provide_virtuals(provided, spec_deps, virtuals)
+            assert(vspec.name not in virtuals)
 
-            # If there are duplicate providers or duplicate provider deps, this
-            # consolidates them and merge constraints.
-            self.normalize(force=True)
+            provider._normalize_helper(visited, spec_deps, provider_index,
+                                       virtuals)
 
 
     def concretize(self):
@@ -658,10 +744,31 @@ class Spec(object):
         if self._concrete:
             return
 
-        self.normalize()
-        self._expand_virtual_packages()
+        # Reuse an earlier concretization of the same spec if we have
+        # one.  Only whole DAGs are cached, so this is just for roots.
+        use_cache = not self.dependents
+        if use_cache:
+            cached = spack.concretize_cache.get(self)
+            if cached is not None:
+                self._dup(cached)
+                return
+            abstract = str(self)
+
+        # Normalize and expand virtual dependencies in one pass.  If the
+        # spec was already normalized, the pass is redone to expand them.
+        force = self._normal and any(s.virtual for s in self.traverse())
+        self.normalize(force=force, expand_virtuals=True)
         self._concretize_helper()
-        self._concrete = True
+
+        # Mark every node, not just the root, since specs only cache
+        # hashes and comparison keys when they know they're concrete.
+        for spec in self.traverse():
+            spec._concrete = True
+
+        if use_cache:
+            virtual = any(spack.db.get_class_for_package_name(s.name).provided
+                          for s in self.traverse())
+            spack.concretize_cache.put(abstract, self, virtual=virtual)
 
 
     def concretized(self):
@@ -698,9 +805,11 @@ class Spec(object):
 
             if not copy:
                 for dep in flat_deps.values():
+                    dep._invalidate_hash()
                     dep.dependencies.clear()
                     dep.dependents.clear()
                 self.dependencies.clear()
+                self._invalidate_hash()
 
             return flat_deps
 
@@ -720,8 +829,34 @@ class Spec(object):
             self._add_dependency(dep)
 
 
-    def _normalize_helper(self, visited, spec_deps, provider_index):
-        """Recursive helper function for _normalize."""
+    def _provide_virtuals(self, provided, spec_deps, virtuals):
+        """Replace the virtual specs in spec_deps that this spec provides
+           with this spec.  provided is the list of virtual specs this
+           spec's package provides, from ProviderIndex.update().
+        """
+        for vname in sorted(virtuals):
+            matching = [p for p in provided if p.name == vname]
+            if not matching:
+                continue
+
+            vspec = spec_deps[vname]
+            if not any(p.satisfies(vspec, deps=False) for p in matching):
+                raise UnsatisfiableProviderSpecError(self, vspec)
+
+            vspec._replace_with(self)
+            del spec_deps[vname]
+            virtuals.remove(vname)
+
+
+    def _normalize_helper(self, visited, spec_deps, provider_index, virtuals):
+        """Recursive helper function for _normalize.
+
+           visited is the set of names already normalized, and spec_deps
+           maps names to the single node in the DAG for each package.
+           provider_index holds the providers among the packages seen so
+           far, and virtuals is the set of names of virtual specs in
+           spec_deps.  All of these are updated as the DAG is walked.
+        """
         if self.name in visited:
             return
         visited.add(self.name)
@@ -733,10 +868,12 @@ class Spec(object):
 
         # Combine constraints from package dependencies with
         # constraints on the spec's dependencies.
-        pkg = spack.db.get(self.name)
         for name, pkg_dep in self.package.dependencies.items():
+            provided = None
+            is_virtual = pkg_dep.virtual
+
             # If it's a virtual dependency, try to find a provider
-            if pkg_dep.virtual:
+            if is_virtual:
                 providers = provider_index.providers_for(pkg_dep)
 
                 # If there is a provider for the vpkg, then use that instead of
@@ -748,6 +885,7 @@ class Spec(object):
 
                     pkg_dep = providers[0]
                     name    = pkg_dep.name
+                    is_virtual = False
 
                 else:
                     # The user might have required something insufficient for
@@ -760,24 +898,14 @@ class Spec(object):
                         raise UnsatisfiableProviderSpecError(
                             required[0], pkg_dep)
             else:
-                # if it's a real dependency, check whether it provides something
-                # already required in the spec.
-                index = ProviderIndex([pkg_dep], restrict=True)
-                for vspec in (v for v in spec_deps.values() if v.virtual):
-                    if index.providers_for(vspec):
-                        vspec._replace_with(pkg_dep)
-                        del spec_deps[vspec.name]
-                    else:
-                        required = index.providers_for(vspec.name)
-                        if required:
-                            raise UnsatisfiableProviderSpecError(
-                                required[0], pkg_dep)
-                provider_index.update(pkg_dep)
+                provided = provider_index.update(pkg_dep)
 
             if name not in spec_deps:
                 # If the spec doesn't reference a dependency that this package
                 # needs, then clone it from the package description.
                 spec_deps[name] = pkg_dep.copy()
+                if is_virtual:
+                    virtuals.add(name)
 
             try:
                 # Constrain package information with spec info
@@ -790,10 +918,18 @@ class Spec(object):
                               e.required, e.provided)
                 raise e
 
-            # Add merged spec to my deps and recurse
             dependency = spec_deps[name]
-            self._add_dependency(dependency)
-            dependency._normalize_helper(visited, spec_deps, provider_index)
+
+            # if it's a real dependency, it replaces any virtual packages
+            # it provides that are already required in the spec.
+            if provided:
+                dependency._provide_virtuals(provided, spec_deps, virtuals)
+
+            # Add merged spec to my deps and recurse
+            if name not in self.dependencies:
+                self._add_dependency(dependency)
+            dependency._normalize_helper(
+                visited, spec_deps, provider_index, virtuals)
 
 
     def normalize(self, **kwargs):
@@ -832,9 +968,10 @@ class Spec(object):
         spec_packages = [d.package for d in spec_deps.values() if not d.virtual]
 
         index = ProviderIndex(spec_deps.values(), restrict=True)
+        virtuals = set(name for name, dep in spec_deps.items() if dep.virtual)
 
         visited = set()
-        self._normalize_helper(visited, spec_deps, index)
+        self._normalize_helper(visited, spec_deps, index, virtuals)
 
         # If there are deps specified but not visited, they're not
         # actually deps of this package.  Raise an error.
@@ -851,6 +988,10 @@ class Spec(object):
             raise InvalidDependencyException(
                 self.name + " does not depend on " + comma_or(extra))
 
+        # Concretization needs providers for the virtual packages.
+        if kwargs.get('expand_virtuals', False):
+            self._expand_virtual_packages(visited, spec_deps, index, virtuals)
+
         # Mark the spec as normal once done.
         self._normal = True
 
@@ -907,6 +1048,7 @@ class Spec(object):
         self.versions.intersect(other.versions)
         self.variants.update(other.variants)
         self.architecture = self.architecture or other.architecture
+        self._invalidate_hash()
 
         if constrain_deps:
             self._constrain_dependencies(other)
@@ -1050,6 +1192,7 @@ class Spec(object):
         self.compiler = other.compiler.copy() if other.compiler else None
         self.dependents = DependencyMap()
         self.dependencies = DependencyMap()
+        self._concrete = False
 
         # If we copy dependencies, preserve DAG structure in the new spec
         if kwargs.get('deps', True):
@@ -1068,6 +1211,17 @@ class Spec(object):
         self._normal = other._normal
         self._concrete = other._concrete
 
+        # The hashes cover dependencies, so only keep them if we copied
+        # them.  The comparison key refers to other's dependencies, so it
+        # is rebuilt on demand.
+        if kwargs.get('deps', True):
+            self._hash = other._hash
+            self._cmp_hash = other._cmp_hash
+        else:
+            self._hash = None
+            self._cmp_hash = None
+        self._cmp_key_cache = None
+
 
     def copy(self, **kwargs):
         """Return a copy of this spec.
@@ -1173,8 +1327,27 @@ class Spec(object):
         """Comparison key for this node and all dependencies *without*
            considering structure.  This is the default, as
            normalization will restore structure.
+
+           Concrete specs cache their key, since it is rebuilt from the
+           whole DAG and specs are compared and hashed often.
         """
-        return self._cmp_node() + (self.sorted_deps(),)
+        if self._cmp_key_cache is not None:
+            return self._cmp_key_cache
+
+        key = self._cmp_node() + (self.sorted_deps(),)
+        if self.concrete:
+            self._cmp_key_cache = key
+        return key
+
+
+    def __hash__(self):
+        if self._cmp_hash is not None:
+            return self._cmp_hash
+
+        cmp_hash = hash(self._cmp_key())
+        if self.concrete:
+            self._cmp_hash = cmp_hash
+        return cmp_hash
 
 
     def colorized(self):
@@ -1340,9 +1513,13 @@ class SpecLexer(spack.parse.Lexer):
             (r'\s+',       lambda scanner, val: None)])
 
 
+# Building a lexer compiles its regular expressions, so all parsers
+# share one.  Specs are parsed constantly, e.g. to look up packages.
+_lexer = SpecLexer()
+
 class SpecParser(spack.parse.Parser):
     def __init__(self):
-        super(SpecParser, self).__init__(SpecLexer())
+        super(SpecParser, self).__init__(_lexer)
 
 
     def do_parse(self):
@@ -1379,7 +1556,7 @@ class SpecParser(spack.parse.Parser):
 
         # This will init the spec without calling __init__.
         spec = Spec.__new__(Spec)
-        spec.name = self.token.value
+        spec.name = _intern(self.token.value)
         spec.versions = VersionList()
         spec.variants = VariantMap()
         spec.architecture = None
@@ -1389,6 +1566,9 @@ class SpecParser(spack.parse.Parser):
 
         spec._normal = False
         spec._concrete = False
+        spec._hash = None
+        spec._cmp_key_cache = None
+        spec._cmp_hash = None
 
         # record this so that we know whether version is
         # unspecified or not.
@@ -1426,12 +1606,12 @@ class SpecParser(spack.parse.Parser):
     def variant(self):
         self.expect(ID)
         self.check_identifier()
-        return self.token.value
+        return _intern(self.token.value)
 
 
     def architecture(self):
         self.expect(ID)
-        return self.token.value
+        return _intern(self.token.value)
 
 
     def version(self):
@@ -1468,7 +1648,7 @@ class SpecParser(spack.parse.Parser):
         self.check_identifier()
 
         compiler = CompilerSpec.__new__(CompilerSpec)
-        compiler.name = self.token.value
+        compiler.name = _intern(self.token.value)
         compiler.versions = VersionList()
         if self.accept(AT):
             vlist = self.version_list()
@@ -29,15 +29,21 @@ import tempfile
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import *
+from llnl.util.lock import Lock
 
 import spack
 import spack.config
+import spack.source_cache
+import spack.mirror_ranking
 import spack.fetch_strategy as fs
 import spack.error
 
 
 STAGE_PREFIX = 'spack-stage-'
 
+# File in spack.stage_path that is locked while a stage is created.
+stage_lock_name = '.lock'
+
 
 class Stage(object):
     """A Stage object manaages a directory where some source code is
@@ -156,9 +162,18 @@ class Stage(object):
            Spack will use the first writable location in spack.tmp_dirs to
            create a stage.  If there is no valid location in tmp_dirs, fall
            back to making the stage inside spack.stage_path.
+
+           Other spack processes may be making stages at the same time,
+           so this holds a lock on the top-level stage directory.
         """
         # Create the top-level stage directory
         mkdirp(spack.stage_path)
+        lock = Lock(join_path(spack.stage_path, stage_lock_name))
+        with lock.write_transaction():
+            self._setup_locked()
+
+
+    def _setup_locked(self):
         self._cleanup_dead_links()
 
         # If this is a named stage, then construct a named path.
@@ -220,8 +235,9 @@ class Stage(object):
            FetchStrategy's path.  It searches for the first
            subdirectory of the path it can find, then returns that.
         """
-        for p in [os.path.join(self.path, f) for f in os.listdir(self.path)]:
-            if os.path.isdir(p):
+        for f in os.listdir(self.path):
+            p = os.path.join(self.path, f)
+            if os.path.isdir(p) and f != fs.expanding_dir_name:
                 return p
         return None
 
@@ -238,11 +254,19 @@ class Stage(object):
         """Downloads an archive or checks out code from a repository."""
         self.chdir()
 
+        if self.archive_file:
+            tty.msg("Already downloaded %s." % self.archive_file)
+            return
+
+        if (isinstance(self.fetcher, fs.URLFetchStrategy) and
+            self.fetcher.fetch_from_cache()):
+            return
+
         fetchers = [self.fetcher]
 
         # TODO: move mirror logic out of here and clean it up!
         if self.mirror_path:
-            urls = ["%s/%s" % (m, self.mirror_path) for m in _get_mirrors()]
+            urls = spack.mirror_ranking.rank(_get_mirrors(), self.mirror_path)
 
             digest = None
             if isinstance(self.fetcher, fs.URLFetchStrategy):
@@ -266,6 +290,11 @@ class Stage(object):
            No-op if this stage checks code out of a repository."""
         self.fetcher.check()
 
+        # Share the archive with other stages once it is known to be good.
+        if (isinstance(self.fetcher, fs.URLFetchStrategy) and
+            self.fetcher.digest and self.archive_file):
+            spack.source_cache.add(self.fetcher.digest, self.archive_file)
+
 
     def expand_archive(self):
         """Changes to the stage directory and attempt to expand the downloaded
@@ -35,22 +35,35 @@ test_names = ['versions',
               'url_parse',
               'url_substitution',
               'packages',
+              'package_index',
+              'packed_repo',
+              'provider_index',
+              'lru_cache',
               'stage',
               'spec_syntax',
               'spec_semantics',
               'spec_dag',
               'concretize',
+              'concretize_cache',
               'multimethod',
               'install',
               'package_sanity',
               'config',
               'directory_layout',
+              'install_index',
+              'lock',
+              'http_fetch',
+              'source_cache',
+              'mirror_ranking',
+              'migration',
               'python_version',
               'git_fetch',
               'svn_fetch',
               'hg_fetch',
               'mirror',
-              'url_extrapolate']
+              'url_extrapolate',
+              'jobserver',
+              'timer']
 
 
 def list_tests():
@@ -25,6 +25,8 @@
 import unittest
 
 import spack
+import spack.concretize
+import spack.error
 from spack.spec import Spec, CompilerSpec
 from spack.test.mock_packages_test import *
 
@@ -165,6 +167,26 @@ class ConcretizeTest(MockPackagesTest):
         spec.concretize()
 
 
+    def test_provider_replaces_virtual_with_one_node(self):
+        spec = Spec('indirect_mpich')
+        spec.normalize()
+
+        self.assertFalse('mpi' in spec)
+        mpich = [s for s in spec.traverse(cover='edges') if s.name == 'mpich']
+        self.assertEqual(len(mpich), 2)
+        self.assertTrue(mpich[0] is mpich[1])
+
+
+    def test_concretize_normalized_spec_with_virtual_deps(self):
+        spec = Spec('mpileaks')
+        spec.normalize()
+        self.assertTrue('mpi' in spec)
+
+        spec.concretize()
+        self.assertFalse(any(s.virtual for s in spec.traverse()))
+        self.assertTrue(spec.eq_dag(Spec('mpileaks').concretized()))
+
+
     def test_compiler_inheritance(self):
         spec = Spec('mpileaks')
         spec.normalize()
@@ -175,3 +197,35 @@ class ConcretizeTest(MockPackagesTest):
         # TODO: not exactly the syntax I would like.
         self.assertTrue(spec['libdwarf'].compiler.satisfies('clang'))
         self.assertTrue(spec['libelf'].compiler.satisfies('clang'))
+
+
+    def check_concretize_specs(self, jobs):
+        abstract = ['mpileaks', 'libelf@0.8.12', 'mpileaks ^zmpi', 'mpileaks']
+        concrete = spack.concretize.concretize_specs(abstract, jobs=jobs)
+
+        self.assertEqual(len(concrete), len(abstract))
+        for a, c in zip(abstract, concrete):
+            self.assertTrue(c.concrete)
+            self.assertTrue(c.eq_dag(Spec(a).concretized()))
+
+        # Duplicates are concretized once but returned as separate copies.
+        self.assertTrue(concrete[0].eq_dag(concrete[3]))
+        self.assertFalse(concrete[0] is concrete[3])
+
+        # Lookups are only shared for the duration of the batch.
+        self.assertEqual(spack.concretize._batch_memo, None)
+
+
+    def test_concretize_specs(self):
+        self.check_concretize_specs(1)
+
+
+    def test_concretize_specs_in_parallel(self):
+        self.check_concretize_specs(2)
+
+
+    def test_concretize_specs_error(self):
+        self.assertRaises(spack.error.SpackError,
+                          spack.concretize.concretize_specs,
+                          ['libelf', 'libelf%gcc@99'], jobs=2)
+        self.assertEqual(spack.concretize._batch_memo, None)
@@ -0,0 +1,124 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the persistent concretization cache.
+"""
+import os
+import shutil
+import tempfile
+
+import spack
+import spack.concretize_cache as concretize_cache
+from spack.spec import Spec
+from spack.test.mock_packages_test import *
+
+
+class ConcretizeCacheTest(MockPackagesTest):
+
+    def setUp(self):
+        super(ConcretizeCacheTest, self).setUp()
+        self.real_cache_path = spack.concretize_cache_path
+        spack.concretize_cache_path = tempfile.mkdtemp()
+        spack.use_concretize_cache = True
+
+
+    def tearDown(self):
+        shutil.rmtree(spack.concretize_cache_path, True)
+        spack.concretize_cache_path = self.real_cache_path
+        super(ConcretizeCacheTest, self).tearDown()
+
+
+    def touch_package(self, name):
+        """Bump the mtime of a mock package.  Returns a function that
+           puts it back."""
+        path = spack.db.filename_for_package_name(name)
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        return lambda: os.utime(path, (st.st_atime, st.st_mtime))
+
+
+    def test_cache_hit(self):
+        self.assertEqual(concretize_cache.get(Spec('mpileaks')), None)
+
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        cached = concretize_cache.get(Spec('mpileaks'))
+        self.assertTrue(cached is not None)
+        self.assertTrue(cached.concrete)
+        self.assertTrue(cached.eq_dag(spec))
+        self.assertEqual(cached.dep_hash(), spec.dep_hash())
+
+        # Concretizing again comes from the cache.
+        again = Spec('mpileaks')
+        again.concretize()
+        self.assertTrue(again.eq_dag(spec))
+        self.assertTrue(again._normal)
+
+
+    def test_cache_is_keyed_on_abstract_spec(self):
+        Spec('mpileaks ^zmpi').concretize()
+        self.assertEqual(concretize_cache.get(Spec('mpileaks')), None)
+
+        cached = concretize_cache.get(Spec('mpileaks ^zmpi'))
+        self.assertTrue('zmpi' in cached)
+        self.assertFalse('mpich' in cached)
+
+
+    def test_changed_package_invalidates_entry(self):
+        Spec('libdwarf').concretize()
+        self.assertTrue(concretize_cache.get(Spec('libdwarf')) is not None)
+
+        restore = self.touch_package('libelf')
+        try:
+            self.assertEqual(concretize_cache.get(Spec('libdwarf')), None)
+        finally:
+            restore()
+        self.assertTrue(concretize_cache.get(Spec('libdwarf')) is not None)
+
+
+    def test_virtual_deps_depend_on_all_packages(self):
+        Spec('libdwarf').concretize()
+        Spec('mpileaks').concretize()
+
+        # zmpi isn't in either DAG, but it could provide mpi.
+        restore = self.touch_package('zmpi')
+        try:
+            self.assertTrue(concretize_cache.get(Spec('libdwarf')) is not None)
+            self.assertEqual(concretize_cache.get(Spec('mpileaks')), None)
+        finally:
+            restore()
+
+
+    def test_disabled(self):
+        spack.use_concretize_cache = False
+        Spec('libdwarf').concretize()
+        self.assertEqual(os.listdir(spack.concretize_cache_path), [])
+
+
+    def test_clear(self):
+        Spec('libdwarf').concretize()
+        concretize_cache.clear()
+        self.assertEqual(concretize_cache.get(Spec('libdwarf')), None)
@@ -46,11 +46,18 @@ class DirectoryLayoutTest(unittest.TestCase):
         self.tmpdir = tempfile.mkdtemp()
         self.layout = SpecHashDirectoryLayout(self.tmpdir)
 
+        # Keep concretized specs out of the real cache.
+        self.real_cache_path = spack.concretize_cache_path
+        spack.concretize_cache_path = tempfile.mkdtemp()
+
 
     def tearDown(self):
         shutil.rmtree(self.tmpdir, ignore_errors=True)
         self.layout = None
 
+        shutil.rmtree(spack.concretize_cache_path, ignore_errors=True)
+        spack.concretize_cache_path = self.real_cache_path
+
 
     def test_read_and_write_spec(self):
         """This goes through each package in spack and creates a directory for
@@ -0,0 +1,442 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the native HTTP fetcher in spack.util.http, against a local
+server.
+"""
+import os
+import json
+import errno
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+
+from llnl.util.filesystem import join_path
+
+import spack
+import spack.util.http as http
+import spack.util.crypto as crypto
+import spack.util.compression as compression
+import spack.fetch_strategy as fs
+from spack.stage import Stage
+from spack.fetch_strategy import URLFetchStrategy, ChecksumError
+from spack.test.mock_http_server import MockHTTPServer
+
+archive_data = 'x' * (3 * http.chunk_size + 17)
+
+
+def make_tarball():
+    """A gzipped tarball with a source directory in it."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = join_path(tmpdir, 'foo-1.0')
+        os.mkdir(source)
+        with closing(open(join_path(source, 'configure'), 'w')) as f:
+            f.write(os.urandom(200000).encode('hex'))
+
+        path = join_path(tmpdir, 'foo-1.0.tar.gz')
+        with closing(tarfile.open(path, 'w:gz')) as tar:
+            tar.add(source, arcname='foo-1.0')
+        with closing(open(path, 'rb')) as f:
+            return f.read()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class HTTPFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockHTTPServer()
+        self.server.add_file('/archive.tar.gz', archive_data,
+                             'application/x-gzip')
+        self.server.start()
+
+        self.pool = http.ConnectionPool(timeout=1)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = join_path(self.tmpdir, 'archive.tar.gz')
+
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir, True)
+
+
+    def download(self, path, **kwargs):
+        kwargs.setdefault('pool', self.pool)
+        kwargs.setdefault('backoff', 0.01)
+        return http.download(self.server.url(path), self.path, **kwargs)
+
+
+    def write_partial(self, data, url_path='/archive.tar.gz', validator=None):
+        """Leave a partial download of url_path, as a failed attempt
+           would.  The validator defaults to the server's ETag."""
+        if validator is None:
+            validator = '"%s"' % hashlib.md5(archive_data).hexdigest()
+        part = self.path + http.part_suffix
+        with closing(open(part, 'wb')) as f:
+            f.write(data)
+        with closing(open(part + '.json', 'w')) as f:
+            json.dump({ 'url' : self.server.url(url_path),
+                        'validator' : validator }, f)
+
+
+    def assertDownloaded(self):
+        with closing(open(self.path, 'rb')) as f:
+            data = f.read()
+        self.assertEqual(len(data), len(archive_data))
+        self.assertTrue(data == archive_data)
+
+
+    def test_download(self):
+        response = self.download('/archive.tar.gz')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('content-type'),
+                         'application/x-gzip')
+        self.assertDownloaded()
+
+
+    def test_head(self):
+        self.server.add_redirect('/old.tar.gz', '/archive.tar.gz')
+        response = http.head(self.server.url('/old.tar.gz'), pool=self.pool)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.requests, {})
+
+        self.assertRaises(http.HTTPError, http.head,
+                          self.server.url('/missing.tar.gz'), pool=self.pool)
+
+        # The probe's connection is reused for the download.
+        self.download('/archive.tar.gz')
+        self.assertEqual(self.pool.connections_made, 1)
+
+
+    def test_connections_are_reused(self):
+        for i in range(3):
+            self.download('/archive.tar.gz')
+        self.assertEqual(self.pool.connections_made, 1)
+        self.assertEqual(self.server.connections, 1)
+
+
+    def test_retry_server_errors(self):
+        self.server.add_failure('/archive.tar.gz', 503, 2)
+        self.download('/archive.tar.gz')
+        self.assertEqual(self.server.requests['/archive.tar.gz'], 3)
+        self.assertDownloaded()
+
+
+    def test_give_up_after_retries(self):
+        self.server.add_failure('/archive.tar.gz', 500, 10)
+        self.assertRaises(http.HTTPError, self.download, '/archive.tar.gz',
+                          retries=2)
+        self.assertEqual(self.server.requests['/archive.tar.gz'], 3)
+        self.assertFalse(os.path.exists(self.path))
+
+
+    def test_missing_file_is_not_retried(self):
+        try:
+            self.download('/missing.tar.gz')
+            self.fail("Expected an HTTPError.")
+        except http.HTTPError, e:
+            self.assertEqual(e.status, 404)
+        self.assertEqual(self.server.requests['/missing.tar.gz'], 1)
+        self.assertFalse(os.path.exists(self.path))
+
+
+    def test_follow_redirects(self):
+        self.server.add_redirect('/old.tar.gz', '/archive.tar.gz')
+        self.download('/old.tar.gz')
+        self.assertDownloaded()
+
+
+    def test_timeout(self):
+        self.server.add_delay('/archive.tar.gz', 1)
+        self.pool.timeout = 0.2
+        self.assertRaises(http.HTTPError, self.download, '/archive.tar.gz',
+                          retries=1)
+        self.assertEqual(self.server.requests['/archive.tar.gz'], 2)
+
+
+    def test_requests_per_host_are_bounded(self):
+        self.server.add_delay('/archive.tar.gz', 0.1)
+        pool = http.ConnectionPool(max_per_host=2)
+        paths = [join_path(self.tmpdir, str(i)) for i in range(6)]
+        threads = [threading.Thread(
+            target=http.download,
+            args=(self.server.url('/archive.tar.gz'), path),
+            kwargs={ 'pool' : pool }) for path in paths]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(pool.connections_made, 2)
+        for path in paths:
+            self.assertTrue(os.path.isfile(path))
+
+
+    def test_resume_after_dropped_connection(self):
+        self.server.add_cut('/archive.tar.gz', 100000, 1)
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.requests['/archive.tar.gz'], 2)
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data))
+        self.assertFalse(os.path.exists(self.path + http.part_suffix))
+
+
+    def test_resume_earlier_partial_download(self):
+        self.write_partial(archive_data[:1000])
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data) - 1000)
+        self.assertFalse(
+            os.path.exists(self.path + http.part_suffix + '.json'))
+
+
+    def test_partial_download_without_validator(self):
+        with closing(open(self.path + http.part_suffix, 'wb')) as f:
+            f.write('y' * 1000)
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data))
+
+
+    def test_partial_download_from_other_url(self):
+        self.server.add_file('/other.tar.gz', archive_data)
+        self.write_partial('y' * 1000, url_path='/other.tar.gz')
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data))
+
+
+    def test_restart_without_range_support(self):
+        self.server.ranges = False
+        self.server.add_cut('/archive.tar.gz', 100000, 1)
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data) + 100000)
+
+
+    def test_changed_file_is_downloaded_again(self):
+        self.write_partial('y' * 1000, validator='"old-etag"')
+
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+        self.assertEqual(self.server.bytes_sent['/archive.tar.gz'],
+                         len(archive_data))
+
+
+    def test_oversized_partial_download(self):
+        self.write_partial(archive_data + 'extra')
+        self.download('/archive.tar.gz')
+        self.assertDownloaded()
+
+
+    def test_partial_download_is_kept(self):
+        self.server.add_cut('/archive.tar.gz', 100000, 10)
+        self.server.ranges = False
+        self.assertRaises(http.HTTPError, self.download, '/archive.tar.gz',
+                          retries=1)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(
+            os.path.getsize(self.path + http.part_suffix), 100000)
+
+
+    def test_supports(self):
+        self.assertTrue(http.supports('http://example.com/foo.tar.gz'))
+        self.assertFalse(http.supports('ftp://example.com/foo.tar.gz'))
+        self.assertFalse(http.supports('file:///tmp/foo.tar.gz'))
+        self.assertEqual(http.supports('https://example.com/foo.tar.gz'),
+                         http.can_verify_ssl())
+        self.assertTrue(http.supports('https://example.com/foo.tar.gz',
+                                      verify_ssl=False))
+
+
+    def test_proxies_are_left_to_curl(self):
+        proxy_vars = ('http_proxy', 'https_proxy', 'no_proxy',
+                      'HTTP_PROXY', 'HTTPS_PROXY', 'NO_PROXY')
+        saved = dict((var, os.environ.get(var)) for var in proxy_vars)
+        try:
+            for var in proxy_vars:
+                os.environ.pop(var, None)
+            os.environ['http_proxy'] = 'http://proxy.example.com:3128'
+            self.assertFalse(http.supports('http://example.com/foo.tar.gz'))
+            self.assertTrue(http.supports('https://example.com/foo.tar.gz',
+                                          verify_ssl=False))
+
+            os.environ['no_proxy'] = 'localhost,example.com'
+            self.assertTrue(http.supports('http://example.com/foo.tar.gz'))
+            self.assertFalse(http.supports('http://example.org/foo.tar.gz'))
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+
+    def test_stage_fetch(self):
+        stage = Stage(URLFetchStrategy(self.server.url('/archive.tar.gz')),
+                      name='spack-http-fetch-test')
+        try:
+            stage.fetch()
+            with closing(open(stage.archive_file, 'rb')) as f:
+                self.assertEqual(f.read(), archive_data)
+        finally:
+            stage.destroy()
+
+
+class StreamingFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tarball = make_tarball()
+        self.server = MockHTTPServer()
+        self.server.add_file('/foo-1.0.tar.gz', self.tarball)
+        self.server.start()
+
+        self.md5 = hashlib.md5(self.tarball).hexdigest()
+        self.stage = None
+
+        self.real_source_cache_path = spack.source_cache_path
+        spack.source_cache_path = tempfile.mkdtemp()
+
+        # Fail if the archive is read again after it is downloaded.
+        self.real_checksum = crypto.checksum
+        self.real_decompressor_for = fs.decompressor_for
+        def fail(*args, **kwargs):
+            raise AssertionError("Archive was read again.")
+        crypto.checksum = fail
+        fs.decompressor_for = fail
+
+
+    def tearDown(self):
+        crypto.checksum = self.real_checksum
+        fs.decompressor_for = self.real_decompressor_for
+        self.server.stop()
+        if self.stage:
+            self.stage.destroy()
+
+        shutil.rmtree(spack.source_cache_path, ignore_errors=True)
+        spack.source_cache_path = self.real_source_cache_path
+
+
+    def fetch(self, digest):
+        fetcher = URLFetchStrategy(self.server.url('/foo-1.0.tar.gz'), digest)
+        self.stage = Stage(fetcher, name='spack-streaming-fetch-test')
+        self.stage.fetch()
+        self.assertTrue(os.path.isfile(self.stage.archive_file))
+
+
+    def test_expand_while_fetching(self):
+        self.fetch(self.md5)
+        self.assertEqual(self.stage.source_path, None)
+
+        self.stage.check()
+        self.stage.expand_archive()
+        self.assertEqual(os.path.basename(self.stage.source_path), 'foo-1.0')
+        self.assertTrue(os.path.isfile(
+            join_path(self.stage.source_path, 'configure')))
+        self.assertFalse(os.path.exists(
+            join_path(self.stage.path, fs.expanding_dir_name)))
+
+
+    def test_bad_checksum_discards_expanded_tree(self):
+        self.fetch('0' * 32)
+        self.assertRaises(ChecksumError, self.stage.check)
+        self.assertEqual(self.stage.source_path, None)
+        self.assertFalse(os.path.exists(
+            join_path(self.stage.path, fs.expanding_dir_name)))
+
+
+    def test_changed_archive_is_checked_again(self):
+        self.fetch(self.md5)
+        with closing(open(self.stage.archive_file, 'ab')) as f:
+            f.write('garbage')
+
+        crypto.checksum = self.real_checksum
+        fs.decompressor_for = self.real_decompressor_for
+        self.assertRaises(ChecksumError, self.stage.check)
+
+
+    def test_expand_resumed_download(self):
+        self.server.add_cut('/foo-1.0.tar.gz', len(self.tarball) / 2, 1)
+        self.fetch(self.md5)
+        self.assertEqual(self.server.requests['/foo-1.0.tar.gz'], 2)
+
+        self.stage.check()
+        self.stage.expand_archive()
+        self.assertTrue(os.path.isfile(
+            join_path(self.stage.source_path, 'configure')))
+
+
+    def test_hash_only(self):
+        spack.expand_while_fetching = False
+        try:
+            self.fetch(self.md5)
+        finally:
+            spack.expand_while_fetching = True
+        self.stage.check()
+        self.assertFalse(os.path.exists(
+            join_path(self.stage.path, fs.expanding_dir_name)))
+
+
+    def test_write_error_aborts_expansion(self):
+        streams = []
+        def fail_writing(url, path, **kwargs):
+            stream = kwargs['stream']
+            stream()(self.tarball[:len(self.tarball) / 2])
+            streams.append(stream)
+            raise IOError(errno.ENOSPC, "No space left on device")
+
+        real_download = http.download
+        http.download = fail_writing
+        try:
+            fetcher = URLFetchStrategy(
+                self.server.url('/foo-1.0.tar.gz'), self.md5)
+            self.stage = Stage(fetcher, name='spack-streaming-fetch-test')
+            self.assertRaises(IOError, fetcher.fetch)
+        finally:
+            http.download = real_download
+
+        self.assertEqual(streams[0].expander, None)
+        self.assertFalse(os.path.exists(
+            join_path(self.stage.path, fs.expanding_dir_name)))
+
+
+    def test_stream_expander_failure(self):
+        dest = tempfile.mkdtemp()
+        shutil.rmtree(dest)
+        expander = compression.StreamExpander('foo.tar.gz', dest)
+        expander.write('not a tarball' * 1000)
+        self.assertFalse(expander.finish())
+        self.assertFalse(os.path.exists(dest))
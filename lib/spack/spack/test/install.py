@@ -31,9 +31,12 @@ from contextlib import closing
 from llnl.util.filesystem import *
 
 import spack
+import spack.build_cache as build_cache
 from spack.stage import Stage
 from spack.fetch_strategy import URLFetchStrategy
 from spack.directory_layout import SpecHashDirectoryLayout
+from spack.installer import ParallelInstaller
+from spack.prefetch import Prefetcher
 from spack.util.executable import which
 from spack.test.mock_packages_test import *
 from spack.test.mock_repo import MockArchive
@@ -90,3 +93,169 @@ class InstallTest(MockPackagesTest):
         except Exception, e:
             pkg.remove_prefix()
             raise
+
+
+    def test_parallel_install_and_uninstall(self):
+        spec = Spec('trivial_install_test_package')
+        spec.concretize()
+
+        pkg = spack.db.get(spec)
+        pkg.fetcher = URLFetchStrategy(self.repo.url)
+
+        try:
+            pkg.do_install(jobs=2)
+            self.assertTrue(pkg.installed)
+            pkg.do_uninstall()
+        except Exception, e:
+            pkg.remove_prefix()
+            raise
+
+
+    def test_parallel_install_leaves_other_children(self):
+        spec = Spec('trivial_install_test_package')
+        spec.concretize()
+
+        pkg = spack.db.get(spec)
+        pkg.fetcher = URLFetchStrategy(self.repo.url)
+
+        # A child the installer didn't start, like a prefetch worker.
+        other = os.fork()
+        if other == 0:
+            os._exit(0)
+
+        try:
+            ParallelInstaller([spec], jobs=2).install()
+            self.assertTrue(pkg.installed)
+
+            # The installer must not have reaped it.
+            pid, status = os.waitpid(other, 0)
+            self.assertEqual(pid, other)
+            pkg.do_uninstall()
+        except Exception, e:
+            pkg.remove_prefix()
+            raise
+
+
+    def test_parallel_installer_schedule(self):
+        spec = Spec('mpileaks ^mpich')
+        spec.concretize()
+
+        installer = ParallelInstaller([spec], jobs=4)
+        self.assertEqual(len(installer.specs), len(list(spec.traverse())))
+
+        # Only leaves of the DAG are ready to build at first.
+        ready = [installer.specs[k].name for k in installer._ready()]
+        self.assertEqual(ready, ['libelf', 'mpich'])
+
+        # Finishing a leaf releases the nodes that were waiting on it.
+        installer.waiting_on.pop(str(spec['libelf'].prefix))
+        installer._finish(str(spec['libelf'].prefix), 1)
+        self.assertEqual([s.name for s in installer.failed], ['libelf'])
+        self.assertEqual(sorted(s.name for s in installer.skipped),
+                         ['callpath', 'dyninst', 'libdwarf', 'mpileaks'])
+
+
+    def test_install_with_prefetch(self):
+        spec = Spec('trivial_install_test_package')
+        spec.concretize()
+
+        pkg = spack.db.get(spec)
+        pkg.fetcher = URLFetchStrategy(self.repo.url)
+
+        try:
+            pkg.do_install(prefetch_jobs=2)
+            self.assertTrue(pkg.installed)
+            self.assertTrue(os.path.isfile(
+                join_path(pkg.prefix, spack.package.timings_file_name)))
+            pkg.do_uninstall()
+        except Exception, e:
+            pkg.remove_prefix()
+            raise
+
+
+    def test_prefetch_reports_unexpected_errors(self):
+        spec = Spec('trivial_install_test_package')
+        spec.concretize()
+
+        prefetcher = Prefetcher([spec], jobs=1)
+        def fail():
+            raise KeyError('no such resource')
+        prefetcher.pkgs[0].do_fetch = fail
+
+        prefetcher.start()
+        try:
+            i, size, seconds, error = prefetcher.results.get(timeout=10)
+            self.assertEqual(error, 'no such resource')
+        finally:
+            prefetcher.terminate()
+
+
+    def test_install_from_build_cache(self):
+        spec = Spec('trivial_install_test_package')
+        spec.concretize()
+
+        pkg = spack.db.get(spec)
+        pkg.fetcher = URLFetchStrategy(self.repo.url)
+
+        cache_dir = tempfile.mkdtemp()
+        config_file = join_path(cache_dir, 'spackconfig')
+        with closing(open(config_file, 'w')) as f:
+            f.write("[buildcache]\n    path = %s\n" % join_path(cache_dir, 'cache'))
+        user_config = spack.config._scopes['user']
+        spack.config._scopes['user'] = config_file
+        spack.config.get_config(refresh=True)
+
+        try:
+            pkg.do_install()
+            tarball = build_cache.tarball_path(spec)
+            self.assertTrue(os.path.isfile(tarball))
+            pkg.do_uninstall()
+
+            # Break the fetcher; the next install must come from the cache.
+            pkg.fetcher = URLFetchStrategy('file:///no/such/archive.tar.gz')
+            pkg.do_install()
+            self.assertTrue(os.path.isfile(join_path(pkg.prefix, 'dummy_file')))
+            self.assertTrue(spec in spack.install_layout.all_specs())
+            pkg.do_uninstall()
+        except Exception, e:
+            pkg.remove_prefix()
+            raise
+        finally:
+            spack.config._scopes['user'] = user_config
+            spack.config.get_config(refresh=True)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+    def test_relocate(self):
+        prefix = tempfile.mkdtemp()
+        try:
+            script = join_path(prefix, 'script')
+            with closing(open(script, 'w')) as f:
+                f.write("#!/old/root/bin/sh\n")
+            os.symlink('/old/root/lib/libfoo.so', join_path(prefix, 'link'))
+
+            build_cache.relocate(prefix, '/old/root', '/new/longer/root')
+
+            with closing(open(script)) as f:
+                self.assertEqual(f.read(), "#!/new/longer/root/bin/sh\n")
+            self.assertEqual(os.readlink(join_path(prefix, 'link')),
+                             '/new/longer/root/lib/libfoo.so')
+        finally:
+            shutil.rmtree(prefix, ignore_errors=True)
+
+
+    def test_relocate_directory_symlink(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            old_root = join_path(tmpdir, 'old')
+            new_root = join_path(tmpdir, 'new')
+            mkdirp(join_path(old_root, 'lib'))
+            prefix = join_path(tmpdir, 'prefix')
+            mkdirp(prefix)
+            link = join_path(prefix, 'lib64')
+            os.symlink(join_path(old_root, 'lib'), link)
+
+            build_cache.relocate(prefix, old_root, new_root)
+            self.assertEqual(os.readlink(link), join_path(new_root, 'lib'))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,206 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the index of installed specs.
+"""
+import os
+import errno
+import shutil
+import tempfile
+
+import llnl.util.lock
+
+import spack
+from spack.spec import Spec
+from spack.directory_layout import SpecHashDirectoryLayout
+from spack.install_index import index_file_name, _file_id
+from spack.test.mock_packages_test import *
+
+
+class InstallIndexTest(MockPackagesTest):
+
+    def setUp(self):
+        super(InstallIndexTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.layout = SpecHashDirectoryLayout(self.tmpdir)
+
+        self.specs = []
+        for string in ('mpileaks ^mpich', 'libdwarf', 'mpich@3.0',
+                       'libelf'):
+            spec = Spec(string)
+            spec.concretize()
+            self.layout.make_path_for_spec(spec)
+            self.specs.append(spec)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+        super(InstallIndexTest, self).tearDown()
+
+
+    def assertSameSpecs(self, specs, expected):
+        self.assertEqual(sorted(specs), sorted(expected))
+        for spec in specs:
+            self.assertTrue(spec.concrete)
+            other = [s for s in expected if s == spec][0]
+            self.assertEqual(spec.dep_hash(), other.dep_hash())
+
+
+    def test_install_updates_index(self):
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.tmpdir, index_file_name)))
+        self.assertSameSpecs(self.layout.all_specs(), self.specs)
+
+
+    def test_index_is_read_without_walking(self):
+        layout = SpecHashDirectoryLayout(self.tmpdir)
+        def walk_specs():
+            raise AssertionError("Install tree should not be walked.")
+        layout.walk_specs = walk_specs
+        self.assertSameSpecs(layout.all_specs(), self.specs)
+
+
+    def test_uninstall_updates_index(self):
+        self.layout.remove_path_for_spec(self.specs[1])
+        self.assertSameSpecs(SpecHashDirectoryLayout(self.tmpdir).all_specs(),
+                             [self.specs[0]] + self.specs[2:])
+
+
+    def test_changes_from_other_layouts_are_seen(self):
+        # All specs are read, so the layout has cached them.
+        self.layout.all_specs()
+
+        other = SpecHashDirectoryLayout(self.tmpdir)
+        other.remove_path_for_spec(self.specs[0])
+        self.assertSameSpecs(self.layout.all_specs(), self.specs[1:])
+
+
+    def test_updates_reread_the_index(self):
+        self.layout.all_specs()
+
+        other = SpecHashDirectoryLayout(self.tmpdir)
+        other.remove_path_for_spec(self.specs[0])
+
+        # Pretend the other process's write left the file looking the
+        # same, e.g. in the same mtime tick and with the same size.
+        self.layout.index._stat = _file_id(
+            os.path.join(self.tmpdir, index_file_name))
+
+        self.layout.remove_path_for_spec(self.specs[1])
+        self.assertSameSpecs(SpecHashDirectoryLayout(self.tmpdir).all_specs(),
+                             self.specs[2:])
+
+
+    def test_missing_index_is_rebuilt(self):
+        os.remove(os.path.join(self.tmpdir, index_file_name))
+        layout = SpecHashDirectoryLayout(self.tmpdir)
+        self.assertSameSpecs(layout.all_specs(), self.specs)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.tmpdir, index_file_name)))
+
+
+    def test_unwritable_install_tree(self):
+        os.remove(os.path.join(self.tmpdir, index_file_name))
+        real_lock_file = llnl.util.lock._lock_file
+        def read_only(path, write):
+            if write:
+                raise OSError(errno.EACCES, "Permission denied", path)
+            return real_lock_file(path, write)
+        llnl.util.lock._lock_file = read_only
+        try:
+            layout = SpecHashDirectoryLayout(self.tmpdir)
+            self.assertSameSpecs(layout.all_specs(), self.specs)
+            with layout.prefix_lock(self.specs[0]).read_transaction():
+                pass
+        finally:
+            llnl.util.lock._lock_file = real_lock_file
+        self.assertFalse(
+            os.path.isfile(os.path.join(self.tmpdir, index_file_name)))
+
+
+    def test_empty_install_tree(self):
+        layout = SpecHashDirectoryLayout(os.path.join(self.tmpdir, 'none'))
+        self.assertEqual(layout.all_specs(), [])
+        layout.index.rebuild()
+        self.assertFalse(os.path.exists(layout.root))
+
+
+    def dependent_names(self, layout, spec):
+        return sorted(s.name for s in layout.installed_dependents(spec))
+
+
+    def test_installed_dependents(self):
+        mpileaks, libdwarf, mpich, libelf = self.specs
+        self.assertEqual(self.dependent_names(self.layout, libelf),
+                         ['libdwarf', 'mpileaks'])
+        self.assertEqual(self.dependent_names(self.layout, mpich),
+                         ['mpileaks'])
+        self.assertEqual(self.dependent_names(self.layout, mpileaks), [])
+
+        # A different mpich is not depended on, though 3.0.2 satisfies 3.0.
+        other_mpich = Spec('mpich@3.0.2')
+        other_mpich.concretize()
+        self.assertEqual(self.dependent_names(self.layout, other_mpich), [])
+
+        # Same as what a scan finds.
+        for spec in self.specs:
+            scanned = [s for s in self.layout.all_specs()
+                       if s.name != spec.name and spec in s]
+            self.assertEqual(sorted(self.layout.installed_dependents(spec)),
+                             sorted(scanned))
+
+
+    def test_dependents_after_uninstall(self):
+        mpileaks, libdwarf, mpich, libelf = self.specs
+        self.layout.remove_path_for_spec(libdwarf)
+        layout = SpecHashDirectoryLayout(self.tmpdir)
+        self.assertEqual(self.dependent_names(layout, libelf), ['mpileaks'])
+
+
+    def test_query(self):
+        for string in ('mpich@3.0.2', 'mpich@3.0.4', 'libelf@0.8.12'):
+            spec = Spec(string)
+            spec.concretize()
+            self.layout.make_path_for_spec(spec)
+        layout = SpecHashDirectoryLayout(self.tmpdir)
+        all_specs = layout.all_specs()
+
+        for query in ('mpich', 'mpich@3:', 'mpich@3.0', 'mpich@3.0.2:',
+                      'mpich@:3.0.3', 'mpich@3.0.1:3.0.3', 'mpich@:2',
+                      'mpich@4:', 'libelf%gcc', 'libelf@0.8.12%gcc',
+                      'libelf%intel', 'mpileaks ^mpich@3.0',
+                      'mpileaks ^mpich@3.0.4', 'libdwarf=unknown_arch',
+                      'libdwarf=other_arch', 'zmpi'):
+            spec = Spec(query)
+            expected = [s for s in all_specs if s.satisfies(spec)]
+            self.assertEqual(sorted(layout.query(spec)), sorted(expected))
+
+        self.assertEqual(
+            sorted(str(s.version) for s in layout.query(Spec('mpich@3.0:'))),
+            ['3.0', '3.0.2', '3.0.4'])
+        # 3.0 satisfies 3.0.3: because 3.0.3 has 3.0 as a prefix.
+        self.assertEqual(
+            sorted(str(s.version) for s in layout.query(Spec('mpich@3.0.3:'))),
+            ['3.0', '3.0.4'])
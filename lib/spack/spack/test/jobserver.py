@@ -0,0 +1,128 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the make jobserver shared by concurrent builds.
+"""
+import os
+import sys
+import fcntl
+import shutil
+import tempfile
+import unittest
+from contextlib import closing
+
+from llnl.util.filesystem import join_path
+
+import spack.jobserver
+import spack.build_environment
+from spack.jobserver import Jobserver
+from spack.build_environment import MakeExecutable
+
+
+def count_tokens(fd):
+    """Read all tokens currently in a pipe without blocking."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    tokens = ''
+    try:
+        while True:
+            tokens += os.read(fd, 4096)
+    except OSError:
+        pass
+    finally:
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+    return len(tokens)
+
+
+# A fake make that prints its MAKEFLAGS and the number of tokens it can
+# take from the jobserver, then puts them back.
+fake_make_script = """#!%s
+import os
+import fcntl
+
+makeflags = os.environ['MAKEFLAGS']
+r, w = [int(fd) for fd in makeflags.split('=')[1].split(',')]
+
+fcntl.fcntl(r, fcntl.F_SETFL, fcntl.fcntl(r, fcntl.F_GETFL) | os.O_NONBLOCK)
+tokens = ''
+try:
+    while True:
+        tokens += os.read(r, 4096)
+except OSError:
+    pass
+os.write(w, tokens)
+
+print makeflags
+print len(tokens)
+"""
+
+
+class JobserverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_path = spack.jobserver.jobserver_path
+        spack.jobserver.jobserver_path = join_path(self.tmpdir, 'jobserver')
+        self.orig_get_jobserver = spack.build_environment.get_jobserver
+
+
+    def tearDown(self):
+        spack.jobserver.jobserver_path = self.orig_path
+        spack.build_environment.get_jobserver = self.orig_get_jobserver
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+    def test_fifo_is_filled_once(self):
+        js = spack.jobserver._open_fifo(4)
+
+        # A second user of the same FIFO must not add more tokens.
+        spack.jobserver._open_fifo(4)
+        self.assertEqual(count_tokens(js.read_fd), 4)
+
+
+    def test_make_holds_token_while_running(self):
+        r, w = os.pipe()
+        os.write(w, '++')
+        js = Jobserver(r, w)
+        spack.build_environment.get_jobserver = lambda: js
+
+        fake_make = join_path(self.tmpdir, 'make')
+        with closing(open(fake_make, 'w')) as f:
+            f.write(fake_make_script % sys.executable)
+        os.chmod(fake_make, 0755)
+
+        make = MakeExecutable(fake_make, True)
+        out = make(return_output=True)
+        makeflags, available = out.split('\n')[:2]
+        self.assertEqual(makeflags, '-j --jobserver-fds=%d,%d' % (r, w))
+
+        # The build held one of the two tokens.
+        self.assertEqual(int(available), 1)
+
+        # The token was given back afterwards.
+        self.assertEqual(count_tokens(r), 2)
+        self.assertFalse('MAKEFLAGS' in os.environ and
+                         'jobserver' in os.environ['MAKEFLAGS'])
+        os.close(r)
+        os.close(w)
@@ -0,0 +1,231 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for llnl.util.lock.
+"""
+import os
+import time
+import socket
+import shutil
+import tempfile
+import unittest
+
+import llnl.util.lock
+from llnl.util.lock import *
+from llnl.util.filesystem import join_path
+
+import spack
+from spack.spec import Spec
+from spack.directory_layout import SpecHashDirectoryLayout
+from spack.test.mock_packages_test import *
+
+
+def in_child(function):
+    """Run function in a child process and return its exit code: 0 if
+       it returned True, 1 if it returned False, and 2 if it timed out
+       waiting for a lock."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if function() else 1)
+        except LockTimeoutError:
+            os._exit(2)
+        except:
+            os._exit(3)
+    pid, status = os.waitpid(pid, 0)
+    return os.WEXITSTATUS(status)
+
+
+class LockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = join_path(self.tmpdir, 'lockfile')
+
+        # Readers only lock files that a writer has made.
+        open(self.path, 'w').close()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+
+    def try_write(self, start=0, length=0):
+        lock = Lock(self.path, start, length)
+        return in_child(lambda: lock.acquire_write(0.2) or True)
+
+
+    def try_read(self, start=0, length=0):
+        lock = Lock(self.path, start, length)
+        return in_child(lambda: lock.acquire_read(0.2) or True)
+
+
+    def test_write_excludes_other_processes(self):
+        lock = Lock(self.path)
+        with lock.write_transaction():
+            self.assertEqual(self.try_write(), 2)
+            self.assertEqual(self.try_read(), 2)
+        self.assertEqual(self.try_write(), 0)
+
+
+    def test_reads_are_shared(self):
+        lock = Lock(self.path)
+        with lock.read_transaction():
+            self.assertEqual(self.try_read(), 0)
+            self.assertEqual(self.try_write(), 2)
+
+
+    def test_nested_transactions(self):
+        lock = Lock(self.path)
+        with lock.read_transaction():
+            with lock.write_transaction():
+                with lock.read_transaction():
+                    self.assertEqual(self.try_read(), 2)
+            # Back to the read lock.
+            self.assertEqual(self.try_read(), 0)
+            self.assertEqual(self.try_write(), 2)
+        self.assertEqual(self.try_write(), 0)
+
+
+    def test_byte_ranges_are_independent(self):
+        lock = Lock(self.path, 10, 1)
+        with lock.write_transaction():
+            self.assertEqual(self.try_write(11, 1), 0)
+            self.assertEqual(self.try_write(10, 1), 2)
+
+
+    def test_lock_released_on_exception(self):
+        lock = Lock(self.path)
+        try:
+            with lock.write_transaction():
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.try_write(), 0)
+
+
+    def test_fallback_lock(self):
+        lock = Lock(self.path)
+        lock.use_fcntl = False
+        with lock.read_transaction():
+            self.assertTrue(os.path.exists(lock._fallback_path()))
+
+            other = Lock(self.path)
+            other.use_fcntl = False
+            self.assertRaises(LockTimeoutError, other.acquire_write, 0.2)
+        self.assertFalse(os.path.exists(lock._fallback_path()))
+
+        other.acquire_write(0.2)
+        other.release_write()
+
+
+    def test_stale_fallback_lock_is_broken(self):
+        # A pid that is no longer running.
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        lock = Lock(self.path)
+        lock.use_fcntl = False
+        with open(lock._fallback_path(), 'w') as f:
+            f.write("%s %d\n" % (socket.gethostname(), pid))
+
+        lock.acquire_write(1)
+        lock.release_write()
+
+
+    def test_live_fallback_lock_is_kept(self):
+        lock = Lock(self.path)
+        lock.use_fcntl = False
+        with open(lock._fallback_path(), 'w') as f:
+            f.write("%s %d\n" % (socket.gethostname(), os.getpid()))
+
+        self.assertRaises(LockTimeoutError, lock.acquire_write, 0.2)
+
+
+    def test_read_without_lock_file(self):
+        path = join_path(self.tmpdir, 'missing', 'lockfile')
+        lock = Lock(path)
+        with lock.read_transaction():
+            self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+        # Writers make the file, and its directory.
+        with lock.write_transaction():
+            self.assertTrue(os.path.exists(path))
+
+
+    def test_reads_open_lock_file_read_only(self):
+        lock = Lock(self.path)
+        with lock.read_transaction():
+            self.assertEqual(
+                llnl.util.lock._lock_file(self.path, False).mode, 'r')
+            self.assertEqual(self.try_write(), 2)
+
+
+    def test_unwritable_fallback_lock(self):
+        os.chmod(self.tmpdir, 0555)
+        try:
+            lock = Lock(self.path)
+            lock.use_fcntl = False
+            if os.access(self.tmpdir, os.W_OK):
+                # Running as root; the directory is writable anyway.
+                return
+            with lock.read_transaction():
+                self.assertFalse(os.path.exists(lock._fallback_path()))
+            self.assertRaises(OSError, lock.acquire_write, 0.2)
+        finally:
+            os.chmod(self.tmpdir, 0755)
+
+
+class PrefixLockTest(MockPackagesTest):
+
+    def setUp(self):
+        super(PrefixLockTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.layout = SpecHashDirectoryLayout(self.tmpdir)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+        super(PrefixLockTest, self).tearDown()
+
+
+    def test_prefix_locks(self):
+        libelf = Spec('libelf')
+        libelf.concretize()
+        libdwarf = Spec('libdwarf')
+        libdwarf.concretize()
+
+        lock = self.layout.prefix_lock(libelf)
+        self.assertTrue(lock is self.layout.prefix_lock(libelf))
+
+        with lock.write_transaction():
+            layout = SpecHashDirectoryLayout(self.tmpdir)
+            self.assertEqual(in_child(
+                lambda: layout.prefix_lock(libelf).acquire_read(0.2)), 2)
+            self.assertEqual(in_child(
+                lambda: layout.prefix_lock(libdwarf).acquire_write(0.2)
+                or True), 0)
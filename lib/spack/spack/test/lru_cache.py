@@ -0,0 +1,132 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for LRUCache, memoized, and the package instance cache.
+"""
+import unittest
+
+import spack
+from llnl.util.lang import LRUCache, memoized
+from spack.packages import PackageDB
+from spack.test.mock_packages_test import *
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction_order(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache[key] = key.upper()
+        self.assertEqual(list(cache), ['c', 'b', 'a'])
+
+        # Using 'a' makes 'b' the least recently used.
+        self.assertEqual(cache['a'], 'A')
+        cache['d'] = 'D'
+        self.assertEqual(list(cache), ['d', 'a', 'c'])
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.evictions, 1)
+
+        # Replacing a value uses it.
+        cache['c'] = 'C2'
+        cache['e'] = 'E'
+        self.assertEqual(list(cache), ['e', 'c', 'd'])
+        self.assertEqual(cache['c'], 'C2')
+        self.assertEqual(len(cache), 3)
+
+
+    def test_counters(self):
+        cache = LRUCache()
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertTrue('a' in cache)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (1, 2, 0))
+
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        del cache['a']
+        self.assertEqual(list(cache), ['b'])
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        cache['c'] = 3
+        self.assertEqual(list(cache), ['c'])
+
+
+    def test_unbounded(self):
+        cache = LRUCache()
+        for i in range(1000):
+            cache[i] = i
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.evictions, 0)
+        self.assertRaises(ValueError, LRUCache, 0)
+
+
+    def test_memoized(self):
+        calls = []
+        @memoized(maxsize=2)
+        def f(x, y=0):
+            calls.append((x, y))
+            return x + y
+
+        self.assertEqual(f(1), 1)
+        self.assertEqual(f(1), 1)
+        self.assertEqual(f(1, y=2), 3)
+        self.assertEqual(f(1, y=2), 3)
+        self.assertEqual(calls, [(1, 0), (1, 2)])
+        self.assertEqual((f.cache.hits, f.cache.misses), (2, 2))
+
+        f(2)
+        f(1)
+        self.assertEqual(calls, [(1, 0), (1, 2), (2, 0), (1, 0)])
+        self.assertEqual(len(f.cache), 2)
+
+
+class PackageInstanceCacheTest(MockPackagesTest):
+
+    def test_instances_are_evicted(self):
+        spack.db = PackageDB(spack.mock_packages_path, cache_size=2)
+        mpich = spack.db.get('mpich')
+        self.assertTrue(spack.db.get('mpich') is mpich)
+
+        spack.db.get('libelf')
+        spack.db.get('libdwarf')
+        self.assertEqual(len(spack.db.instances), 2)
+        self.assertEqual(spack.db.instances.evictions, 1)
+
+        # An evicted package is made again, from the same class.
+        new_mpich = spack.db.get('mpich')
+        self.assertFalse(new_mpich is mpich)
+        self.assertTrue(type(new_mpich) is type(mpich))
+
+
+    def test_new_package(self):
+        mpich = spack.db.get('mpich')
+        self.assertFalse(spack.db.get('mpich', new=True) is mpich)
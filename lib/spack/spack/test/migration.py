@@ -0,0 +1,204 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the hash-sharded directory layout and for migrating install
+trees between layouts.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import closing
+
+from llnl.util.filesystem import join_path
+
+import spack
+import spack.hooks
+import spack.migration
+from spack.spec import Spec
+from spack.directory_layout import *
+from spack.migration import migrate, MigrationError
+from spack.test.mock_packages_test import *
+
+
+class MigrationTest(MockPackagesTest):
+
+    def setUp(self):
+        super(MigrationTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.layout = SpecHashDirectoryLayout(self.tmpdir)
+
+        self.specs = []
+        for string in ('mpileaks ^mpich', 'libdwarf', 'libelf'):
+            spec = Spec(string)
+            spec.concretize()
+            self.layout.make_path_for_spec(spec)
+            self.specs.append(spec)
+
+            # A file that refers to the prefixes of the whole DAG.
+            prefix = self.layout.path_for_spec(spec)
+            with closing(open(join_path(prefix, 'paths'), 'w')) as f:
+                f.write(self.paths(self.layout, spec))
+
+
+        # Record the prefixes module files would be written for.
+        self.hook_calls = []
+        self.saved_hooks = (spack.hooks.post_install,
+                            spack.hooks.post_uninstall)
+        spack.hooks.post_install = self.recorder('post_install')
+        spack.hooks.post_uninstall = self.recorder('post_uninstall')
+
+
+    def tearDown(self):
+        spack.hooks.post_install, spack.hooks.post_uninstall = self.saved_hooks
+        shutil.rmtree(self.tmpdir, True)
+        super(MigrationTest, self).tearDown()
+
+
+    def recorder(self, name):
+        def hook(pkg):
+            self.hook_calls.append((name, pkg.spec.name, pkg.prefix))
+        return hook
+
+
+    def paths(self, layout, spec):
+        return '\n'.join(layout.path_for_spec(node)
+                         for node in spec.traverse())
+
+
+    def check_migrated(self, layout):
+        self.assertEqual(sorted(layout.all_specs()), sorted(self.specs))
+        self.assertEqual(sorted(layout.walk_specs()), sorted(self.specs))
+
+        for spec in self.specs:
+            old_prefix = self.layout.path_for_spec(spec)
+            prefix = layout.path_for_spec(spec)
+            if old_prefix != prefix:
+                self.assertFalse(os.path.exists(old_prefix))
+            with closing(open(join_path(prefix, 'paths'))) as f:
+                self.assertEqual(f.read(), self.paths(layout, spec))
+
+        found = layout_for_root(self.tmpdir)
+        self.assertEqual(type(found), type(layout))
+        self.assertEqual(found.layout_args, layout.layout_args)
+
+
+    def test_sharded_paths(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir, shard_len=3)
+        for spec in self.specs:
+            path = layout.relative_path_for_spec(spec)
+            old_path = self.layout.relative_path_for_spec(spec)
+
+            parent, shard, dir_name = path.rsplit('/', 2)
+            self.assertEqual(len(shard), 3)
+            self.assertEqual(join_path(parent, dir_name), old_path)
+
+
+    def test_default_layout(self):
+        layout = layout_for_root(self.tmpdir)
+        self.assertEqual(type(layout), SpecHashDirectoryLayout)
+        self.assertEqual(layout.hash_len, 8)
+
+
+    def test_migrate_to_sharded(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir)
+        migrate(self.layout, layout)
+        self.check_migrated(layout)
+
+
+    def test_regenerate_modules(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir)
+        migrate(self.layout, layout)
+
+        expected = []
+        for name, l in (('post_uninstall', self.layout),
+                        ('post_install', layout)):
+            for spec in self.specs:
+                expected.append((name, spec.name, l.path_for_spec(spec)))
+        self.assertEqual(sorted(self.hook_calls), sorted(expected))
+
+
+    def test_locked_prefix(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir)
+        spec = self.specs[0]
+
+        def migrate_in_child():
+            # A fresh layout, whose locks this process does not hold.
+            spack.migration.prefix_lock_timeout = 0
+            try:
+                migrate(SpecHashDirectoryLayout(self.tmpdir), layout)
+            except MigrationError:
+                return True
+            return False
+
+        # fcntl locks only exclude other processes.
+        with self.layout.prefix_lock(spec).write_transaction():
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if migrate_in_child() else 1)
+            pid, status = os.waitpid(pid, 0)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+
+        self.assertTrue(os.path.isdir(self.layout.path_for_spec(spec)))
+        migrate(self.layout, layout)
+        self.check_migrated(layout)
+
+
+    def test_migrate_in_parallel(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir)
+        migrate(self.layout, layout, jobs=4)
+        self.check_migrated(layout)
+
+
+    def test_migrate_hash_length(self):
+        layout = SpecHashDirectoryLayout(self.tmpdir, hash_len=12)
+        migrate(self.layout, layout)
+        self.check_migrated(layout)
+        self.assertEqual(layout_for_root(self.tmpdir).hash_len, 12)
+
+
+    def test_resume_migration(self):
+        layout = HashShardedDirectoryLayout(self.tmpdir)
+        spec = self.specs[0]
+        new_prefix = layout.path_for_spec(spec)
+        os.makedirs(os.path.dirname(new_prefix))
+        os.rename(self.layout.path_for_spec(spec), new_prefix)
+        with closing(open(join_path(new_prefix, 'paths'), 'w')) as f:
+            f.write(self.paths(layout, spec))
+
+        migrate(self.layout, layout)
+        self.check_migrated(layout)
+
+
+    def test_hash_collision(self):
+        spec = Spec('mpileaks ^zmpi')
+        spec.concretize()
+        self.layout.make_path_for_spec(spec)
+
+        layout = SpecHashDirectoryLayout(self.tmpdir, hash_len=0)
+        self.assertRaises(MigrationError, migrate, self.layout, layout)
+        self.assertEqual(sorted(self.layout.all_specs()),
+                         sorted(self.specs + [spec]))
+        self.assertFalse(os.path.exists(
+            join_path(self.tmpdir, layout_file_name)))
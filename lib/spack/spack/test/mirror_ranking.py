@@ -0,0 +1,195 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for probing and ranking mirrors in spack.mirror_ranking.
+"""
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from contextlib import closing
+
+from llnl.util.filesystem import join_path, mkdirp
+
+import spack
+import spack.mirror_ranking as ranking
+from spack.test.mock_http_server import MockHTTPServer
+
+archive_path = 'foo/foo-1.0.tar.gz'
+
+
+def closed_port_url():
+    """URL of a port on localhost that nothing listens on."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d' % port
+
+
+class MirrorRankingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.real_mirror_stats_path = spack.mirror_stats_path
+        self.real_use_native_fetch = spack.use_native_fetch
+        self.real_probe_timeout = ranking.probe_timeout
+        spack.mirror_stats_path = join_path(self.tmpdir, 'mirrors.json')
+        spack.use_native_fetch = True
+
+        self.servers = []
+
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        spack.mirror_stats_path = self.real_mirror_stats_path
+        spack.use_native_fetch = self.real_use_native_fetch
+        ranking.probe_timeout = self.real_probe_timeout
+
+
+    def mirror(self, has_file=True, delay=None):
+        """Start a mirror server and return its URL."""
+        server = MockHTTPServer()
+        if has_file:
+            server.add_file('/' + archive_path, 'archive')
+        if delay:
+            server.add_delay('/' + archive_path, delay)
+        server.start()
+        self.servers.append(server)
+        return server.url('')
+
+
+    def test_fastest_mirror_first(self):
+        slow = self.mirror(delay=0.3)
+        fast = self.mirror()
+
+        urls = ranking.rank([slow, fast], archive_path)
+        self.assertEqual(urls, [ranking.mirror_url(fast, archive_path),
+                                ranking.mirror_url(slow, archive_path)])
+
+        # Mirrors are probed with HEAD requests only.
+        for server in self.servers:
+            self.assertEqual(server.head_requests['/' + archive_path], 1)
+            self.assertEqual(server.requests, {})
+
+
+    def test_mirrors_without_file_are_skipped(self):
+        empty = self.mirror(has_file=False)
+        full = self.mirror()
+        self.assertEqual(ranking.rank([empty, full], archive_path),
+                         [ranking.mirror_url(full, archive_path)])
+
+        # A mirror without the file still answered.
+        self.assertFalse(ranking.demoted(ranking.load_stats()[empty]))
+
+
+    def test_file_mirrors(self):
+        root = join_path(self.tmpdir, 'mirror')
+        mkdirp(join_path(root, 'foo'))
+        with closing(open(join_path(root, archive_path), 'w')) as f:
+            f.write('archive')
+
+        mirror = 'file://' + root
+        self.assertEqual(ranking.rank([mirror], archive_path),
+                         [ranking.mirror_url(mirror, archive_path)])
+        self.assertEqual(ranking.rank([mirror], 'foo/missing.tar.gz'), [])
+
+
+    def test_unprobed_mirrors_come_last(self):
+        ftp = 'ftp://mirror.example.com/spack'
+        http = self.mirror()
+        self.assertEqual(ranking.rank([ftp, http], archive_path),
+                         [ranking.mirror_url(http, archive_path),
+                          ranking.mirror_url(ftp, archive_path)])
+
+
+    def test_dead_mirrors_are_demoted(self):
+        dead = closed_port_url()
+        alive = self.mirror()
+
+        expected = [ranking.mirror_url(alive, archive_path),
+                    ranking.mirror_url(dead, archive_path)]
+        self.assertEqual(ranking.rank([dead, alive], archive_path), expected)
+        entry = ranking.load_stats()[dead]
+        self.assertEqual(entry['failures'], 1)
+
+        # The next fetch doesn't probe the dead mirror again, but still
+        # tries it last.
+        self.assertEqual(ranking.rank([dead, alive], archive_path), expected)
+        self.assertEqual(ranking.load_stats()[dead], entry)
+
+
+    def test_slow_mirrors_time_out(self):
+        ranking.probe_timeout = 0.2
+        slow = self.mirror(delay=1)
+        self.assertEqual(ranking.rank([slow], archive_path),
+                         [ranking.mirror_url(slow, archive_path)])
+        self.assertEqual(ranking.load_stats()[slow]['failures'], 1)
+
+
+    def test_unsaved_latency(self):
+        slow = self.mirror(delay=0.3)
+        fast = self.mirror()
+
+        # Statistics that couldn't be updated, for a mirror that had
+        # only failed before.
+        real_record = ranking.record
+        ranking.record = lambda results: {
+            slow : { 'latency' : None, 'failures' : 1, 'last_failure' : 0 } }
+        try:
+            urls = ranking.rank([slow, fast], archive_path)
+        finally:
+            ranking.record = real_record
+        self.assertEqual(urls, [ranking.mirror_url(fast, archive_path),
+                                ranking.mirror_url(slow, archive_path)])
+
+
+    def test_retry_delay(self):
+        entry = { 'failures' : 1, 'last_failure' : 1000.0 }
+        self.assertTrue(ranking.demoted(entry, 1000.0 + ranking.retry_delay - 1))
+        self.assertFalse(ranking.demoted(entry, 1000.0 + ranking.retry_delay))
+
+        entry['failures'] = 3
+        self.assertTrue(ranking.demoted(entry, 1000.0 + 3 * ranking.retry_delay))
+        self.assertFalse(ranking.demoted(entry, 1000.0 + 4 * ranking.retry_delay))
+
+        entry['failures'] = 100
+        self.assertFalse(ranking.demoted(entry, 1000.0 + ranking.max_retry_delay))
+
+
+    def test_average_latency(self):
+        ranking.record({ 'http://a' : 1.0 })
+        stats = ranking.record({ 'http://a' : 2.0, 'http://b' : None })
+        self.assertAlmostEqual(stats['http://a']['latency'],
+                               1.0 + ranking.latency_weight)
+        self.assertEqual(stats['http://b']['latency'], None)
+
+        # A success resets the failure count.
+        stats = ranking.record({ 'http://b' : 0.5 })
+        self.assertEqual(stats['http://b']['failures'], 0)
+        self.assertEqual(ranking.load_stats(), stats)
@@ -0,0 +1,253 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A local HTTP server that stands in for download sites in tests.
+"""
+import re
+import sys
+import time
+import hashlib
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class MockHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves files from a dict, in a background thread, on a free port
+       on localhost.  Files are added with add_file(), and misbehaving
+       URLs with the other add_* methods.  Counts the connections and
+       requests it gets.
+
+       Use it like this::
+
+           server = MockHTTPServer()
+           server.add_file('/foo.tar.gz', data)
+           server.start()
+           ... fetch server.url('/foo.tar.gz') ...
+           server.stop()
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), _MockHTTPHandler)
+        self.files = {}          # path -> (body, content type)
+        self.failures = {}       # path -> [status, times left to fail]
+        self.redirects = {}      # path -> location
+        self.delays = {}         # path -> seconds to wait before replying
+        self.cuts = {}           # path -> [bytes to send, times left]
+        self.ranges = True       # whether to honor Range requests
+
+        self.lock = threading.Lock()
+        self.sockets = set()     # open client connections
+        self.connections = 0
+        self.requests = {}       # path -> number of GET requests
+        self.head_requests = {}  # path -> number of HEAD requests
+        self.bytes_sent = {}     # path -> bytes of file bodies sent
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+
+    def add_file(self, path, body, content_type='application/octet-stream'):
+        self.files[path] = (body, content_type)
+
+
+    def add_failure(self, path, status, times):
+        """Make requests for path fail with status the first times times."""
+        self.failures[path] = [status, times]
+
+
+    def add_redirect(self, path, location):
+        self.redirects[path] = location
+
+
+    def add_delay(self, path, seconds):
+        self.delays[path] = seconds
+
+
+    def add_cut(self, path, nbytes, times):
+        """Drop the connection after sending nbytes of the file at path,
+           the first times times it is requested."""
+        self.cuts[path] = [nbytes, times]
+
+
+    def handle_error(self, request, client_address):
+        # Clients that time out close their connections early.
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(
+                self, request, client_address)
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+        # Wake up handlers waiting on kept-alive connections.
+        self.lock.acquire()
+        sockets = list(self.sockets)
+        self.lock.release()
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class _MockHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        server = self.server
+        server.lock.acquire()
+        server.connections += 1
+        server.sockets.add(self.connection)
+        server.lock.release()
+
+
+    def finish(self):
+        server = self.server
+        server.lock.acquire()
+        server.sockets.discard(self.connection)
+        server.lock.release()
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def send_body(self, status, body, content_type='text/plain', headers={},
+                  length=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if length is None:
+            self.wfile.write(body)
+        else:
+            self.wfile.write(body[:length])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = 1
+
+
+    def send_file(self, path):
+        server = self.server
+        body, content_type = server.files[path]
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = { 'ETag' : etag, 'Accept-Ranges' : 'bytes' }
+
+        status = 200
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if server.ranges and match and if_range in (None, etag):
+            start = int(match.group(1))
+            if start >= len(body):
+                self.send_body(416, "")
+                return
+            status = 206
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, len(body) - 1, len(body))
+            body = body[start:]
+
+        if self.command == 'HEAD':
+            self.send_body(status, body, content_type, headers)
+            return
+
+        server.lock.acquire()
+        length = None
+        cut = server.cuts.get(path)
+        if cut and cut[1] > 0:
+            cut[1] -= 1
+            length = cut[0]
+        sent = len(body) if length is None else length
+        server.bytes_sent[path] = server.bytes_sent.get(path, 0) + sent
+        server.lock.release()
+
+        self.send_body(status, body, content_type, headers, length)
+
+
+    def do_GET(self):
+        self.reply(self.server.requests)
+
+
+    def do_HEAD(self):
+        self.reply(self.server.head_requests)
+
+
+    def reply(self, counts):
+        server = self.server
+        path = self.path
+
+        server.lock.acquire()
+        counts[path] = counts.get(path, 0) + 1
+        server.in_flight += 1
+        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        failure = server.failures.get(path)
+        if failure and failure[1] > 0:
+            failure[1] -= 1
+        else:
+            failure = None
+        server.lock.release()
+
+        try:
+            if path in server.delays:
+                time.sleep(server.delays[path])
+
+            if failure:
+                self.send_body(failure[0], "Failed\n")
+            elif path in server.redirects:
+                self.send_body(302, "", headers={
+                    'Location' : server.redirects[path] })
+            elif path in server.files:
+                self.send_file(path)
+            else:
+                self.send_body(404, "Not found\n")
+
+        except socket.error:
+            # The client gave up.
+            pass
+
+        finally:
+            server.lock.acquire()
+            server.in_flight -= 1
+            server.lock.release()
@@ -22,6 +22,8 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
+import shutil
+import tempfile
 import unittest
 
 import spack
@@ -51,9 +53,27 @@ class MockPackagesTest(unittest.TestCase):
             'site' : spack.mock_site_config,
             'user' : spack.mock_user_config }
 
+        # Tests modify mock packages in memory, which the concretization
+        # cache can't see.
+        self.real_use_concretize_cache = spack.use_concretize_cache
+        spack.use_concretize_cache = False
+
+        # Keep package indexes and downloaded archives out of the
+        # real caches.
+        self.real_package_index_path = spack.package_index_path
+        spack.package_index_path = tempfile.mkdtemp()
+        self.real_source_cache_path = spack.source_cache_path
+        spack.source_cache_path = tempfile.mkdtemp()
+
 
     def tearDown(self):
         """Restore the real packages path after any test."""
         spack.db = self.real_db
         spack.config._scopes = self.real_scopes
+        spack.use_concretize_cache = self.real_use_concretize_cache
+
+        shutil.rmtree(spack.package_index_path, ignore_errors=True)
+        spack.package_index_path = self.real_package_index_path
+        shutil.rmtree(spack.source_cache_path, ignore_errors=True)
+        spack.source_cache_path = self.real_source_cache_path
 
@@ -0,0 +1,168 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the package metadata index.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import closing
+
+import spack
+import spack.package_index as package_index
+from spack.packages import PackageDB
+from spack.version import Version
+from spack.virtual import ProviderIndex
+from spack.test.mock_packages_test import *
+
+
+class PackageIndexTest(MockPackagesTest):
+
+    def setUp(self):
+        super(PackageIndexTest, self).setUp()
+
+        # Copy the mock packages so that tests can change them.
+        self.tmp_root = tempfile.mkdtemp()
+        self.packages_path = os.path.join(self.tmp_root, 'packages')
+        shutil.copytree(spack.mock_packages_path, self.packages_path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_root, True)
+        super(PackageIndexTest, self).tearDown()
+
+
+    def new_db(self):
+        """A fresh PackageDB for the copied packages, with nothing
+           imported yet."""
+        spack.db = PackageDB(self.packages_path)
+        return spack.db
+
+
+    def add_version(self, name, version):
+        """Add a version directive to a package, as its first one."""
+        path = spack.db.filename_for_package_name(name)
+        with closing(open(path)) as pkg_file:
+            text = pkg_file.read()
+        text = text.replace("    version(", "    version('%s')\n    version(" % version, 1)
+        with closing(open(path, 'w')) as pkg_file:
+            pkg_file.write(text)
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+
+    def test_metadata_matches_package_class(self):
+        db = self.new_db()
+        for name in ('mpileaks', 'mpich', 'libdwarf'):
+            pkg_class = db.get_class_for_package_name(name)
+            metadata = db.metadata(name)
+            self.assertEqual(metadata.name, name)
+            self.assertEqual(metadata.versions, pkg_class.versions)
+            self.assertEqual(metadata.dependencies, pkg_class.dependencies)
+            self.assertEqual(metadata.provided, pkg_class.provided)
+            self.assertEqual(metadata.url, pkg_class.url)
+            self.assertEqual(metadata.homepage, pkg_class.homepage)
+            self.assertEqual(metadata.__doc__, pkg_class.__doc__)
+
+
+    def test_unknown_package(self):
+        db = self.new_db()
+        self.assertRaises(spack.packages.UnknownPackageError,
+                          db.metadata, 'not-a-package')
+
+
+    def test_index_is_reused(self):
+        db = self.new_db()
+        self.assertEqual(sorted(db.index.rebuilt), db.all_package_names())
+
+        db = self.new_db()
+        self.assertEqual(db.index.rebuilt, [])
+        self.assertEqual(db.metadata('mpich').provided_names, ['mpi'])
+
+
+    def test_only_changed_packages_are_rebuilt(self):
+        self.new_db().index
+
+        # A new mtime with the same contents is not a change.
+        path = spack.db.filename_for_package_name('libelf')
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.new_db().index.rebuilt, [])
+
+        self.add_version('libelf', '9.9')
+        db = self.new_db()
+        self.assertEqual(db.index.rebuilt, ['libelf'])
+        self.assertTrue(Version('9.9') in db.metadata('libelf').versions)
+
+
+    def test_added_and_removed_packages(self):
+        self.new_db().index
+
+        shutil.rmtree(os.path.join(self.packages_path, 'zmpi'))
+        shutil.copytree(os.path.join(self.packages_path, 'libelf'),
+                        os.path.join(self.packages_path, 'libelf2'))
+        with closing(open(os.path.join(
+                self.packages_path, 'libelf2', 'package.py'), 'a')) as f:
+            f.write("\nclass Libelf2(Libelf):\n    pass\n")
+
+        db = self.new_db()
+        self.assertEqual(db.index.rebuilt, ['libelf2'])
+        self.assertFalse('zmpi' in db.index)
+        self.assertTrue('libelf2' in db.index)
+        self.assertFalse('zmpi' in [s.name for s in db.providers_for('mpi')])
+
+
+    def test_providers_updated_for_changed_packages(self):
+        self.assertFalse('blas' in self.new_db().index.providers)
+
+        path = spack.db.filename_for_package_name('mpich2')
+        with closing(open(path)) as pkg_file:
+            text = pkg_file.read()
+        with closing(open(path, 'w')) as pkg_file:
+            pkg_file.write(text.replace("provides('mpi@:2.0')",
+                                        "provides('mpi@:2.0')\n"
+                                        "    provides('blas@2:')"))
+
+        db = self.new_db()
+        self.assertEqual(db.index.rebuilt, ['mpich2'])
+        self.assertEqual([s.name for s in db.providers_for('blas@3')],
+                         ['mpich2'])
+        self.assertEqual(db.index.providers.providers_for('blas@1'), [])
+
+
+    def test_providers_from_index(self):
+        db = self.new_db()
+        names = db.all_package_names()
+        from_classes = ProviderIndex(names)
+        for vspec in ('mpi', 'mpi@:1', 'mpi@2.1', 'lapack'):
+            self.assertEqual(db.index.providers.providers_for(vspec),
+                             from_classes.providers_for(vspec))
+
+        # Queries on a new DB don't import any packages.
+        db = self.new_db()
+        db.providers_for('mpi@2')
+        self.assertFalse(any(d for d in
+                             PackageDB.get_class_for_package_name.cache
+                             if d[0] is db))
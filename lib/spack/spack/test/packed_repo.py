@@ -0,0 +1,152 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for packed package repositories.
+"""
+import os
+import imp
+import shutil
+import tempfile
+from contextlib import closing
+
+import spack
+import spack.packed_repo as packed_repo
+from spack.packages import PackageDB
+from spack.version import Version
+from spack.test.mock_packages_test import *
+
+
+class PackedRepoTest(MockPackagesTest):
+
+    def setUp(self):
+        super(PackedRepoTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+        # A copy of the mock packages, so tests can change them.
+        self.root = os.path.join(self.tmpdir, 'packages')
+        shutil.copytree(spack.mock_packages_path, self.root)
+
+        self.pack_path = os.path.join(self.tmpdir, 'packages.pack')
+        self.packed = packed_repo.pack(PackageDB(self.root), self.pack_path)
+
+        self.real_load_source = imp.load_source
+
+
+    def tearDown(self):
+        imp.load_source = self.real_load_source
+        shutil.rmtree(self.tmpdir, True)
+        super(PackedRepoTest, self).tearDown()
+
+
+    def forbid_source(self):
+        """Fail if a package is loaded from source."""
+        def fail(name, path):
+            raise AssertionError("%s was loaded from source." % path)
+        imp.load_source = fail
+
+
+    def edit_package(self, name, text):
+        """Append text to a package file, and change its mtime."""
+        path = os.path.join(self.root, name, 'package.py')
+        with closing(open(path, 'a')) as pkg_file:
+            pkg_file.write(text)
+        os.utime(path, (0, 0))
+
+
+    def test_pack_has_all_packages(self):
+        self.assertEqual(self.packed, spack.db.all_package_names())
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.assertEqual(db.all_package_names(), self.packed)
+        self.assertTrue(db.exists('mpileaks'))
+        self.assertFalse(db.exists('not-a-package'))
+
+
+    def test_load_from_pack(self):
+        names = ('mpileaks', 'mpich', 'multimethod')
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.forbid_source()
+        packed_classes = [db.get_class_for_package_name(n) for n in names]
+        imp.load_source = self.real_load_source
+
+        for name, packed_class in zip(names, packed_classes):
+            source_class = spack.db.get_class_for_package_name(name)
+            self.assertEqual(packed_class.versions, source_class.versions)
+            self.assertEqual(packed_class.dependencies,
+                             source_class.dependencies)
+            self.assertEqual(packed_class.provided, source_class.provided)
+            self.assertEqual(packed_class.__module__, source_class.__module__)
+
+
+    def test_concretize_from_pack(self):
+        spec = Spec('mpileaks ^mpich')
+        spec.concretize()
+
+        spack.db = PackageDB(self.root, packed=self.pack_path)
+        self.forbid_source()
+        packed_spec = Spec('mpileaks ^mpich')
+        packed_spec.concretize()
+        self.assertEqual(spec, packed_spec)
+
+
+    def test_changed_package_is_loaded_from_source(self):
+        self.edit_package('mpich', "\n    version('9.9', '%s')\n" % ('0' * 32))
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.assertFalse(db.packed.is_current(
+            'mpich', db.filename_for_package_name('mpich')))
+        self.assertTrue(Version('9.9') in
+                        db.get_class_for_package_name('mpich').versions)
+        self.assertTrue(Version('9.9') in db.metadata('mpich').versions)
+
+
+    def test_touched_package_is_loaded_from_pack(self):
+        os.utime(os.path.join(self.root, 'mpich', 'package.py'), (0, 0))
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.forbid_source()
+        self.assertTrue(db.get_class_for_package_name('mpich').provided)
+
+
+    def test_removed_package_is_not_listed(self):
+        shutil.rmtree(os.path.join(self.root, 'mpich'))
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.assertFalse('mpich' in db.all_package_names())
+        self.assertFalse(db.exists('mpich'))
+        self.assertFalse('mpich' in db.index)
+
+
+    def test_bad_pack_falls_back_to_source(self):
+        with closing(open(self.pack_path, 'wb')) as pack_file:
+            pack_file.write('SPACKPK2' + 'XXXX')
+
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.assertEqual(db.packed, None)
+        self.assertEqual(db.all_package_names(), self.packed)
+        self.assertTrue(db.get_class_for_package_name('mpich').provided)
+
+
+    def test_missing_pack(self):
+        os.remove(self.pack_path)
+        db = PackageDB(self.root, packed=self.pack_path)
+        self.assertEqual(db.packed, None)
+        self.assertEqual(db.all_package_names(), self.packed)
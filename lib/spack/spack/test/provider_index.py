@@ -0,0 +1,112 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for ProviderIndex lookups and serialization.
+"""
+import json
+
+import spack
+from spack.spec import Spec
+from spack.virtual import ProviderIndex
+from spack.test.mock_packages_test import *
+
+
+class ProviderIndexTest(MockPackagesTest):
+
+    def setUp(self):
+        super(ProviderIndexTest, self).setUp()
+        self.index = ProviderIndex(spack.db.all_package_names())
+
+
+    def scan_providers(self, index, vspec):
+        """What providers_for() returns, found by checking every entry."""
+        vspec = Spec(vspec)
+        providers = set()
+        for provided, spec in index.providers.get(vspec.name, {}).items():
+            if provided.satisfies(vspec, deps=False):
+                providers.add(spec)
+        return sorted(providers)
+
+
+    vspecs = ['mpi', 'mpi@1', 'mpi@1.0', 'mpi@:1', 'mpi@1:', 'mpi@2',
+              'mpi@2.0.5', 'mpi@2.1', 'mpi@2.1.3', 'mpi@2.2:2.4', 'mpi@3',
+              'mpi@3.1', 'mpi@:3', 'mpi@4:', 'mpi@10', 'mpi@10.0.1',
+              'mpi@10.1', 'mpi@11:', 'mpi@1,3', 'lapack']
+
+
+    def test_providers_for_matches_scan(self):
+        for vspec in self.vspecs:
+            self.assertEqual(self.index.providers_for(vspec),
+                             self.scan_providers(self.index, vspec))
+
+
+    def test_lookup_with_lower_bounds(self):
+        index = ProviderIndex([])
+        for pkg, provided in (('mpich',  'mpi@1.2:1.4'),
+                              ('mpich2', 'mpi@2.1:'),
+                              ('zmpi',   'mpi@3.0.2'),
+                              ('libelf', 'mpi@3.1:3.5')):
+            index.add_provided(Spec(pkg), { Spec(provided) : Spec(pkg) })
+
+        for vspec in self.vspecs + ['mpi@3.0', 'mpi@1.4.1', 'mpi@:2.1']:
+            self.assertEqual(index.providers_for(vspec),
+                             self.scan_providers(index, vspec))
+
+        self.assertEqual([s.name for s in index.providers_for('mpi@3.0')],
+                         ['mpich2', 'zmpi'])
+        self.assertEqual([s.name for s in index.providers_for('mpi@:1.2')],
+                         ['mpich'])
+
+
+    def test_to_dict_round_trip(self):
+        data = json.loads(json.dumps(self.index.to_dict()))
+        copy = ProviderIndex.from_dict(data)
+        self.assertTrue('mpi' in copy)
+        self.assertEqual(copy.to_dict(), self.index.to_dict())
+        for vspec in self.vspecs:
+            self.assertEqual(copy.providers_for(vspec),
+                             self.index.providers_for(vspec))
+
+
+    def test_remove_provider(self):
+        copy = ProviderIndex.from_dict(self.index.to_dict())
+        copy.remove_provider('zmpi')
+        self.assertEqual([s.name for s in copy.providers_for('mpi@10')], [])
+        self.assertEqual(copy.providers_for('mpi@1'),
+                         [s for s in self.index.providers_for('mpi@1')
+                          if s.name != 'zmpi'])
+
+        for name in ('mpich', 'mpich2'):
+            copy.remove_provider(name)
+        self.assertFalse('mpi' in copy)
+
+
+    def test_update_after_lookup(self):
+        index = ProviderIndex(['mpich'])
+        self.assertEqual([s.name for s in index.providers_for('mpi@2')],
+                         ['mpich'])
+        index.update(Spec('zmpi'))
+        self.assertEqual([s.name for s in index.providers_for('mpi@2')],
+                         ['mpich', 'zmpi'])
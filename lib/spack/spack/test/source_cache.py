@@ -0,0 +1,195 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the shared source cache in spack.source_cache.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from contextlib import closing
+
+from llnl.util.filesystem import join_path
+
+import spack
+import spack.source_cache as source_cache
+from spack.stage import Stage
+from spack.fetch_strategy import URLFetchStrategy
+from spack.test.http_fetch import make_tarball
+from spack.test.mock_http_server import MockHTTPServer
+
+
+def md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class SourceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.real_source_cache_path = spack.source_cache_path
+        self.real_use_source_cache = spack.use_source_cache
+        spack.source_cache_path = tempfile.mkdtemp()
+        spack.use_source_cache = True
+
+        self.tmpdir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(spack.source_cache_path, ignore_errors=True)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        spack.source_cache_path = self.real_source_cache_path
+        spack.use_source_cache = self.real_use_source_cache
+
+
+    def make_archive(self, name, data):
+        path = join_path(self.tmpdir, name)
+        with closing(open(path, 'wb')) as f:
+            f.write(data)
+        return path
+
+
+    def read(self, path):
+        with closing(open(path, 'rb')) as f:
+            return f.read()
+
+
+    def test_parse_size(self):
+        self.assertEqual(source_cache.parse_size('100'), 100)
+        self.assertEqual(source_cache.parse_size('2k'), 2048)
+        self.assertEqual(source_cache.parse_size('3M'), 3 * 2**20)
+        self.assertEqual(source_cache.parse_size(' 10 GB '), 10 * 2**30)
+        self.assertRaises(source_cache.SourceCacheError,
+                          source_cache.parse_size, 'lots')
+
+
+    def test_entry_path(self):
+        digest = md5('foo')
+        self.assertEqual(
+            source_cache.entry_path(digest),
+            join_path(spack.source_cache_path, 'md5', digest[:2], digest))
+
+        spack.use_source_cache = False
+        self.assertEqual(source_cache.entry_path(digest), None)
+
+
+    def test_add_and_fetch(self):
+        digest = md5('foo')
+        source_cache.add(digest, self.make_archive('foo.tar.gz', 'foo'))
+
+        path = source_cache.entry_path(digest)
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(os.stat(path).st_mode & 0777, 0444)
+
+        dest = join_path(self.tmpdir, 'fetched.tar.gz')
+        self.assertTrue(source_cache.fetch(digest, dest))
+        self.assertEqual(self.read(dest), 'foo')
+
+        self.assertFalse(source_cache.fetch(md5('bar'), dest))
+
+
+    def test_cache_is_shared(self):
+        digest = md5('foo')
+        archive = self.make_archive('foo.tar.gz', 'foo')
+        os.chmod(archive, 0644)
+
+        old_umask = os.umask(022)
+        try:
+            source_cache.add(digest, archive)
+            source_cache.evict(source_cache.cache_size())
+        finally:
+            os.umask(old_umask)
+
+        # The stage's archive is left alone.
+        self.assertEqual(os.stat(archive).st_mode & 0777, 0644)
+
+        # Other users can add and evict archives.
+        shard = os.path.dirname(source_cache.entry_path(digest))
+        for d in (shard, os.path.dirname(shard)):
+            self.assertEqual(os.stat(d).st_mode & 0777, 0777)
+        lock_path = join_path(spack.source_cache_path, '.lock')
+        self.assertEqual(os.stat(lock_path).st_mode & 0777, 0666)
+
+
+    def test_corrupt_entry_is_removed(self):
+        digest = md5('foo')
+        source_cache.add(digest, self.make_archive('foo.tar.gz', 'foo'))
+
+        path = source_cache.entry_path(digest)
+        os.chmod(path, 0644)
+        with closing(open(path, 'wb')) as f:
+            f.write('not foo')
+
+        dest = join_path(self.tmpdir, 'fetched.tar.gz')
+        self.assertFalse(source_cache.fetch(digest, dest))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(dest))
+
+
+    def test_evict_least_recently_used(self):
+        digests = []
+        for i, data in enumerate(('a' * 100, 'b' * 100, 'c' * 100)):
+            digest = md5(data)
+            source_cache.add(digest, self.make_archive('%d.tar.gz' % i, data))
+            os.utime(source_cache.entry_path(digest), (1000 + i, 1000 + i))
+            digests.append(digest)
+
+        # Using the oldest archive makes it the newest.
+        dest = join_path(self.tmpdir, 'fetched.tar.gz')
+        self.assertTrue(source_cache.fetch(digests[0], dest))
+
+        source_cache.evict(200)
+        exists = [os.path.exists(source_cache.entry_path(d)) for d in digests]
+        self.assertEqual(exists, [True, False, True])
+
+        source_cache.clear()
+        self.assertEqual(source_cache.entries(), [])
+
+
+    def test_stages_share_downloads(self):
+        tarball = make_tarball()
+        digest = md5(tarball)
+
+        server = MockHTTPServer()
+        server.add_file('/foo-1.0.tar.gz', tarball)
+        server.start()
+        try:
+            for i in range(2):
+                fetcher = URLFetchStrategy(
+                    server.url('/foo-1.0.tar.gz'), digest)
+                stage = Stage(fetcher, name='spack-source-cache-test')
+                try:
+                    stage.fetch()
+                    stage.check()
+                    stage.expand_archive()
+                    self.assertTrue(os.path.isfile(
+                        join_path(stage.source_path, 'configure')))
+                finally:
+                    stage.destroy()
+        finally:
+            server.stop()
+
+        self.assertEqual(server.requests['/foo-1.0.tar.gz'], 1)
+        self.assertTrue(os.path.isfile(source_cache.entry_path(digest)))
@@ -28,6 +28,8 @@ You can find the dummy packages here::
 
     spack/lib/spack/spack/test/mock_packages
 """
+import sys
+
 import spack
 import spack.package
 
@@ -445,3 +447,94 @@ class SpecDagTest(MockPackagesTest):
         orig_ids = set(id(s) for s in orig.traverse())
         copy_ids = set(id(s) for s in copy.traverse())
         self.assertFalse(orig_ids.intersection(copy_ids))
+
+
+    def test_dep_hash_is_cached(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        full_hash = spec.dep_hash()
+        self.assertEqual(spec._hash, full_hash)
+        self.assertEqual(spec.dep_hash(8), full_hash[:8])
+
+        # Copies of a concrete DAG keep the cached hash.
+        self.assertEqual(spec.copy()._hash, full_hash)
+        self.assertEqual(spec.copy(deps=False)._hash, None)
+
+
+    def test_dep_hash_not_cached_for_abstract_specs(self):
+        spec = Spec('mpileaks')
+        spec.normalize()
+        spec.dep_hash()
+        self.assertEqual(spec._hash, None)
+
+
+    def test_dep_hash_invalidated_by_changes(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        old_hash = spec.dep_hash()
+        old_callpath_hash = spec['callpath'].dep_hash()
+
+        # Changing a deep dependency invalidates all of its dependents.
+        spec['libelf']._add_variant('debug', True)
+        self.assertEqual(spec._hash, None)
+        self.assertEqual(spec['callpath']._hash, None)
+
+        self.assertNotEqual(spec.dep_hash(), old_hash)
+        self.assertNotEqual(spec['callpath'].dep_hash(), old_callpath_hash)
+
+
+    def test_cmp_key_is_cached(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        key = spec._cmp_key()
+        self.assertTrue(spec._cmp_key() is key)
+        self.assertEqual(spec._cmp_hash, None)
+        self.assertEqual(hash(spec), hash(key))
+        self.assertEqual(spec._cmp_hash, hash(key))
+
+        # Copies compare and hash equal, but build their own keys.
+        copy = spec.copy()
+        self.assertEqual(copy._cmp_key_cache, None)
+        self.assertEqual(copy, spec)
+        self.assertEqual(hash(copy), hash(spec))
+
+        # Changing a dependency invalidates the cached keys.
+        spec['libelf']._add_variant('debug', True)
+        self.assertEqual(spec._cmp_key_cache, None)
+        self.assertEqual(spec._cmp_hash, None)
+        self.assertNotEqual(copy, spec)
+
+
+    def test_specs_are_compact(self):
+        spec = Spec('mpileaks%gcc=bgqos_0 ^mpich')
+        self.assertFalse(hasattr(spec, '__dict__'))
+        self.assertFalse(hasattr(spec.compiler, '__dict__'))
+
+        # Names are interned so that identical specs share strings.
+        other = Spec('mpileaks%gcc=bgqos_0 ^mpich')
+        self.assertTrue(spec.name is other.name)
+        self.assertTrue(spec.compiler.name is other.compiler.name)
+        self.assertTrue(spec.architecture is other.architecture)
+
+
+    def test_traverse_deep_dag(self):
+        # Far deeper than the recursion limit would allow for a
+        # recursive traversal.
+        n = 2 * sys.getrecursionlimit()
+        specs = [Spec('pkg%d' % i) for i in range(n)]
+        for parent, child in zip(specs, specs[1:]):
+            parent.dependencies[child.name] = child
+            child.dependents[parent.name] = parent
+
+        root, leaf = specs[0], specs[-1]
+        self.assertEqual([s.name for s in root.traverse()],
+                         [s.name for s in specs])
+        self.assertEqual([d for d, s in root.traverse(order='post', depth=True)],
+                         list(reversed(range(n))))
+        self.assertEqual([s.name for s in leaf.traverse(direction='parents')],
+                         [s.name for s in reversed(specs)])
+        self.assertEqual(len(list(root.traverse(root=False, cover='edges'))),
+                         n - 1)
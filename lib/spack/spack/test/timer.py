@@ -0,0 +1,78 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Tests for the PhaseTimer used to record install phase times.
+"""
+import os
+import time
+import tempfile
+import unittest
+
+from spack.util.timer import PhaseTimer
+
+
+class PhaseTimerTest(unittest.TestCase):
+
+    def test_nested_phases(self):
+        timer = PhaseTimer()
+        with timer.phase('install'):
+            time.sleep(0.02)
+            with timer.phase('make'):
+                time.sleep(0.05)
+
+        # Nested time is charged only to the innermost phase.
+        self.assertTrue(timer.wall('make') >= 0.05)
+        self.assertTrue(0.02 <= timer.wall('install') < 0.05)
+        self.assertAlmostEqual(
+            timer.total_wall, timer.wall('install') + timer.wall('make'))
+
+
+    def test_phases_accumulate(self):
+        timer = PhaseTimer()
+        for i in range(3):
+            with timer.phase('make'):
+                time.sleep(0.01)
+        self.assertTrue(timer.wall('make') >= 0.03)
+        self.assertEqual(timer.phases.keys(), ['make'])
+
+
+    def test_write_and_read(self):
+        timer = PhaseTimer()
+        with timer.phase('fetch'):
+            pass
+        with timer.phase('install'):
+            pass
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            timer.write(path)
+            read = PhaseTimer.read(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(sorted(read.phases.keys()), ['fetch', 'install'])
+        self.assertAlmostEqual(read.total_wall, timer.total_wall)
+        self.assertAlmostEqual(read.total_cpu, timer.total_cpu)
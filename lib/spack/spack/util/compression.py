@@ -24,6 +24,9 @@
 ##############################################################################
 import re
 import os
+import errno
+import shutil
+import subprocess
 from itertools import product
 from spack.util.executable import which
 
@@ -49,6 +52,88 @@ def decompressor_for(path):
     return tar
 
 
+# tar flags for reading each kind of archive that can be expanded as it
+# is downloaded.  tar can't detect compression on a pipe.
+_stream_flags = { 'tar.gz'  : 'z',
+                  'tgz'     : 'z',
+                  'tar.bz2' : 'j',
+                  'tar.xz'  : 'J',
+                  'tar.Z'   : 'Z' }
+
+
+def can_stream(path):
+    """True if an archive like path can be expanded by a StreamExpander."""
+    return extension(path) in _stream_flags
+
+
+class StreamExpander(object):
+    """Expands a tar archive into a directory as its bytes are written,
+       by piping them to tar.  Use it like this::
+
+           expander = StreamExpander('foo.tar.gz', dest)
+           for chunk in chunks:
+               expander.write(chunk)
+           if expander.finish():
+               ... dest holds the expanded archive ...
+
+       If tar fails, or abort() is called, dest is removed.
+    """
+    def __init__(self, path, dest):
+        self.dest = dest
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        os.mkdir(dest)
+
+        tar = which('tar', required=True)
+        flags = '-x%sf' % _stream_flags[extension(path)]
+        devnull = open(os.devnull, 'w')
+        try:
+            self.process = subprocess.Popen(
+                tar.exe + [flags, '-', '-C', dest],
+                stdin=subprocess.PIPE, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+        self.failed = False
+
+
+    def write(self, data):
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(data)
+        except IOError, e:
+            if e.errno != errno.EPIPE:
+                raise
+            # tar gave up on the archive.
+            self.failed = True
+
+
+    def finish(self):
+        """Wait for tar to finish.  Returns True if it succeeded."""
+        try:
+            self.process.stdin.close()
+        except IOError:
+            self.failed = True
+        if self.process.wait() != 0:
+            self.failed = True
+
+        if self.failed:
+            shutil.rmtree(self.dest, True)
+        return not self.failed
+
+
+    def abort(self):
+        """Stop tar and remove what it expanded."""
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+            self.failed = True
+            self.finish()
+        shutil.rmtree(self.dest, True)
+
+
 def strip_extension(path):
     """Get the part of a path that does not include its compressed
        type extension."""
@@ -102,3 +102,10 @@ class Checker(object):
         self.sum = checksum(
             self.hash_fun, filename, block_size=self.block_size)
         return self.sum == self.hexdigest
+
+
+    def check_sum(self, sum):
+        """Check a checksum computed elsewhere, e.g. while the file was
+           downloaded.  Like check(), stores it in self.sum."""
+        self.sum = sum
+        return self.sum == self.hexdigest
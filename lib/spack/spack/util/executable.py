@@ -38,6 +38,11 @@ class Executable(object):
         self.exe = name.split(' ')
         self.returncode = None
 
+        # If set, time spent running this is charged to a phase of
+        # this PhaseTimer (see spack.util.timer).
+        self.timer = None
+        self.phase = None
+
 
     def add_default_arg(self, arg):
         self.exe.append(arg)
@@ -50,6 +55,13 @@ class Executable(object):
 
     def __call__(self, *args, **kwargs):
         """Run the executable with subprocess.check_output, return output."""
+        if self.timer is not None:
+            with self.timer.phase(self.phase):
+                return self._run(*args, **kwargs)
+        return self._run(*args, **kwargs)
+
+
+    def _run(self, *args, **kwargs):
         return_output = kwargs.get("return_output", False)
         fail_on_error = kwargs.get("fail_on_error", True)
         error         = kwargs.get("error", sys.stderr)
@@ -0,0 +1,554 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+A native HTTP client for downloading files, so that fetching doesn't
+need a new curl process, and a new connection, for every archive.
+
+A ConnectionPool keeps idle connections to each host alive for reuse,
+and bounds the number of requests in flight to each host.  download()
+follows redirects, streams the body to a file, and retries timeouts,
+connection errors, and server errors with exponential backoff.
+
+The body is written to <path>.part until it is complete.  A partial
+file left by a failed attempt, or by an earlier spack process, is
+resumed with a Range request if the server supports it.  The URL and the
+ETag or Last-Modified header of the response it came from are kept in
+<path>.part.json.  A partial file is only resumed from the same URL, and
+If-Range makes sure the rest comes from the same version of the file;
+otherwise the whole file is downloaded again.
+
+HTTPS certificates are checked unless ``verify_ssl`` is False.  Python
+versions older than 2.7.9 can't check certificates, so there
+supports() is False for https URLs unless verification is off, and
+callers should use curl instead.
+
+This client doesn't talk to proxies.  supports() is also False for URLs
+that the ``http_proxy``, ``https_proxy``, and ``no_proxy`` environment
+variables say to fetch through a proxy, so that curl fetches them.
+"""
+import os
+import re
+import json
+import time
+import socket
+import urllib
+import httplib
+import urlparse
+import threading
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+import llnl.util.tty as tty
+
+import spack.error
+
+# Defaults for ConnectionPool and download().
+default_timeout = 60
+default_retries = 3
+default_backoff = 1.0
+default_max_per_host = 4
+
+# Largest number of redirects download() will follow.
+max_redirects = 10
+
+# Bytes read from a response at a time.
+chunk_size = 64 * 1024
+
+# Suffix of partial downloads, which are resumed by later attempts.
+part_suffix = '.part'
+
+# Status codes that might succeed if the request is retried.
+_retry_statuses = (408, 429, 500, 502, 503, 504)
+_redirect_statuses = (301, 302, 303, 307, 308)
+
+_default_ports = { 'http' : 80, 'https' : 443 }
+
+# Exceptions raised for SSL problems, including bad certificates.
+_ssl_errors = ()
+if ssl is not None:
+    _ssl_errors = (ssl.SSLError,)
+    if hasattr(ssl, 'CertificateError'):
+        _ssl_errors += (ssl.CertificateError,)
+
+
+def can_verify_ssl():
+    """True if this Python can check HTTPS certificates."""
+    return ssl is not None and hasattr(ssl, 'create_default_context')
+
+
+def uses_proxy(url):
+    """True if the environment says to fetch url through a proxy."""
+    parsed = urlparse.urlparse(url)
+    if not parsed.scheme in urllib.getproxies():
+        return False
+    return not urllib.proxy_bypass(parsed.hostname or '')
+
+
+def supports(url, verify_ssl=True):
+    """True if download() can fetch url."""
+    scheme = urlparse.urlparse(url)[0]
+    if uses_proxy(url):
+        return False
+    if scheme == 'https':
+        return ssl is not None and (can_verify_ssl() or not verify_ssl)
+    return scheme == 'http'
+
+
+class Response(object):
+    """A response from ConnectionPool.request().  Call release() when
+       done with it, to give its connection back to the pool.
+    """
+    def __init__(self, pool, key, conn, response, url):
+        self.pool = pool
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self._key = key
+        self._conn = conn
+        self._response = response
+
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+
+    def read(self, size=None):
+        if size is None:
+            return self._response.read()
+        return self._response.read(size)
+
+
+    def iter_chunks(self):
+        """Iterate over the body in chunks of at most chunk_size bytes.
+           Raises httplib.HTTPException if the connection closes before
+           the whole body arrives."""
+        received = 0
+        while True:
+            chunk = self._response.read(chunk_size)
+            if not chunk:
+                break
+            received += len(chunk)
+            yield chunk
+
+        # httplib only notices a short body when reading all of it.
+        if self._response.length:
+            raise httplib.HTTPException(
+                "Connection closed after %d bytes; %d more were expected."
+                % (received, self._response.length))
+
+
+    def release(self):
+        """Give the connection back to the pool.  It is only reused if
+           the whole body was read and the server will keep it open."""
+        if self._conn is None:
+            return
+        reusable = self._response.isclosed() and self._conn.sock is not None
+        self.pool._release(self._key, self._conn, reusable)
+        self._conn = None
+
+
+class ConnectionPool(object):
+    """Keeps idle HTTP connections open for reuse, per host.
+
+       Options:
+       max_per_host[=4]
+           Number of requests to a host that may be in flight at once.
+           Other callers wait for one to be released.
+       timeout[=60]
+           Seconds to wait to connect or for data.
+       verify_ssl[=True]
+           Whether to check HTTPS certificates.
+
+       A pool is shared by the threads of a process.  A forked child
+       doesn't use connections opened by its parent.
+    """
+    def __init__(self, **kwargs):
+        self.max_per_host = kwargs.get('max_per_host', default_max_per_host)
+        self.timeout = kwargs.get('timeout', default_timeout)
+        self.verify_ssl = kwargs.get('verify_ssl', True)
+
+        # Number of new connections made; reused connections aren't counted.
+        self.connections_made = 0
+
+        self._lock = threading.Lock()
+        self._reset()
+
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = {}    # (scheme, host, port) -> idle connections
+        self._slots = {}   # (scheme, host, port) -> BoundedSemaphore
+
+
+    def _check_pid(self):
+        """Forget connections inherited from a parent process."""
+        if self._pid != os.getpid():
+            self._reset()
+
+
+    def _slot(self, key):
+        self._lock.acquire()
+        try:
+            self._check_pid()
+            if not key in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[key]
+        finally:
+            self._lock.release()
+
+
+    def _idle_connection(self, key):
+        self._lock.acquire()
+        try:
+            self._check_pid()
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+            return None
+        finally:
+            self._lock.release()
+
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            kwargs = {}
+            if can_verify_ssl():
+                context = ssl.create_default_context()
+                if not self.verify_ssl:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                kwargs['context'] = context
+            elif self.verify_ssl:
+                raise HTTPError(
+                    "Cannot check SSL certificates with this Python.")
+            conn = httplib.HTTPSConnection(
+                host, port, timeout=self.timeout, **kwargs)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+        self._lock.acquire()
+        self.connections_made += 1
+        self._lock.release()
+        return conn
+
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            self._lock.acquire()
+            try:
+                if self._pid == os.getpid():
+                    self._idle.setdefault(key, []).append(conn)
+                    conn = None
+            finally:
+                self._lock.release()
+        if conn is not None:
+            conn.close()
+        self._slot(key).release()
+
+
+    def _send(self, conn, method, path, headers):
+        conn.request(method, path, headers=headers)
+        return conn.getresponse()
+
+
+    def request(self, method, url, headers=None):
+        """Send a request and return a Response once its headers have
+           arrived.  Raises socket.error or httplib.HTTPException if
+           the request fails."""
+        parsed = urlparse.urlparse(url)
+        scheme = parsed.scheme
+        if not scheme in _default_ports:
+            raise HTTPError("Unsupported URL: %s" % url)
+
+        key = (scheme, parsed.hostname, parsed.port or _default_ports[scheme])
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        all_headers = { 'User-Agent' : 'Spack' }
+        if headers:
+            all_headers.update(headers)
+
+        self._slot(key).acquire()
+        conn = None
+        try:
+            conn = self._idle_connection(key)
+            if conn is not None:
+                try:
+                    response = self._send(conn, method, path, all_headers)
+                    return Response(self, key, conn, response, url)
+                except (socket.error, httplib.HTTPException):
+                    # The server probably closed the idle connection.
+                    conn.close()
+
+            conn = self._connect(key)
+            response = self._send(conn, method, path, all_headers)
+            return Response(self, key, conn, response, url)
+
+        except:
+            if conn is not None:
+                conn.close()
+            self._slot(key).release()
+            raise
+
+
+_pools = {}
+
+def pool(verify_ssl=True):
+    """The shared ConnectionPool for this process."""
+    if not verify_ssl in _pools:
+        _pools[verify_ssl] = ConnectionPool(verify_ssl=verify_ssl)
+    return _pools[verify_ssl]
+
+
+def head(url, **kwargs):
+    """Send a HEAD request for url, following redirects, and return
+       the final Response, which has already been released.  This
+       checks that a file exists without downloading it, and leaves a
+       connection open for a download() that follows.
+
+       Options:
+       pool
+           ConnectionPool to use.  Default is the shared pool.
+       verify_ssl[=True]
+           Whether the shared pool should check HTTPS certificates.
+
+       Raises HTTPError if the request fails.  It is not retried.
+    """
+    conn_pool = kwargs.get('pool', None)
+    if conn_pool is None:
+        conn_pool = pool(kwargs.get('verify_ssl', True))
+
+    response = _request(conn_pool, 'HEAD', url)
+    response.read()
+    response.release()
+    return response
+
+
+def _retry_delay(backoff, attempt):
+    return backoff * (2 ** attempt)
+
+
+def download(url, path, **kwargs):
+    """Download url to the file at path, and return the final Response,
+       which has already been released.
+
+       Options:
+       pool
+           ConnectionPool to use.  Default is the shared pool.
+       verify_ssl[=True]
+           Whether the shared pool should check HTTPS certificates.
+       retries[=3]
+           Number of times to retry a request after a timeout,
+           connection error, or server error.
+       backoff[=1.0]
+           Seconds to wait before the first retry.  The wait doubles
+           after each retry.
+       stream
+           Function called at the start of each attempt.  It returns a
+           function that is passed each chunk of the file as it is
+           written, e.g. to hash it.  When a partial file is resumed,
+           its contents are passed first.
+
+       Raises HTTPError if the download fails.  Errors like 404 are not
+       retried.  If the download fails, path is not created, but what
+       was downloaded is kept in <path>.part to be resumed later.
+       Callers should check the finished file against a checksum.
+    """
+    conn_pool = kwargs.get('pool', None)
+    if conn_pool is None:
+        conn_pool = pool(kwargs.get('verify_ssl', True))
+    retries = kwargs.get('retries', default_retries)
+    backoff = kwargs.get('backoff', default_backoff)
+    stream  = kwargs.get('stream', None)
+
+    attempt = 0
+    while True:
+        try:
+            return _download_once(conn_pool, url, path, stream)
+        except HTTPError, e:
+            if not e.retryable or attempt >= retries:
+                raise
+            delay = _retry_delay(backoff, attempt)
+            tty.msg(e.message, "Retrying in %g seconds." % delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def _download_once(conn_pool, url, path, stream):
+    part_path = path + part_suffix
+    info_path = part_path + '.json'
+
+    headers = {}
+    offset = 0
+    if os.path.isfile(part_path):
+        offset = os.path.getsize(part_path)
+    if offset:
+        validator = _read_validator(info_path, url)
+        if validator:
+            headers['Range'] = 'bytes=%d-' % offset
+            headers['If-Range'] = validator
+        else:
+            # Without a validator we can't tell whether the partial file
+            # is the start of this file, so start again.
+            _remove(part_path, info_path)
+            offset = 0
+
+    try:
+        response = _request(conn_pool, 'GET', url, headers)
+    except HTTPError, e:
+        if e.status == 416:
+            # The partial file is no good; start again.
+            _remove(part_path, info_path)
+            e.retryable = True
+        raise
+
+    try:
+        if response.status == 206:
+            start = _range_start(response.getheader('content-range'))
+            if start != offset:
+                _remove(part_path, info_path)
+                raise HTTPError("%s sent the wrong range." % url,
+                                retryable=True)
+            tty.msg("Resuming download of %s at %d bytes." % (url, offset))
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+            _write_validator(info_path, url, response)
+
+        consume = stream() if stream else None
+        if consume and offset:
+            with open(part_path, 'rb') as part:
+                for chunk in iter(lambda: part.read(chunk_size), ''):
+                    consume(chunk)
+
+        with open(part_path, mode) as out:
+            for chunk in response.iter_chunks():
+                out.write(chunk)
+                if consume:
+                    consume(chunk)
+
+    except (socket.error, httplib.HTTPException), e:
+        raise HTTPError("Download of %s failed: %s" % (url, e),
+                        retryable=True)
+    finally:
+        response.release()
+
+    os.rename(part_path, path)
+    _remove(info_path)
+    return response
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _range_start(content_range):
+    """The first byte in a Content-Range header like 'bytes 10-99/100'."""
+    match = re.match(r'bytes\s+(\d+)-', content_range or '')
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def _read_validator(info_path, url):
+    """The ETag or Last-Modified header of the response a partial
+       download came from, to make sure a resumed download gets the
+       rest of the same file.  None if there is none, or if the partial
+       download came from a different URL."""
+    try:
+        with open(info_path) as f:
+            info = json.load(f)
+        if info.get('url') == url:
+            return info.get('validator')
+    except (IOError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def _write_validator(info_path, url, response):
+    etag = response.getheader('etag')
+    if etag and etag.startswith('W/'):
+        # Weak ETags can't be used for ranges.
+        etag = None
+    validator = etag or response.getheader('last-modified')
+    if validator:
+        with open(info_path, 'w') as f:
+            json.dump({ 'url' : url, 'validator' : validator }, f)
+    else:
+        _remove(info_path)
+
+
+def _request(conn_pool, method, url, headers=None):
+    """Request url, following redirects, and return a successful
+       Response."""
+    for i in range(max_redirects + 1):
+        try:
+            response = conn_pool.request(method, url, headers)
+        except _ssl_errors, e:
+            bad_certificate = (not isinstance(e, ssl.SSLError) or
+                               'certificate' in str(e).lower())
+            raise HTTPError("SSL error fetching %s: %s" % (url, e),
+                            ssl_error=bad_certificate,
+                            retryable=not bad_certificate)
+        except (socket.error, httplib.HTTPException), e:
+            raise HTTPError("Could not fetch %s: %s" % (url, e),
+                            retryable=True)
+
+        if response.status in _redirect_statuses:
+            location = response.getheader('location')
+            response.read()
+            response.release()
+            if not location:
+                raise HTTPError("Redirect from %s has no location." % url)
+            url = urlparse.urljoin(url, location)
+            continue
+
+        if response.status >= 400:
+            response.read()
+            response.release()
+            raise HTTPError("%s returned %d %s."
+                            % (url, response.status, response.reason),
+                            status=response.status,
+                            retryable=response.status in _retry_statuses)
+        return response
+
+    raise HTTPError("Too many redirects fetching %s." % url)
+
+
+class HTTPError(spack.error.SpackError):
+    """Raised when an HTTP request fails."""
+    def __init__(self, message, **kwargs):
+        super(HTTPError, self).__init__(message)
+        self.status = kwargs.get('status', None)
+        self.retryable = kwargs.get('retryable', False)
+        self.ssl_error = kwargs.get('ssl_error', False)
@@ -0,0 +1,122 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Wall and CPU time accounting for the phases of an install.
+
+A PhaseTimer accumulates time spent in named phases.  Phases may be
+nested (e.g. ``make`` runs inside ``install``); time spent in a nested
+phase is charged only to the innermost phase, so the phase times add
+up to the total.  CPU time includes waited-for child processes, so
+time spent in compilers run by make is counted.
+"""
+import os
+import time
+import json
+from contextlib import closing, contextmanager
+
+from external.ordereddict import OrderedDict
+
+
+def _cpu_time():
+    """User + system time of this process and its waited-for children."""
+    t = os.times()
+    return t[0] + t[1] + t[2] + t[3]
+
+
+class PhaseTimer(object):
+    def __init__(self):
+        # phase name -> [wall seconds, cpu seconds], in order first seen.
+        self.phases = OrderedDict()
+
+        # Stack of [wall, cpu] time spent in children of running phases.
+        self._nested = []
+
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that charges the time spent in its body to
+           the named phase."""
+        wall, cpu = time.time(), _cpu_time()
+        self._nested.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            cpu = _cpu_time() - cpu
+            nested = self._nested.pop()
+
+            totals = self.phases.setdefault(name, [0.0, 0.0])
+            totals[0] += wall - nested[0]
+            totals[1] += cpu - nested[1]
+
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+
+
+    def wall(self, name):
+        return self.phases.get(name, (0.0, 0.0))[0]
+
+
+    def cpu(self, name):
+        return self.phases.get(name, (0.0, 0.0))[1]
+
+
+    @property
+    def total_wall(self):
+        return sum(w for w, c in self.phases.values())
+
+
+    @property
+    def total_cpu(self):
+        return sum(c for w, c in self.phases.values())
+
+
+    def clear(self):
+        self.phases.clear()
+
+
+    def write(self, path):
+        """Write phase times out to a file as JSON."""
+        data = OrderedDict()
+        data['phases'] = OrderedDict(
+            (name, {'wall' : w, 'cpu' : c}) for name, (w, c) in self.phases.items())
+        data['total'] = {'wall' : self.total_wall, 'cpu' : self.total_cpu}
+
+        with closing(open(path, 'w')) as f:
+            json.dump(data, f, indent=2)
+            f.write('\n')
+
+
+    @staticmethod
+    def read(path):
+        """Read a PhaseTimer back from a file written by write()."""
+        with closing(open(path)) as f:
+            data = json.load(f)
+
+        timer = PhaseTimer()
+        for name, times in data['phases'].items():
+            timer.phases[str(name)] = [times['wall'], times['cpu']]
+        return timer
@@ -25,6 +25,9 @@
 """
 The ``virtual`` module contains utility classes for virtual dependencies.
 """
+from bisect import bisect_right
+
+import spack
 import spack.spec
 
 class ProviderIndex(object):
@@ -43,6 +46,14 @@ class ProviderIndex(object):
 
        Calling providers_for(spec) will find specs that provide a
        matching implementation of MPI.
+
+       For each vpkg, the provided specs are also kept sorted by the
+       lowest version they provide, so that providers_for() only checks
+       the ones whose versions can overlap the request.
+
+       The index can be converted to and from a dict of strings with
+       to_dict() and from_dict(), so that it can be saved.  Specs read
+       with from_dict() are parsed the first time their vpkg is used.
     """
     def __init__(self, specs, **kwargs):
         # TODO: come up with another name for this.  This "restricts" values to
@@ -52,6 +63,12 @@ class ProviderIndex(object):
 
         self.providers = {}
 
+        # Unparsed entries from from_dict(), by vpkg name.
+        self._unparsed = {}
+
+        # Sorted lookup tables built from self.providers, by vpkg name.
+        self._sorted = {}
+
         for spec in specs:
             if not isinstance(spec, spack.spec.Spec):
                 spec = spack.spec.Spec(spec)
@@ -63,27 +80,110 @@ class ProviderIndex(object):
 
 
     def update(self, spec):
+        """Add the virtual packages that spec provides to the index.
+           Returns the specs of the virtual packages it provides."""
         if type(spec) != spack.spec.Spec:
             spec = spack.spec.Spec(spec)
 
         assert(not spec.virtual)
 
-        pkg = spec.package
-        for provided_spec, provider_spec in pkg.provided.iteritems():
+        pkg_class = spack.db.get_class_for_package_name(spec.name)
+        return self.add_provided(spec, pkg_class.provided)
+
+
+    def add_provided(self, spec, provided):
+        """Add virtual packages provided by spec to the index.  provided
+           is a dict like Package.provided, of {provided spec : provider
+           spec}.  Returns the specs of the virtual packages spec provides.
+        """
+        result = []
+        for provided_spec, provider_spec in provided.iteritems():
             if provider_spec.satisfies(spec, deps=False):
+                result.append(provided_spec)
                 provided_name = provided_spec.name
-                if provided_name not in self.providers:
-                    self.providers[provided_name] = {}
+                provider_map = self._providers_of(provided_name)
+                if provider_map is None:
+                    provider_map = self.providers[provided_name] = {}
+                self._sorted.pop(provided_name, None)
 
                 if self.restrict:
-                    self.providers[provided_name][provided_spec] = spec
+                    provider_map[provided_spec] = spec
 
                 else:
                     # Before putting the spec in the map, constrain it so that
                     # it provides what was asked for.
                     constrained = spec.copy()
                     constrained.constrain(provider_spec)
-                    self.providers[provided_name][provided_spec] = constrained
+                    provider_map[provided_spec] = constrained
+
+        return result
+
+
+    def remove_provider(self, pkg_name):
+        """Remove all the entries for a provider package from the index."""
+        for name in list(self._unparsed) + list(self.providers):
+            provider_map = self._providers_of(name)
+            if provider_map is None:
+                continue
+
+            for provided_spec, spec in provider_map.items():
+                if spec.name == pkg_name:
+                    del provider_map[provided_spec]
+                    self._sorted.pop(name, None)
+
+            if not provider_map:
+                del self.providers[name]
+
+
+    def _providers_of(self, name):
+        """The {provided spec : provider spec} map for a vpkg, or None."""
+        if name in self._unparsed:
+            self.providers[name] = dict(
+                (spack.spec.Spec(provided), spack.spec.Spec(provider))
+                for provided, provider in self._unparsed.pop(name))
+        return self.providers.get(name)
+
+
+    def _parse_all(self):
+        for name in list(self._unparsed):
+            self._providers_of(name)
+
+
+    def _lookup_table(self, name):
+        """Provided specs for a vpkg, split into those with no lower
+           version bound, and those with one, sorted by it.  Returns
+           (unbounded, lowest versions, bounded specs)."""
+        if name not in self._sorted:
+            unbounded = []
+            bounded = []
+            for provided_spec in self._providers_of(name):
+                lowest = provided_spec.versions.lowest()
+                if lowest is None:
+                    unbounded.append(provided_spec)
+                else:
+                    bounded.append((lowest, provided_spec))
+            bounded.sort(key=lambda pair: pair[0])
+            self._sorted[name] = (unbounded,
+                                  [lowest for lowest, s in bounded],
+                                  [s for lowest, s in bounded])
+        return self._sorted[name]
+
+
+    def _candidates(self, vspec):
+        """Provided specs for vspec's vpkg whose versions might satisfy
+           vspec's.  A provided spec can only satisfy vspec if its lowest
+           version is at most vspec's highest one, or has it as a prefix
+           (e.g. 1.2.3 satisfies 1.2)."""
+        unbounded, lowest, bounded = self._lookup_table(vspec.name)
+
+        highest = vspec.versions.highest()
+        if highest is None:
+            return unbounded + bounded
+
+        end = bisect_right(lowest, highest)
+        while end < len(lowest) and lowest[end] in highest:
+            end += 1
+        return unbounded + bounded[:end]
 
 
     def providers_for(self, *vpkg_specs):
@@ -96,24 +196,28 @@ class ProviderIndex(object):
                 vspec = spack.spec.Spec(vspec)
 
             # Add all the providers that satisfy the vpkg spec.
-            if vspec.name in self.providers:
-                for provider_spec, spec in self.providers[vspec.name].items():
+            provider_map = self._providers_of(vspec.name)
+            if provider_map:
+                for provider_spec in self._candidates(vspec):
                     if provider_spec.satisfies(vspec, deps=False):
-                        providers.add(spec)
+                        providers.add(provider_map[provider_spec])
 
         # Return providers in order
         return sorted(providers)
 
 
-    # TODO: this is pretty darned nasty, and inefficient.
     def _cross_provider_maps(self, lmap, rmap):
+        # Only specs provided by the same package can be combined, so
+        # group the right map by provider name first.
+        rspecs_by_name = {}
+        for rspec, provider in rmap.items():
+            rspecs_by_name.setdefault(provider.name, []).append(rspec)
+
         result = {}
         for lspec in lmap:
-            for rspec in rmap:
+            for rspec in rspecs_by_name.get(lmap[lspec].name, []):
                 try:
                     constrained = lspec.copy().constrain(rspec)
-                    if lmap[lspec].name != rmap[rspec].name:
-                        continue
                     result[constrained] = lmap[lspec].copy().constrain(
                         rmap[rspec], deps=False)
                 except spack.spec.UnsatisfiableSpecError:
@@ -123,11 +227,14 @@ class ProviderIndex(object):
 
     def __contains__(self, name):
         """Whether a particular vpkg name is in the index."""
-        return name in self.providers
+        return name in self.providers or name in self._unparsed
 
 
     def satisfies(self, other):
         """Check that providers of virtual specs are compatible."""
+        self._parse_all()
+        other._parse_all()
+
         common = set(self.providers) & set(other.providers)
         if not common:
             return True
@@ -140,3 +247,22 @@ class ProviderIndex(object):
                 result[name] = crossed
 
         return bool(result)
+
+
+    def to_dict(self):
+        """Convert the index to a dict of strings that can be written as
+           JSON, of the form {vpkg name : [[provided spec, provider]]}."""
+        result = dict((name, sorted(list(pair) for pair in pairs))
+                      for name, pairs in self._unparsed.items())
+        for name, provider_map in self.providers.items():
+            result[name] = sorted([str(provided), str(provider)]
+                                  for provided, provider in provider_map.items())
+        return result
+
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        """Make an index from the output of to_dict()."""
+        index = cls([], **kwargs)
+        index._unparsed = dict(data)
+        return index
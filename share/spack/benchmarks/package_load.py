@@ -0,0 +1,99 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Benchmark for loading package classes from source and from a pack.
+
+Run it with:
+
+    spack python share/spack/benchmarks/package_load.py
+
+It makes a synthetic repository and times loading every package in it
+with a fresh PackageDB, the way each spack command does.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import spack
+import spack.packed_repo
+from spack.packages import PackageDB
+from spack.util.naming import mod_to_class
+
+n_packages = 300
+repeat = 5
+
+
+def synthetic_repo():
+    root = tempfile.mkdtemp()
+    for i in range(n_packages):
+        name = 'pkg-%d' % i
+        deps = "".join("    depends_on('pkg-%d')\n" % d
+                       for d in range(i + 1, min(i + 4, n_packages)))
+        os.mkdir(os.path.join(root, name))
+        with open(os.path.join(root, name, 'package.py'), 'w') as f:
+            f.write("from spack import *\n\n"
+                    "class %s(Package):\n"
+                    "    homepage = 'http://www.example.com'\n"
+                    "    url      = 'http://www.example.com/%s-1.0.tar.gz'\n"
+                    "    version('1.0', '0123456789abcdef0123456789abcdef')\n"
+                    "    version('1.1', '0123456789abcdef0123456789abcdef')\n"
+                    "%s\n"
+                    "    def install(self, spec, prefix):\n"
+                    "        configure('--prefix=%%s' %% prefix)\n"
+                    "        make()\n"
+                    "        make('install')\n" % (mod_to_class(name), name, deps))
+    return root
+
+
+def time_load(root, **kwargs):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        db = PackageDB(root, **kwargs)
+        for name in db.all_package_names():
+            db.get_class_for_package_name(name)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    root = synthetic_repo()
+    pack_path = root + '.pack'
+    try:
+        spack.packed_repo.pack(PackageDB(root), pack_path)
+        print "%d packages, best of %d:" % (n_packages, repeat)
+        print "  %-12s %8.3fs" % ('source', time_load(root))
+        print "  %-12s %8.3fs" % ('packed', time_load(root, packed=pack_path))
+    finally:
+        shutil.rmtree(root)
+        if os.path.exists(pack_path):
+            os.remove(pack_path)
+
+
+if __name__ == '__main__':
+    main()
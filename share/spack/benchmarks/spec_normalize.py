@@ -0,0 +1,126 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Benchmark for Spec.normalize() and Spec.concretize().
+
+Run it with:
+
+    spack python share/spack/benchmarks/spec_normalize.py
+
+It times the mock packages used by the tests, and a synthetic package
+repository with a wide DAG.  In that DAG, many packages depend on the
+same few virtual packages, which are provided by packages further down.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import spack
+import spack.config
+from spack.spec import Spec
+from spack.packages import PackageDB
+from spack.util.naming import mod_to_class
+
+# Width of the synthetic DAG: number of packages on each level.
+width  = 40
+levels = 4
+n_virtuals = 5
+
+
+def write_package(root, name, body):
+    os.mkdir(os.path.join(root, name))
+    with open(os.path.join(root, name, 'package.py'), 'w') as f:
+        f.write("from spack import *\n\n"
+                "class %s(Package):\n"
+                "    homepage = 'http://www.example.com'\n"
+                "    url      = 'http://www.example.com/%s-1.0.tar.gz'\n"
+                "    version('1.0', '0123456789abcdef0123456789abcdef')\n"
+                "%s\n"
+                "    def install(self, spec, prefix):\n"
+                "        pass\n" % (mod_to_class(name), name, body))
+
+
+def synthetic_repo():
+    """Make a repository where each level of packages depends on every
+       package on the next level and on all the virtual packages, which
+       are provided by packages at the bottom."""
+    root = tempfile.mkdtemp()
+    names = [['w%d-%d' % (l, i) for i in range(width)] for l in range(levels)]
+
+    virtuals = ['virt%d' % v for v in range(n_virtuals)]
+    for v in virtuals:
+        write_package(root, 'provider' + v[4:], "    provides('%s')\n" % v)
+
+    for l, level in enumerate(names):
+        for name in level:
+            deps = names[l+1] if l + 1 < levels else []
+            body = "".join("    depends_on('%s')\n" % d for d in deps + virtuals)
+            write_package(root, name, body)
+
+    top = "".join("    depends_on('%s')\n" % d for d in names[0])
+    write_package(root, 'wide', top)
+    return root
+
+
+def best_of(fun, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        fun()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def report(label, spec_string):
+    normalize = best_of(lambda: Spec(spec_string).normalize())
+    concretize = best_of(lambda: Spec(spec_string).concretize())
+    print "%-24s %10.4fs %10.4fs" % (label, normalize, concretize)
+
+
+def main():
+    spack.use_concretize_cache = False
+    spack.config._scopes = {
+        'site' : spack.mock_site_config,
+        'user' : spack.mock_user_config }
+    spack.config.get_config(refresh=True)
+
+    print "%-24s %11s %11s" % ("Spec", "normalize", "concretize")
+
+    spack.db = PackageDB(spack.mock_packages_path)
+    for spec in ('mpileaks', 'mpileaks ^zmpi', 'indirect_mpich'):
+        report(spec, spec)
+
+    root = synthetic_repo()
+    try:
+        spack.db = PackageDB(root)
+        report("wide (%dx%d)" % (levels, width), 'wide')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
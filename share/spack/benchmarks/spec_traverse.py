@@ -0,0 +1,137 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Benchmark for Spec.traverse() on large synthetic DAGs.
+
+Run it with:
+
+    spack python share/spack/benchmarks/spec_traverse.py
+
+It compares the iterative traversal against the old recursive generator
+implementation, which is kept here for reference.
+"""
+import sys
+import time
+
+from spack.spec import Spec
+
+
+def recursive_traverse(spec, visited=None, d=0, **kwargs):
+    """The recursive generator that Spec.traverse() used to be."""
+    depth      = kwargs.get('depth', False)
+    yield_root = kwargs.get('root', True)
+    cover      = kwargs.get('cover', 'nodes')
+    direction  = kwargs.get('direction', 'children')
+    order      = kwargs.get('order', 'pre')
+
+    if visited is None:
+        visited = set()
+    key = id(spec)
+
+    if key in visited and cover == 'nodes':
+        return
+
+    yield_me = yield_root or d > 0
+    result = (d, spec) if depth else spec
+
+    if yield_me and order == 'pre':
+        yield result
+
+    if not (key in visited and cover == 'edges'):
+        successors = spec.dependencies
+        if direction == 'parents':
+            successors = spec.dependents
+
+        visited.add(key)
+        for name in sorted(successors):
+            child = successors[name]
+            for elt in recursive_traverse(child, visited, d+1, **kwargs):
+                yield elt
+
+    if yield_me and order == 'post':
+        yield result
+
+
+def link(parent, child):
+    parent.dependencies[child.name] = child
+    child.dependents[parent.name] = parent
+
+
+def chain(n):
+    """A DAG that is a single path of n nodes."""
+    specs = [Spec('chain%d' % i) for i in range(n)]
+    for parent, child in zip(specs, specs[1:]):
+        link(parent, child)
+    return specs[0]
+
+
+def lattice(levels, width):
+    """levels rows of width nodes, each depending on every node in the
+       row below it."""
+    rows = [[Spec('lattice%d_%d' % (l, w)) for w in range(width)]
+            for l in range(levels)]
+    root = Spec('lattice')
+    for spec in rows[0]:
+        link(root, spec)
+    for upper, lower in zip(rows, rows[1:]):
+        for parent in upper:
+            for child in lower:
+                link(parent, child)
+    return root
+
+
+def best_of(fun, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        fun()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def compare(label, root, **kwargs):
+    new = best_of(lambda: list(root.traverse(**kwargs)))
+    old = best_of(lambda: list(recursive_traverse(root, **kwargs)))
+    print "%-28s %10.4fs %10.4fs %8.1fx" % (label, old, new, old / new)
+
+
+def main():
+    print "%-28s %11s %11s %9s" % ("DAG", "recursive", "iterative", "speedup")
+
+    # Recursive generators need a frame per level of the DAG.
+    sys.setrecursionlimit(10000)
+
+    for n in (100, 500, 2000):
+        root = chain(n)
+        compare("chain(%d)" % n, root)
+        compare("chain(%d), post, depth" % n, root, order='post', depth=True)
+
+    root = lattice(20, 10)
+    compare("lattice(20x10)", root)
+    compare("lattice(20x10), edges", root, cover='edges')
+
+
+if __name__ == '__main__':
+    main()